@@ -43,20 +43,34 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bookings.tracing.TracingMiddleware',
+    'bookings.metrics.MetricsMiddleware',
+    'bookings.admission.AdmissionControlMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bookings.profiling.ProfilingMiddleware',
+    'bookings.memory.MemoryProfilingMiddleware',
+    'bookings.db_router.ReadYourWritesMiddleware',
+    'bookings.slow_queries.SlowQueryViewMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'bookings.tracing.TracingViewMiddleware',
 ]
 
 ROOT_URLCONF = 'airline.urls'
 
+# Wrap every template render in a tracing span (see Request tracing below)
+TRACE_TEMPLATES = os.environ.get('TRACE_TEMPLATES', 'False').lower() == 'true'
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': (
+            'bookings.tracing.TracedDjangoTemplates' if TRACE_TEMPLATES
+            else 'django.template.backends.django.DjangoTemplates'
+        ),
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -70,6 +84,16 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'airline.wsgi.application'
+ASGI_APPLICATION = 'airline.asgi.application'
+
+# Route flight search, seat maps, autocomplete and flight API reads to the
+# async views in bookings.async_views. Enable when serving under ASGI.
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', 'False').lower() == 'true'
+
+# Broker behind the live seat availability stream. The local broker only
+# reaches watchers in the same process; use the Postgres LISTEN/NOTIFY broker
+# when running more than one server process or node.
+SEAT_EVENTS_BROKER = os.environ.get('SEAT_EVENTS_BROKER', 'bookings.seat_events.LocalSeatEventBroker')
 
 
 # Database
@@ -86,6 +110,98 @@ DATABASES = {
     }
 }
 
+# Workload classes, so a runaway report is cancelled instead of holding up
+# bookings. 'transactional' is the default alias; its timeouts are SET LOCAL
+# by the booking and payment transactions only (bookings.db_router.bound_transaction),
+# so migrations and management commands on default run unbounded. The others
+# are extra read-only aliases on the same database with the timeouts on the
+# connection, used for reads by views decorated with bookings.db_router.workload(...).
+DB_WORKLOADS = {
+    'transactional': {
+        'alias': 'default',
+        'statement_timeout_ms': int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', '15000')),
+        'lock_timeout_ms': int(os.environ.get('DB_LOCK_TIMEOUT_MS', '3000')),
+        'isolation': 'read committed',
+    },
+    'analytics': {
+        'alias': 'analytics',
+        'statement_timeout_ms': int(os.environ.get('DB_ANALYTICS_STATEMENT_TIMEOUT_MS', '10000')),
+        'lock_timeout_ms': 1000,
+        'isolation': 'repeatable read',
+        'read_only': True,
+    },
+    'batch': {
+        'alias': 'batch',
+        'statement_timeout_ms': int(os.environ.get('DB_BATCH_STATEMENT_TIMEOUT_MS', '300000')),
+        'lock_timeout_ms': 5000,
+        'isolation': 'read committed',
+        'read_only': True,
+    },
+}
+
+
+def _pg_options(workload, timeouts=True):
+    # libpq startup options: applied when the connection opens, no extra round trip
+    options = ['-c default_transaction_isolation=' + workload['isolation'].replace(' ', '\\ ')]
+    if timeouts:
+        options += [
+            f"-c statement_timeout={workload['statement_timeout_ms']}",
+            f"-c lock_timeout={workload['lock_timeout_ms']}",
+        ]
+    if workload.get('read_only'):
+        options.append('-c default_transaction_read_only=on')
+    return ' '.join(options)
+
+
+DATABASES['default']['OPTIONS'] = {'options': _pg_options(DB_WORKLOADS['transactional'], timeouts=False)}
+
+# Read replicas: comma-separated host[:port][/name] entries, added as
+# replica1, replica2, ... Only REPLICA_READ_VIEWS read from them; services and
+# anything inside a transaction always use the primary.
+REPLICA_DATABASES = []
+for _index, _replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    _address, _, _name = _replica.strip().partition('/')
+    _host, _, _port = _address.partition(':')
+    DATABASES[f'replica{_index}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        'NAME': _name or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(f'replica{_index}')
+
+for _workload in DB_WORKLOADS.values():
+    if _workload['alias'] != 'default':
+        DATABASES[_workload['alias']] = {
+            **DATABASES['default'],
+            'OPTIONS': {'options': _pg_options(_workload)},
+            'TEST': {'MIRROR': 'default'},
+        }
+
+DATABASE_ROUTERS = ['bookings.db_router.PrimaryReplicaRouter']
+
+# Seconds a session keeps reading from the primary after it writes
+READ_YOUR_WRITES_SECONDS = int(os.environ.get('READ_YOUR_WRITES_SECONDS', '10'))
+# Replicas further behind than this are skipped until they catch up
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', '5'))
+REPLICA_LAG_CHECK_SECONDS = 5
+
+# URL names whose GET requests may be served from a replica
+REPLICA_READ_VIEWS = {
+    'flight-list-gui',
+    'flight-seats-gui',
+    'city-suggestions',
+    'flight-list-create',
+    'flight-detail',
+    'booking-list-gui',
+    'monitoring-dashboard',
+    'monitoring-flights',
+    'monitoring-bookings',
+    'monitoring-tables',
+    'monitoring-dashboard-new',
+}
+
 # Uncomment below for SQLite (development only)
 # DATABASES = {
 #     'default': {
@@ -131,6 +247,188 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Metrics served at /metrics in Prometheus text format. With several worker
+# processes, point METRICS_DIR at a directory they share (and empty it on deploy).
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_SECONDS = 1
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Queries slower than this are kept in an in-memory ring buffer (shown at
+# /monitoring/slow-queries/) and written to logs/slow_queries.log. 0 disables.
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_BUFFER_SIZE = 500
+
+# Row-lock waits in booking services at or above this many ms are written to
+# logs/contention.ndjson for the contention_report command
+LOCK_WAIT_LOG_MS = float(os.environ.get('LOCK_WAIT_LOG_MS', '50'))
+
+# Booking services retry deadlocks and serialization failures up to
+# DB_RETRY_ATTEMPTS times, backing off exponentially from DB_RETRY_BASE_MS.
+# BOOKING_SERIALIZABLE runs their transactions at SERIALIZABLE (PostgreSQL).
+DB_RETRY_ATTEMPTS = int(os.environ.get('DB_RETRY_ATTEMPTS', '4'))
+DB_RETRY_BASE_MS = 20
+DB_RETRY_MAX_MS = 500
+BOOKING_SERIALIZABLE = os.environ.get('BOOKING_SERIALIZABLE', 'False').lower() == 'true'
+
+# Send seat claims for the same flight through one in-process queue per flight,
+# applying up to BOOKING_COALESCE_MAX_BATCH of them per transaction
+BOOKING_COALESCE = os.environ.get('BOOKING_COALESCE', 'False').lower() == 'true'
+BOOKING_COALESCE_MAX_BATCH = int(os.environ.get('BOOKING_COALESCE_MAX_BATCH', '100'))
+BOOKING_COALESCE_TIMEOUT_SECONDS = 10
+BOOKING_COALESCE_IDLE_SECONDS = 5
+
+# Admission control: per-process concurrent request limits per endpoint class
+# (booking, payment, search, monitoring, export, default). A request over its
+# limit queues for up to its ADMISSION_QUEUE_MS, then gets 503 with Retry-After.
+# ADMISSION_RESERVED_SLOTS of ADMISSION_TOTAL_LIMIT are kept for bookings and
+# payments; monitoring and exports are shed while booking/payment latency is
+# over ADMISSION_LATENCY_TARGET_MS.
+# Opt-in: size the limits to your worker threads and database before enabling
+ADMISSION_CONTROL = os.environ.get('ADMISSION_CONTROL', 'False').lower() == 'true'
+ADMISSION_LIMITS = {
+    name.strip(): int(limit)
+    for name, _, limit in (
+        item.partition('=') for item in os.environ.get(
+            'ADMISSION_LIMITS', 'booking=24,payment=16,search=32,monitoring=4,export=2,default=16'
+        ).split(',') if item.strip()
+    )
+}
+ADMISSION_QUEUE_MS = {
+    name.strip(): int(wait)
+    for name, _, wait in (
+        item.partition('=') for item in os.environ.get(
+            'ADMISSION_QUEUE_MS', 'booking=2000,payment=2000,search=250,monitoring=0,export=0,default=500'
+        ).split(',') if item.strip()
+    )
+}
+ADMISSION_TOTAL_LIMIT = int(os.environ.get('ADMISSION_TOTAL_LIMIT', '48'))
+ADMISSION_RESERVED_SLOTS = int(os.environ.get('ADMISSION_RESERVED_SLOTS', '8'))
+ADMISSION_LATENCY_TARGET_MS = float(os.environ.get('ADMISSION_LATENCY_TARGET_MS', '1000'))
+ADMISSION_RETRY_AFTER_SECONDS = 2
+
+# Connecting-flight search runs on an in-memory route graph per process. It is
+# refreshed from recently updated flights every ROUTE_GRAPH_REFRESH_SECONDS and
+# rebuilt from scratch every ROUTE_GRAPH_REBUILD_SECONDS. Connections need at
+# least CONNECTION_MIN_MINUTES at the hub (the _INTERNATIONAL value when either
+# leg crosses a border) and at most CONNECTION_MAX_HOURS.
+ROUTE_GRAPH_REFRESH_SECONDS = int(os.environ.get('ROUTE_GRAPH_REFRESH_SECONDS', '30'))
+ROUTE_GRAPH_REBUILD_SECONDS = int(os.environ.get('ROUTE_GRAPH_REBUILD_SECONDS', '600'))
+CONNECTION_MIN_MINUTES = int(os.environ.get('CONNECTION_MIN_MINUTES', '45'))
+CONNECTION_MIN_MINUTES_INTERNATIONAL = int(os.environ.get('CONNECTION_MIN_MINUTES_INTERNATIONAL', '90'))
+CONNECTION_MAX_HOURS = int(os.environ.get('CONNECTION_MAX_HOURS', '12'))
+CONNECTION_RESULTS_LIMIT = 10
+
+# The fare calendar shows the searched day ± FARE_CALENDAR_DAYS (API callers may
+# ask for up to FARE_CALENDAR_MAX_DAYS). Results are cached per route and dropped
+# when a seat on the route is booked or released, or one of its flights is saved.
+# With several workers, point CACHES at a shared cache so that reaches them all.
+FARE_CALENDAR_DAYS = int(os.environ.get('FARE_CALENDAR_DAYS', '3'))
+FARE_CALENDAR_MAX_DAYS = 15
+FARE_CALENDAR_CACHE_SECONDS = int(os.environ.get('FARE_CALENDAR_CACHE_SECONDS', '300'))
+
+# Flight search pages through results SEARCH_PAGE_SIZE at a time; the price
+# facet splits fares at these edges (plus an open-ended top bucket)
+SEARCH_PAGE_SIZE = 20
+SEARCH_PRICE_BUCKETS = (100, 200, 500, 1000)
+
+# Dynamic pricing (bookings.pricing). Off: every seat costs Flight.price. On:
+# bookings are charged the latest repriced fare. A fare is Flight.price times
+# the class multiplier, times a load factor multiplier (the
+# PRICING_LOAD_MULTIPLIERS range, growing with the square of the class's booked
+# share), times an urgency multiplier (up to 1 + PRICING_URGENCY_WEIGHT,
+# decaying over PRICING_URGENCY_DAYS before departure). The result is kept
+# within PRICING_BOUNDS of the class base fare. Reprice with the
+# bookings.reprice_flights job or the reprice_flights command.
+DYNAMIC_PRICING = os.environ.get('DYNAMIC_PRICING', 'False').lower() == 'true'
+PRICING_CLASS_MULTIPLIERS = {'ECONOMY': 1.0, 'BUSINESS': 2.5, 'FIRST': 4.0}
+PRICING_LOAD_MULTIPLIERS = (0.8, 1.6)
+PRICING_URGENCY_WEIGHT = 0.5
+PRICING_URGENCY_DAYS = 7
+PRICING_BOUNDS = (0.7, 2.5)
+PRICING_CACHE_SECONDS = int(os.environ.get('PRICING_CACHE_SECONDS', '600'))
+
+# Request tracing. A TRACE_SAMPLE_RATE share of requests records spans for
+# middleware, views, services, state transitions, queries and, with
+# TRACE_TEMPLATES, template renders. An incoming traceparent header always
+# supplies the trace id; its sampled flag is only obeyed with
+# TRACE_TRUST_INCOMING, so outside clients can't force every request traced.
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.1'))
+TRACE_TRUST_INCOMING = os.environ.get('TRACE_TRUST_INCOMING', 'False').lower() == 'true'
+TRACE_EXPORTERS = os.environ.get('TRACE_EXPORTERS', 'bookings.tracing.InMemoryCollector').split(',')
+TRACE_BUFFER_SIZE = 200
+
+# Sampling profiler. A PROFILE_SAMPLE_RATE share of requests (and staff requests
+# sent with "X-Profile: 1") has its stack sampled every PROFILE_INTERVAL_MS;
+# collapsed stacks go to logs/profiles.ndjson and /monitoring/profiles/.
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+
+# tracemalloc diagnostics for MEMORY_PROFILE_VIEWS (URL names, none by default:
+# tracing slows every allocation) and for staff requests sent with
+# "X-Memory-Profile: 1", shown at /monitoring/memory/. Requests peaking above
+# MEMORY_BUDGET_MB are logged.
+MEMORY_PROFILE_VIEWS = [
+    name.strip() for name in os.environ.get('MEMORY_PROFILE_VIEWS', '').split(',') if name.strip()
+]
+MEMORY_BUDGET_MB = float(os.environ.get('MEMORY_BUDGET_MB', '64'))
+MEMORY_TRACE_FRAMES = 15
+MEMORY_REPORT_BUFFER_SIZE = 100
+
+# Email. Booking notifications are queued in the notification_outbox table and
+# sent by `manage.py dispatch_outbox`. Use the filebased or locmem backend locally.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', str(BASE_DIR / 'logs' / 'emails'))
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', '25'))
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'bookings@airline.local')
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_RETRY_BASE_SECONDS = 30
+OUTBOX_RETRY_MAX_SECONDS = 3600
+
+# Booking change feed at /api/booking-events/ (and `manage.py booking_events`).
+# Consumers authenticate with "Authorization: Bearer <token>" or a staff session.
+CDC_FEED_TOKENS = [token for token in os.environ.get('CDC_FEED_TOKENS', '').split(',') if token]
+
+# Background jobs (bookings.jobs), run by `manage.py run_jobs`. Per-queue caps on
+# jobs running at once across all workers, e.g. "exports=1,refunds=4".
+JOB_QUEUE_CONCURRENCY = {
+    name.strip(): int(limit)
+    for name, _, limit in (
+        item.partition('=') for item in os.environ.get('JOB_QUEUE_CONCURRENCY', 'exports=1').split(',') if item.strip()
+    )
+}
+# Periodic tasks and their interval in seconds
+JOB_SCHEDULE = {
+    name.strip(): int(interval)
+    for name, _, interval in (
+        item.partition('=') for item in os.environ.get(
+            'JOB_SCHEDULE', 'bookings.expire_holds=60,bookings.dispatch_outbox=10'
+        ).split(',') if item.strip()
+    )
+}
+JOB_DEFAULT_MAX_ATTEMPTS = 5
+JOB_RETRY_BASE_SECONDS = 10
+JOB_RETRY_MAX_SECONDS = 3600
+JOB_RETENTION_DAYS = 7
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '600'))
+JOB_EXPORT_DIR = os.environ.get('JOB_EXPORT_DIR', str(BASE_DIR / 'logs' / 'exports'))
+
+# Logging. Handlers sit behind a queue drained by a background writer
+# (bookings.log_pipeline), so request threads never wait on disk I/O.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_QUEUE = os.environ.get('LOG_QUEUE', 'True').lower() == 'true'
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', '5'))
+
+# Keep one in N DEBUG records per logger, e.g. "bookings=10,django.db.backends=100"
+LOG_SAMPLE_RATES = {
+    name.strip(): int(rate)
+    for name, _, rate in (
+        item.partition('=') for item in os.environ.get('LOG_SAMPLE_RATES', 'bookings=10').split(',') if item.strip()
+    )
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -143,14 +441,58 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'raw': {
+            'format': '{message}',
+            'style': '{',
+        },
+    },
+    'filters': {
+        'sample_debug': {
+            '()': 'bookings.log_pipeline.SampleFilter',
+            'rates': LOG_SAMPLE_RATES,
+        },
     },
     'handlers': {
         'file': {
-            'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'level': 'DEBUG',
+            'class': 'bookings.log_pipeline.CompressedRotatingFileHandler',
             'filename': BASE_DIR / 'logs' / 'airline.log',
+            'maxBytes': LOG_MAX_BYTES,
+            'backupCount': LOG_BACKUP_COUNT,
+            'formatter': 'verbose',
+        },
+        'slow_queries': {
+            'level': 'INFO',
+            'class': 'bookings.log_pipeline.CompressedRotatingFileHandler',
+            'filename': BASE_DIR / 'logs' / 'slow_queries.log',
+            'maxBytes': LOG_MAX_BYTES,
+            'backupCount': LOG_BACKUP_COUNT,
             'formatter': 'verbose',
         },
+        'traces': {
+            'level': 'INFO',
+            'class': 'bookings.log_pipeline.CompressedRotatingFileHandler',
+            'filename': BASE_DIR / 'logs' / 'traces.ndjson',
+            'maxBytes': LOG_MAX_BYTES,
+            'backupCount': LOG_BACKUP_COUNT,
+            'formatter': 'raw',
+        },
+        'contention': {
+            'level': 'INFO',
+            'class': 'bookings.log_pipeline.CompressedRotatingFileHandler',
+            'filename': BASE_DIR / 'logs' / 'contention.ndjson',
+            'maxBytes': LOG_MAX_BYTES,
+            'backupCount': LOG_BACKUP_COUNT,
+            'formatter': 'raw',
+        },
+        'profiles': {
+            'level': 'INFO',
+            'class': 'bookings.log_pipeline.CompressedRotatingFileHandler',
+            'filename': BASE_DIR / 'logs' / 'profiles.ndjson',
+            'maxBytes': LOG_MAX_BYTES,
+            'backupCount': LOG_BACKUP_COUNT,
+            'formatter': 'raw',
+        },
         'console': {
             'level': 'INFO',
             'class': 'logging.StreamHandler',
@@ -169,7 +511,28 @@ LOGGING = {
         },
         'bookings': {
             'handlers': ['console', 'file'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
+            'filters': ['sample_debug'],
+            'propagate': False,
+        },
+        'bookings.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'bookings.traces': {
+            'handlers': ['traces'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'bookings.contention': {
+            'handlers': ['contention'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'bookings.profiles': {
+            'handlers': ['profiles'],
+            'level': 'INFO',
             'propagate': False,
         },
     },
@@ -2,6 +2,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.http import JsonResponse
 from .models import Flight, Seat, Booking, AdminUser
+from .db_router import workload
 from django.contrib.auth.models import User
 
 def admin_login(request):
@@ -49,6 +50,7 @@ def admin_required(view_func):
     return wrapper
 
 @admin_required
+@workload('analytics')
 def admin_dashboard_new(request):
     airline_code = request.session.get('admin_airline')
     
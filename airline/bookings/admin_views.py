@@ -2,6 +2,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from .models import Flight, Seat, Booking
+from .db_router import workload
 from django.contrib.auth.models import User
 import logging
 
@@ -11,6 +12,7 @@ def is_admin(user):
     return user.is_authenticated and user.is_staff
 
 @login_required
+@workload('analytics')
 def admin_dashboard(request):
     if not request.user.is_staff:
         messages.error(request, 'Admin access required.')
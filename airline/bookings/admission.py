@@ -0,0 +1,281 @@
+import asyncio
+import random
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, JsonResponse
+from django.urls import Resolver404, resolve
+from .metrics import counter, gauge, histogram
+import logging
+
+logger = logging.getLogger('bookings')
+
+ADMISSION_IN_FLIGHT = gauge('airline_admission_in_flight', 'Admitted requests being handled, by endpoint class', ('endpoint_class',))
+ADMISSION_SHED = counter('airline_admission_shed_total', 'Requests turned away with 503, by endpoint class and reason', ('endpoint_class', 'reason'))
+ADMISSION_WAIT_SECONDS = histogram(
+    'airline_admission_wait_seconds', 'Time requests queued for admission', ('endpoint_class',),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5),
+)
+
+# URL name → endpoint class; anything unlisted is 'default'
+ENDPOINT_CLASSES = {
+    'booking-create': 'booking',
+    'book-seat-gui': 'booking',
+    'booking-cancel': 'booking',
+    'cancel-booking-gui': 'booking',
+    'booking-refund': 'booking',
+    'process-refund-gui': 'booking',
+    'edit-passenger-gui': 'booking',
+    'change-passengers-gui': 'booking',
+    'delete-booking-gui': 'booking',
+    'booking-payment': 'payment',
+    'payment-page-gui': 'payment',
+    'process-payment-gui': 'payment',
+    'flight-list-gui': 'search',
+    'flight-seats-gui': 'search',
+    'flight-list-create': 'search',
+    'flight-detail': 'search',
+    'seat-list-create': 'search',
+    'city-suggestions': 'search',
+    'connection-search': 'search',
+    'fare-calendar': 'search',
+    'flight-search': 'search',
+    'booking-events': 'export',
+    'metrics': 'monitoring',
+    'test-monitoring': 'monitoring',
+}
+
+# Lower goes first: a class never takes a free slot while a higher-priority request is queued
+PRIORITIES = {
+    'booking': 0,
+    'payment': 0,
+    'search': 1,
+    'default': 1,
+    'monitoring': 2,
+    'export': 2,
+}
+
+LATENCY_STALE_SECONDS = 30
+
+
+def endpoint_class(request):
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return 'default', None
+    name = match.url_name or ''
+    if name in ENDPOINT_CLASSES:
+        return ENDPOINT_CLASSES[name], match
+    if name.startswith('monitoring') or request.path_info.startswith('/monitoring/'):
+        return 'monitoring', match
+    return 'default', match
+
+
+class AdmissionController:
+    """Per-process concurrency limits per endpoint class, with a short priority-ordered queue.
+
+    ``limits`` caps each class; ``total`` caps all of them together, and the
+    last ``reserved`` of those slots only go to priority-0 classes (bookings and
+    payments). A lower-priority request defers to a higher-priority one only
+    while that one waits for shared capacity, not for its own class limit.
+    While booking and payment latency is over ``latency_target`` seconds the
+    database is treated as saturated and priority-2 classes are shed outright,
+    until a fresh measurement comes in under target or LATENCY_STALE_SECONDS pass.
+    """
+
+    def __init__(self, limits, total, reserved, latency_target):
+        self.limits = limits
+        self.total = total
+        self.reserved = reserved
+        self.latency_target = latency_target
+        self.in_flight = {}
+        self.waiting = {}
+        self.latency = {}
+        self.latency_at = {}
+        self._cond = threading.Condition()
+
+    def _limit(self, endpoint_class):
+        return self.limits.get(endpoint_class, self.limits.get('default', self.total))
+
+    def overloaded(self):
+        now = time.monotonic()
+        return any(
+            latency > self.latency_target and now - self.latency_at[name] < LATENCY_STALE_SECONDS
+            for name, latency in self.latency.items() if PRIORITIES.get(name, 1) == 0
+        )
+
+    def _blocker(self, endpoint_class, priority):
+        """What keeps a request from taking a slot right now: 'class', 'total', 'priority' or None"""
+        if self.in_flight.get(endpoint_class, 0) >= self._limit(endpoint_class):
+            return 'class'
+        capacity = self.total if priority == 0 else self.total - self.reserved
+        if sum(self.in_flight.values()) >= capacity:
+            return 'total'
+        # Only waiters held up by shared capacity compete with us; one stuck on its own class cap doesn't
+        if any(count for other, count in self.waiting.items() if count and other < priority):
+            return 'priority'
+        return None
+
+    def acquire(self, endpoint_class, timeout):
+        """Take a slot, waiting up to ``timeout`` seconds; returns None when admitted, else why not"""
+        priority = PRIORITIES.get(endpoint_class, 1)
+        with self._cond:
+            if priority >= 2 and self.overloaded():
+                return 'overloaded'
+            blocker = self._blocker(endpoint_class, priority)
+            if blocker is not None:
+                if timeout <= 0:
+                    return 'full'
+                deadline = time.monotonic() + timeout
+                # Counted in self.waiting only while waiting for shared capacity
+                counted = False
+                try:
+                    while blocker is not None:
+                        if counted != (blocker == 'total'):
+                            counted = not counted
+                            self.waiting[priority] = self.waiting.get(priority, 0) + (1 if counted else -1)
+                            if not counted:
+                                self._cond.notify_all()
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return 'queue_timeout'
+                        self._cond.wait(remaining)
+                        blocker = self._blocker(endpoint_class, priority)
+                finally:
+                    if counted:
+                        self.waiting[priority] -= 1
+                        # Lower-priority waiters may have been held back only by this one
+                        self._cond.notify_all()
+            self.in_flight[endpoint_class] = self.in_flight.get(endpoint_class, 0) + 1
+        return None
+
+    def release(self, endpoint_class, seconds=None):
+        """Give a slot back; ``seconds`` the request took, or None when it never ran"""
+        with self._cond:
+            self.in_flight[endpoint_class] -= 1
+            if seconds is not None:
+                previous = self.latency.get(endpoint_class)
+                # Exponentially weighted, so a few slow requests move it but one outlier doesn't
+                self.latency[endpoint_class] = seconds if previous is None else previous * 0.8 + seconds * 0.2
+                self.latency_at[endpoint_class] = time.monotonic()
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                name: {
+                    'in_flight': self.in_flight.get(name, 0),
+                    'limit': self._limit(name),
+                    'latency_ms': round(self.latency[name] * 1000, 1) if name in self.latency else None,
+                }
+                for name in PRIORITIES
+            }
+
+
+def _shed_response(request, endpoint_class):
+    # Jittered so shed clients don't all come back in the same second
+    retry_after = settings.ADMISSION_RETRY_AFTER_SECONDS + random.randint(0, settings.ADMISSION_RETRY_AFTER_SECONDS)
+    message = 'The service is busy, please retry shortly'
+    if request.path_info.startswith('/api/'):
+        response = JsonResponse({'error': message}, status=503)
+    else:
+        response = HttpResponse(message, status=503, content_type='text/plain')
+    response['Retry-After'] = str(retry_after)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+class AdmissionControlMiddleware:
+    """Limits concurrent requests per endpoint class and sheds the excess with 503 + Retry-After.
+
+    Goes right after MetricsMiddleware, so shed requests are counted but cost no
+    session or database work. Limits are per process: size them to the worker's
+    thread count and what the database can take across all workers.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.ADMISSION_CONTROL:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.controller = AdmissionController(
+            settings.ADMISSION_LIMITS,
+            settings.ADMISSION_TOTAL_LIMIT,
+            settings.ADMISSION_RESERVED_SLOTS,
+            settings.ADMISSION_LATENCY_TARGET_MS / 1000,
+        )
+        self._last_warning = {}
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        name, match = endpoint_class(request)
+        started = time.perf_counter()
+        reason = self.controller.acquire(name, settings.ADMISSION_QUEUE_MS.get(name, 0) / 1000)
+        if reason is not None:
+            return self._shed(request, name, match, reason, started)
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started, endpoint_class=name)
+
+        ADMISSION_IN_FLIGHT.inc(endpoint_class=name)
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            ADMISSION_IN_FLIGHT.dec(endpoint_class=name)
+            self.controller.release(name, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        name, match = endpoint_class(request)
+        started = time.perf_counter()
+        queue_seconds = settings.ADMISSION_QUEUE_MS.get(name, 0) / 1000
+        reason = self.controller.acquire(name, 0)
+        if reason == 'full' and queue_seconds > 0:
+            reason = await self._queue(name, queue_seconds)
+        if reason is not None:
+            return self._shed(request, name, match, reason, started)
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started, endpoint_class=name)
+
+        ADMISSION_IN_FLIGHT.inc(endpoint_class=name)
+        started = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            ADMISSION_IN_FLIGHT.dec(endpoint_class=name)
+            self.controller.release(name, time.perf_counter() - started)
+
+    async def _queue(self, name, queue_seconds):
+        # Queueing blocks on the controller's condition: wait in a thread, not on the event loop
+        waiting = asyncio.ensure_future(
+            sync_to_async(self.controller.acquire, thread_sensitive=False)(name, queue_seconds)
+        )
+        try:
+            return await asyncio.shield(waiting)
+        except asyncio.CancelledError:
+            # The client went away, but the thread can't be stopped and may still be admitted: hand that slot back
+            def give_back(done):
+                if not done.cancelled() and done.exception() is None and done.result() is None:
+                    self.controller.release(name)
+            waiting.add_done_callback(give_back)
+            raise
+
+    def _shed(self, request, name, match, reason, started):
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started, endpoint_class=name)
+        ADMISSION_SHED.inc(endpoint_class=name, reason=reason)
+        self._warn(name, reason)
+        # Lets MetricsMiddleware label the 503 with the view it was meant for
+        request.resolver_match = match
+        return _shed_response(request, name)
+
+    def _warn(self, name, reason):
+        # At most one line per class every 10s; the counter has the exact numbers
+        now = time.monotonic()
+        if now - self._last_warning.get(name, 0) >= 10:
+            self._last_warning[name] = now
+            logger.warning(f"Shedding {name} requests ({reason}): {self.controller.snapshot()}")
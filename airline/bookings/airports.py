@@ -0,0 +1,132 @@
+import re
+import string
+import unicodedata
+from django.db import IntegrityError, transaction
+from .models import Airport, AirportAlias
+import logging
+
+logger = logging.getLogger('bookings')
+
+# City → (IATA code, airport name, country, other names) for the cities we fly
+KNOWN_AIRPORTS = {
+    'Mumbai': ('BOM', 'Chhatrapati Shivaji Maharaj International', 'India', ['Bombay']),
+    'Delhi': ('DEL', 'Indira Gandhi International', 'India', ['New Delhi']),
+    'Bangalore': ('BLR', 'Kempegowda International', 'India', ['Bengaluru']),
+    'Chennai': ('MAA', 'Chennai International', 'India', ['Madras']),
+    'Kolkata': ('CCU', 'Netaji Subhas Chandra Bose International', 'India', ['Calcutta']),
+    'Hyderabad': ('HYD', 'Rajiv Gandhi International', 'India', []),
+    'Pune': ('PNQ', 'Pune International', 'India', ['Poona']),
+    'Ahmedabad': ('AMD', 'Sardar Vallabhbhai Patel International', 'India', []),
+    'Jaipur': ('JAI', 'Jaipur International', 'India', []),
+    'Kochi': ('COK', 'Cochin International', 'India', ['Cochin']),
+    'Goa': ('GOI', 'Dabolim', 'India', []),
+    'New York': ('JFK', 'John F. Kennedy International', 'United States', ['NYC']),
+    'Los Angeles': ('LAX', 'Los Angeles International', 'United States', ['LA']),
+    'Chicago': ('ORD', "O'Hare International", 'United States', []),
+    'Miami': ('MIA', 'Miami International', 'United States', []),
+    'London': ('LHR', 'Heathrow', 'United Kingdom', []),
+    'Paris': ('CDG', 'Charles de Gaulle', 'France', []),
+}
+
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+
+def normalize(text):
+    """Lowercase, accent-free, single-spaced form used for every alias lookup"""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode()
+    return ' '.join(_NON_WORD_RE.sub(' ', text.casefold()).split())
+
+
+def alias_keys(airport):
+    """Every key ``airport`` is found by: code, city, name, aliases and each of their words"""
+    keys = set()
+    for value in (airport.iata_code, airport.city, airport.name, *airport.aliases):
+        value = normalize(value)
+        if value:
+            keys.add(value)
+            keys.update(word for word in value.split() if len(word) >= 2)
+    return keys
+
+
+def index_aliases(airport):
+    """Rebuild the alias index rows of one airport"""
+    with transaction.atomic():
+        AirportAlias.objects.filter(airport=airport).delete()
+        AirportAlias.objects.bulk_create([AirportAlias(airport=airport, alias=key) for key in sorted(alias_keys(airport))])
+
+
+def resolve_airports(text):
+    """Ids of the airports whose code, city, name or alias starts with ``text``; one indexed lookup"""
+    key = normalize(text)
+    if not key:
+        return []
+    return list(
+        AirportAlias.objects.filter(alias__startswith=key).values_list('airport_id', flat=True).distinct()
+    )
+
+
+async def aresolve_airports(text):
+    key = normalize(text)
+    if not key:
+        return []
+    return [
+        airport_id async for airport_id in
+        AirportAlias.objects.filter(alias__startswith=key).values_list('airport_id', flat=True).distinct()
+    ]
+
+
+def known_airport(city):
+    """(city, IATA code, name, country, aliases) from KNOWN_AIRPORTS for a city or one of its other names"""
+    key = normalize(city)
+    for name, (code, airport_name, country, aliases) in KNOWN_AIRPORTS.items():
+        if key in {normalize(name), normalize(code), *(normalize(alias) for alias in aliases)}:
+            return name, code, airport_name, country, aliases
+    return None
+
+
+def generated_code(city, taken):
+    """First free three-letter code built from the city's letters, for cities without a known code"""
+    taken = set(taken) | {code for code, *_ in KNOWN_AIRPORTS.values()}
+    letters = [c for c in normalize(city).upper() if c in string.ascii_uppercase] or ['X']
+    first = letters[0]
+    for second in dict.fromkeys(letters[1:] + list(string.ascii_uppercase)):
+        for third in dict.fromkeys(letters[2:] + list(string.ascii_uppercase)):
+            code = first + second + third
+            if code not in taken:
+                return code
+    raise ValueError(f"No free airport code for {city!r}")
+
+
+def _names(airport):
+    return {normalize(name) for name in (airport.iata_code, airport.city, *airport.aliases)}
+
+
+def airport_for_city(city, attempts=5):
+    """The airport a free-text city name refers to, created (from KNOWN_AIRPORTS if listed) when new"""
+    key = normalize(city)
+    for candidate in Airport.objects.filter(alias_index__alias=key).order_by('id'):
+        # A word key like "york" is shared, so only a whole name counts as the same city
+        if key in _names(candidate):
+            return candidate
+
+    known = known_airport(city)
+    for _ in range(attempts):
+        if known:
+            name, code, airport_name, country, aliases = known
+        else:
+            name, airport_name, country, aliases = city.strip(), f"{city.strip()} Airport", '', []
+            code = generated_code(city, Airport.objects.values_list('iata_code', flat=True))
+        try:
+            with transaction.atomic():
+                airport = Airport.objects.create(iata_code=code, name=airport_name, city=name, country=country, aliases=aliases)
+        except IntegrityError:
+            existing = Airport.objects.filter(iata_code=code).first()
+            # Created concurrently, or a known code already listed under another of the city's names
+            if existing is not None and (known or key in _names(existing)):
+                return existing
+            # Another city took the generated code in the meantime: try the next free one
+            continue
+        if not known:
+            logger.warning("No IATA code known for %r, created airport %s; set its real code on the Airport row", city, code)
+        return airport
+    raise IntegrityError(f"Could not create an airport for {city!r}")
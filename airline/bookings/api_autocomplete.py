@@ -1,34 +1,25 @@
 from django.http import JsonResponse
-from .models import Flight
+from .airports import resolve_airports
+from .models import Airport
 
 def city_suggestions(request):
     query = request.GET.get('q', '').strip()
     field = request.GET.get('field', 'origin')
     show_all = request.GET.get('all', 'false') == 'true'
     
+    # Cities with active departures (origin) or arrivals (destination)
+    flights = 'departures' if field == 'origin' else 'arrivals'
+    airports = Airport.objects.filter(**{f'{flights}__is_active': True})
+
     if show_all or len(query) == 0:
         # Show all available cities when requested or field is empty
-        if field == 'origin':
-            cities = Flight.objects.filter(
-                is_active=True
-            ).values_list('origin', flat=True).distinct().order_by('origin')[:20]
-        else:
-            cities = Flight.objects.filter(
-                is_active=True
-            ).values_list('destination', flat=True).distinct().order_by('destination')[:20]
+        cities = airports.values_list('city', flat=True).distinct().order_by('city')[:20]
     elif len(query) < 2:
         return JsonResponse({'suggestions': []})
     else:
-        # Filter by query
-        if field == 'origin':
-            cities = Flight.objects.filter(
-                origin__icontains=query,
-                is_active=True
-            ).values_list('origin', flat=True).distinct()[:10]
-        else:
-            cities = Flight.objects.filter(
-                destination__icontains=query,
-                is_active=True
-            ).values_list('destination', flat=True).distinct()[:10]
+        # Match codes, cities and their other names through the alias index
+        cities = airports.filter(
+            id__in=resolve_airports(query)
+        ).values_list('city', flat=True).distinct().order_by('city')[:10]
     
-    return JsonResponse({'suggestions': list(cities)})
\ No newline at end of file
+    return JsonResponse({'suggestions': list(cities)})
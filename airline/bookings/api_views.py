@@ -3,9 +3,9 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from .models import Seat, Booking
-from .services import create_booking, process_payment, cancel_booking, refund_booking
+from .services import claim_seat, process_payment, cancel_booking, refund_booking
 from .serializers import BookingSerializer
-from .exceptions import SeatNotAvailableError, BookingError, PaymentError
+from .exceptions import SeatNotAvailableError, BookingError, PaymentError, ConcurrentUpdateError
 import logging
 
 logger = logging.getLogger('bookings')
@@ -21,12 +21,14 @@ def create_booking_api(request):
             'passenger_phone': request.data.get('passenger_phone', '')
         }
         
-        booking = create_booking(seat_id, passenger_data, request.user)
+        booking = claim_seat(seat_id, passenger_data, request.user)
         serializer = BookingSerializer(booking)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
         
     except SeatNotAvailableError as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except ConcurrentUpdateError as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
     except Exception as e:
         logger.error(f"Booking creation error: {str(e)}")
         return Response({'error': 'Booking failed'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
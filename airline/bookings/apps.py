@@ -1,5 +1,28 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+
+def _ensure_booking_partitions(sender, **kwargs):
+    from .partitions import ensure_partitions
+    ensure_partitions()
 
 
 class BookingsConfig(AppConfig):
     name = 'bookings'
+
+    def ready(self):
+        if settings.LOG_QUEUE:
+            from .log_pipeline import install
+            install(['', *settings.LOGGING.get('loggers', {})])
+
+        if settings.SLOW_QUERY_MS > 0:
+            from .slow_queries import install_on_connection
+            connection_created.connect(install_on_connection, dispatch_uid='bookings.slow_queries')
+
+        from .tracing import install_on_connection as install_tracing
+        connection_created.connect(install_tracing, dispatch_uid='bookings.tracing')
+
+        # Keep upcoming monthly airline_bookings partitions in place after every migrate
+        post_migrate.connect(_ensure_booking_partitions, sender=self)
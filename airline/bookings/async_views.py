@@ -0,0 +1,248 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render
+from django.utils import timezone
+from .airports import aresolve_airports
+from .models import Airport, Flight, Booking
+from .fares import calendar_for_search
+from .routes import connections_for_search
+from .search import (
+    InvalidCursor, chosen_filters, facet_aggregates, facet_counts, facet_options, keyset_page, search_date,
+    search_params, split_page, with_links,
+)
+from .seat_events import get_hub, format_sse
+from .serializers import FlightSerializer
+from .views import FlightListCreateView, FlightDetailView
+import logging
+
+logger = logging.getLogger('bookings')
+
+CITY_SUGGESTIONS_CACHE_SECONDS = 300
+SEAT_EVENTS_KEEPALIVE_SECONDS = 15
+SEAT_EVENTS_RETRY_MS = 3000
+
+# Write methods on the flight API still go through the DRF views
+_flight_list_create = sync_to_async(FlightListCreateView.as_view())
+_flight_detail = sync_to_async(FlightDetailView.as_view())
+
+
+def _with_seat_counts(flights):
+    return flights.annotate(
+        total_seats_count=Count('seats'),
+        booked_seats_count=Count('seats', filter=Q(seats__is_booked=True)),
+        available_seats_count=Count('seats', filter=Q(seats__is_booked=False)),
+    )
+
+
+def _drf_checks(view_class, request, **kwargs):
+    """Run a DRF view's authentication, permission and throttle checks on ``request``.
+
+    Returns (view, None) when they pass, else (view, the rendered error
+    response DRF itself would have sent). Sync only: authentication loads the
+    session and user, and throttling reads the cache.
+    """
+    view = view_class()
+    view.args, view.kwargs = (), kwargs
+    view.request = view.initialize_request(request, **kwargs)
+    view.headers = view.default_response_headers
+    try:
+        view.initial(view.request, **kwargs)
+    except Exception as exc:
+        response = view.finalize_response(view.request, view.handle_exception(exc), **kwargs)
+        return view, response.render()
+    return view, None
+
+
+async def flight_list_async(request):
+    origin = request.GET.get('origin', '')
+    destination = request.GET.get('destination', '')
+    date = request.GET.get('date', '')
+    passengers = request.GET.get('passengers', '1')
+    try:
+        search_date(date)
+    except ValueError:
+        # A mangled date searches every day, as if it were left empty
+        date = ''
+
+    flights = Flight.objects.filter(is_active=True)
+    if origin:
+        flights = flights.filter(origin_airport_id__in=await aresolve_airports(origin))
+    if destination:
+        flights = flights.filter(destination_airport_id__in=await aresolve_airports(destination))
+    if date:
+        flights = flights.filter(departure_time__date=date)
+
+    sort, cursor, selected = search_params(request.GET)
+    options = facet_options()
+    chosen = chosen_filters(options, selected)
+    try:
+        page = keyset_page(_with_seat_counts(flights.filter(*chosen.values())), sort, cursor)
+    except InvalidCursor:
+        page = keyset_page(_with_seat_counts(flights.filter(*chosen.values())), sort)
+    facets = facet_counts(options, await flights.aaggregate(**facet_aggregates(options, chosen)), selected)
+    flights, next_cursor = split_page([f async for f in page], sort)
+    sort_links, next_url = with_links(request.GET, facets, next_cursor)
+    logger.info(f"Async flight list: {len(flights)} flights for {origin or '*'} -> {destination or '*'} {date}")
+
+    # The route graph is an in-process structure guarded by a thread lock, so search it on a thread
+    connections = await sync_to_async(connections_for_search)(origin, destination, date, passengers)
+    fare_calendar = await sync_to_async(calendar_for_search)(origin, destination, date, passengers)
+
+    return await sync_to_async(render)(request, 'bookings/flight_list_simple.html', {
+        'flights': flights,
+        'connections': connections,
+        'fare_calendar': fare_calendar,
+        'facets': facets,
+        'sort': sort,
+        'sort_links': sort_links,
+        'next_url': next_url,
+        'origin': origin,
+        'destination': destination,
+        'date': date,
+        'passengers': passengers
+    })
+
+
+async def flight_seats_async(request, flight_id):
+    try:
+        flight = await Flight.objects.aget(id=flight_id)
+    except Flight.DoesNotExist:
+        raise Http404("No Flight matches the given query.")
+
+    def remember_passengers():
+        passengers = int(request.GET.get('passengers', request.session.get('passengers', 1)))
+        request.session['passengers'] = passengers
+        return passengers
+    passengers = await sync_to_async(remember_passengers)()
+
+    selected_seat_numbers = request.GET.get('selected', '').split(',') if request.GET.get('selected') else []
+
+    seats = [
+        seat async for seat in
+        flight.seats.select_related('flight').order_by('row_number', 'seat_letter')
+    ]
+    held_seat_ids = {
+        seat_id async for seat_id in Booking.objects.filter(
+            seat__flight_id=flight_id,
+            state__in=['SEAT_HELD', 'PAYMENT_PENDING'],
+            seat_hold_until__gt=timezone.now()
+        ).values_list('seat_id', flat=True)
+    }
+
+    booked_seats = 0
+    for seat in seats:
+        seat.is_held = seat.id in held_seat_ids
+        booked_seats += seat.is_booked
+
+    total_seats = len(seats)
+    held_seats = len(held_seat_ids)
+
+    return await sync_to_async(render)(request, 'bookings/flight_seats_premium.html', {
+        'flight': flight,
+        'seats': seats,
+        'total_seats': total_seats,
+        'booked_seats': booked_seats,
+        'held_seats': held_seats,
+        'available_seats': total_seats - booked_seats - held_seats,
+        'passengers': passengers,
+        'selected_seat_numbers': selected_seat_numbers
+    })
+
+
+async def city_suggestions_async(request):
+    query = request.GET.get('q', '').strip()
+    field = 'origin' if request.GET.get('field', 'origin') == 'origin' else 'destination'
+    show_all = request.GET.get('all', 'false') == 'true'
+
+    if not show_all and 0 < len(query) < 2:
+        return JsonResponse({'suggestions': []})
+
+    list_all = show_all or len(query) == 0
+    cache_key = f"city_suggestions:{field}:{'*' if list_all else query.lower()}"
+    cities = await cache.aget(cache_key)
+
+    if cities is None:
+        flights = 'departures' if field == 'origin' else 'arrivals'
+        airports = Airport.objects.filter(**{f'{flights}__is_active': True})
+        if list_all:
+            airports = airports.values_list('city', flat=True).distinct().order_by('city')[:20]
+        else:
+            airports = airports.filter(
+                id__in=await aresolve_airports(query)
+            ).values_list('city', flat=True).distinct().order_by('city')[:10]
+        cities = [city async for city in airports]
+        await cache.aset(cache_key, cities, CITY_SUGGESTIONS_CACHE_SECONDS)
+
+    return JsonResponse({'suggestions': cities})
+
+
+async def flight_list_api_async(request):
+    if request.method != 'GET':
+        return await _flight_list_create(request)
+
+    _, denied = await sync_to_async(_drf_checks)(FlightListCreateView, request)
+    if denied:
+        return denied
+
+    flights = _with_seat_counts(Flight.objects.filter(is_active=True)).order_by('departure_time')
+    flights = [f async for f in flights]
+    return JsonResponse(FlightSerializer(flights, many=True).data, safe=False)
+
+
+async def flight_detail_api_async(request, pk):
+    if request.method != 'GET':
+        return await _flight_detail(request, pk=pk)
+
+    view, denied = await sync_to_async(_drf_checks)(FlightDetailView, request, pk=pk)
+    if denied:
+        return denied
+
+    try:
+        flight = await _with_seat_counts(Flight.objects.all()).aget(pk=pk)
+    except Flight.DoesNotExist:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    try:
+        view.check_object_permissions(view.request, flight)
+    except Exception as exc:
+        return view.finalize_response(view.request, view.handle_exception(exc), pk=pk).render()
+    return JsonResponse(FlightSerializer(flight).data)
+
+
+async def seat_events_stream(request, flight_id):
+    # A never-ending stream would pin a WSGI worker forever; 204 tells
+    # EventSource clients to stop reconnecting
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    if not await Flight.objects.filter(id=flight_id).aexists():
+        raise Http404("No Flight matches the given query.")
+
+    hub = get_hub(flight_id)
+
+    async def stream():
+        queue = hub.subscribe()
+        try:
+            yield f"retry: {SEAT_EVENTS_RETRY_MS}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SEAT_EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            hub.unsubscribe(queue)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# DRF enforces CSRF itself for session-authenticated writes. The csrf_exempt
+# decorator only learned to wrap coroutines in Django 5.0, so set the flag.
+flight_list_api_async.csrf_exempt = True
+flight_detail_api_async.csrf_exempt = True
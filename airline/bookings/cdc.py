@@ -0,0 +1,137 @@
+import json
+import secrets
+from django.conf import settings
+from django.db import connection, router, transaction
+from django.http import HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
+from django.utils import timezone
+from .db_router import workload
+from .models import BookingEvent
+import logging
+
+logger = logging.getLogger('bookings')
+
+DEFAULT_BATCH = 5000
+MAX_BATCH = 50000
+
+# Number committed events in id order. Runs under a lock, so a later call only
+# ever hands out higher numbers: a transaction that commits late gets a seq
+# above every cursor already served instead of appearing behind one.
+SEQUENCE_SQL = """
+    UPDATE booking_events
+    SET seq = numbered.seq
+    FROM (
+        SELECT id,
+               (SELECT COALESCE(MAX(seq), 0) FROM booking_events) + ROW_NUMBER() OVER (ORDER BY id) AS seq
+        FROM booking_events
+        WHERE seq IS NULL
+    ) AS numbered
+    WHERE booking_events.id = numbered.id
+"""
+
+
+def record_booking_event(booking, event_type, from_state='', to_state=''):
+    """Append to the change feed; call inside the transaction that changes the booking"""
+    return BookingEvent.objects.create(
+        event_type=event_type,
+        booking_id=booking.id,
+        booking_reference=booking.booking_reference,
+        from_state=from_state,
+        to_state=to_state,
+        data={
+            'flight_id': booking.seat.flight_id,
+            'seat_id': booking.seat_id,
+            'user_id': booking.user_id,
+            'passenger_email': booking.passenger_email,
+            'travel_date': str(booking.travel_date),
+            'payment_amount': str(booking.payment_amount) if booking.payment_amount is not None else None,
+            'refund_amount': str(booking.refund_amount) if booking.refund_amount is not None else None,
+        },
+        occurred_at=timezone.now(),
+    )
+
+
+def assign_sequence():
+    """Give committed, unsequenced events their seq; returns how many were numbered"""
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext('booking_events.seq'))")
+        cursor.execute(SEQUENCE_SQL)
+        return cursor.rowcount
+
+
+def to_dict(event):
+    return {
+        'seq': event.seq,
+        'type': event.event_type,
+        'booking_id': event.booking_id,
+        'booking_reference': str(event.booking_reference),
+        'from_state': event.from_state or None,
+        'to_state': event.to_state or None,
+        'occurred_at': event.occurred_at.isoformat(),
+        **event.data,
+    }
+
+
+def upper_bound(after, limit):
+    """Highest seq a read of ``limit`` events after ``after`` will reach (``after`` if none)"""
+    last = (
+        BookingEvent.objects.filter(seq__gt=after).order_by('seq')
+        .values_list('seq', flat=True)[limit - 1:limit]
+    )
+    if last:
+        return last[0]
+    newest = BookingEvent.objects.filter(seq__gt=after).order_by('-seq').values_list('seq', flat=True).first()
+    return newest or after
+
+
+def iter_events(after, upper, chunk_size=DEFAULT_BATCH, using=None):
+    """Events with after < seq <= upper in seq order, paged by seq"""
+    while after < upper:
+        chunk = list(
+            BookingEvent.objects.using(using).filter(seq__gt=after, seq__lte=upper).order_by('seq')[:chunk_size]
+        )
+        if not chunk:
+            return
+        yield from chunk
+        after = chunk[-1].seq
+
+
+def ndjson_lines(after, upper, using=None):
+    for event in iter_events(after, upper, using=using):
+        yield json.dumps(to_dict(event)) + '\n'
+
+
+def _authorized(request):
+    header = request.headers.get('Authorization', '')
+    token = header[len('Bearer '):] if header.startswith('Bearer ') else ''
+    if token and any(secrets.compare_digest(token, allowed) for allowed in settings.CDC_FEED_TOKENS):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+@workload('batch')
+def booking_events_view(request):
+    """NDJSON stream of booking events after ``?after=<seq>``, at most ``?limit=`` of them.
+
+    X-Next-Cursor is the seq to pass as ``after`` next time; X-Has-More says
+    whether more events were already waiting.
+    """
+    if not _authorized(request):
+        return HttpResponseForbidden('Booking events need a feed token or a staff session')
+    try:
+        after = int(request.GET.get('after', 0))
+        limit = min(int(request.GET.get('limit', DEFAULT_BATCH)), MAX_BATCH)
+    except ValueError:
+        return HttpResponseBadRequest('after and limit must be integers')
+    if after < 0 or limit < 1:
+        return HttpResponseBadRequest('after must be >= 0 and limit >= 1')
+
+    assign_sequence()
+    upper = upper_bound(after, limit)
+    # The body streams after this view returns, outside the workload binding
+    using = router.db_for_read(BookingEvent)
+    response = StreamingHttpResponse(ndjson_lines(after, upper, using), content_type='application/x-ndjson')
+    response['X-Next-Cursor'] = str(upper)
+    response['X-Has-More'] = 'true' if BookingEvent.objects.filter(seq__gt=upper).exists() else 'false'
+    response['Cache-Control'] = 'no-store'
+    return response
@@ -0,0 +1,147 @@
+import functools
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from .contention import record_lock_wait
+from .db_router import bound_transaction
+from .exceptions import BookingError, SeatNotAvailableError
+from .metrics import histogram
+from .models import Seat
+from .retries import begin_serializable, retry_on_conflict, retry_reason
+from .services import hold_seat
+from .tracing import span
+import logging
+
+logger = logging.getLogger('bookings')
+
+COALESCED_BATCH_SIZE = histogram(
+    'airline_coalesced_batch_size', 'Seat claims applied per coalesced transaction',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+)
+COALESCED_BATCH_SECONDS = histogram('airline_coalesced_batch_seconds', 'Time to apply one coalesced batch')
+
+# One queue and drain thread per flight with claims in flight in this process
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+class _Claim:
+    __slots__ = ('seat_id', 'passenger_data', 'user', 'future')
+
+    def __init__(self, seat_id, passenger_data, user):
+        self.seat_id = seat_id
+        self.passenger_data = passenger_data
+        self.user = user
+        self.future = Future()
+
+
+@functools.lru_cache(maxsize=50000)
+def _flight_of(seat_id):
+    # A seat never moves to another flight, so this is safe to cache
+    flight_id = Seat.objects.filter(id=seat_id).values_list('flight_id', flat=True).first()
+    if flight_id is None:
+        raise SeatNotAvailableError("Seat does not exist")
+    return flight_id
+
+
+class FlightQueue:
+    """Drains one flight's claims, applying each batch in a single transaction"""
+
+    def __init__(self, flight_id):
+        self.flight_id = flight_id
+        self.claims = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name=f'coalescer-{flight_id}', daemon=True)
+
+    def _run(self):
+        try:
+            while True:
+                try:
+                    first = self.claims.get(timeout=settings.BOOKING_COALESCE_IDLE_SECONDS)
+                except queue.Empty:
+                    # Retire under the registry lock, so no claim can slip in unseen
+                    with _queues_lock:
+                        if self.claims.empty():
+                            del _queues[self.flight_id]
+                            return
+                    continue
+                batch = [first]
+                while len(batch) < settings.BOOKING_COALESCE_MAX_BATCH:
+                    try:
+                        batch.append(self.claims.get_nowait())
+                    except queue.Empty:
+                        break
+                # The thread outlives requests, so drop a connection that broke or hit CONN_MAX_AGE
+                close_old_connections()
+                self._apply(batch)
+        finally:
+            connection.close()
+
+    @retry_on_conflict('coalesced_batch')
+    @transaction.atomic
+    def _claim_all(self, batch):
+        """(claim, booking, error) for every claim of ``batch``, in one transaction"""
+        begin_serializable()
+        bound_transaction()
+        lock_started = time.perf_counter()
+        seats = {
+            seat.id: seat for seat in
+            Seat.objects.select_for_update(of=('self',)).select_related('flight')
+            .filter(id__in={claim.seat_id for claim in batch}).order_by('id')
+        }
+        record_lock_wait('coalesced_batch', None, lock_started)
+        outcomes = []
+        for claim in batch:
+            # A savepoint per claim: one failure doesn't undo the others
+            try:
+                with transaction.atomic():
+                    booking = hold_seat(seats.get(claim.seat_id), claim.seat_id, claim.passenger_data, claim.user)
+                outcomes.append((claim, booking, None))
+            except Exception as e:
+                if retry_reason(e):
+                    # A deadlock or serialization failure dooms the whole batch; retry it
+                    raise
+                outcomes.append((claim, None, e))
+        return outcomes
+
+    def _apply(self, batch):
+        started = time.perf_counter()
+        try:
+            outcomes = self._claim_all(batch)
+        except Exception as e:
+            logger.error("Coalesced batch of %s claim(s) for flight %s failed: %s", len(batch), self.flight_id, e)
+            for claim in batch:
+                claim.future.set_exception(e)
+            return
+        finally:
+            COALESCED_BATCH_SIZE.observe(len(batch))
+            COALESCED_BATCH_SECONDS.observe(time.perf_counter() - started)
+
+        # Only now is the batch committed and visible to the callers
+        for claim, booking, error in outcomes:
+            if error is None:
+                claim.future.set_result(booking)
+            else:
+                claim.future.set_exception(error)
+
+
+def submit_claim(seat_id, passenger_data, user=None):
+    """Queue a claim on its flight's coalescer and wait for this caller's booking (or error)"""
+    claim = _Claim(seat_id, passenger_data, user)
+    flight_id = _flight_of(seat_id)
+    with _queues_lock:
+        flight_queue = _queues.get(flight_id)
+        if flight_queue is None:
+            flight_queue = _queues[flight_id] = FlightQueue(flight_id)
+            flight_queue.thread.start()
+        flight_queue.claims.put(claim)
+
+    with span('coalescer.wait', flight_id=flight_id):
+        try:
+            return claim.future.result(timeout=settings.BOOKING_COALESCE_TIMEOUT_SECONDS)
+        except FutureTimeout:
+            # The claim may still be applied; an unpaid hold expires on its own
+            logger.error("Coalesced claim for seat %s timed out on flight %s", seat_id, flight_id)
+            raise BookingError("Booking is taking longer than expected, please check your bookings shortly")
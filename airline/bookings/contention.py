@@ -0,0 +1,152 @@
+import glob
+import gzip
+import json
+import re
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection
+from .metrics import histogram
+import logging
+
+logger = logging.getLogger('bookings')
+contention_logger = logging.getLogger('bookings.contention')
+
+ROW_LOCK_WAIT_SECONDS = histogram(
+    'airline_row_lock_wait_seconds', 'Time spent acquiring row locks in booking services', ('operation',),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+# Seat ids in the SQL of a waiting session (psycopg2 interpolates parameters client side)
+SEAT_ID_RE = re.compile(r'"airline_seats"\."id" = (\d+)')
+
+WAITING_SESSIONS_SQL = """
+    SELECT a.pid,
+           pg_blocking_pids(a.pid),
+           a.wait_event_type,
+           a.wait_event,
+           EXTRACT(EPOCH FROM now() - COALESCE(a.state_change, a.query_start)) * 1000,
+           a.query,
+           (SELECT string_agg(DISTINCT l.relation::regclass::text, ',')
+              FROM pg_locks l WHERE l.pid = a.pid AND l.relation IS NOT NULL)
+    FROM pg_stat_activity a
+    WHERE a.datname = current_database()
+      AND a.wait_event_type = 'Lock'
+"""
+
+
+def _emit(event):
+    contention_logger.info(json.dumps(event, default=str))
+
+
+def record_lock_wait(operation, seat, started):
+    """Record the time since ``started`` spent acquiring ``seat``'s row lock.
+
+    The locking query's own cost is included, which is negligible next to
+    any real wait.
+    """
+    waited = time.perf_counter() - started
+    ROW_LOCK_WAIT_SECONDS.observe(waited, operation=operation)
+    if seat is not None and waited * 1000 >= settings.LOCK_WAIT_LOG_MS:
+        _emit({
+            'kind': 'lock_wait',
+            'at': datetime.now(dt_timezone.utc).isoformat(),
+            'operation': operation,
+            'flight_id': seat.flight_id,
+            'seat_id': seat.id,
+            'wait_ms': round(waited * 1000, 3),
+        })
+
+
+def sample_waiting_sessions():
+    """Sessions currently blocked on a lock, per pg_stat_activity and pg_locks"""
+    if connection.vendor != 'postgresql':
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(WAITING_SESSIONS_SQL)
+        rows = cursor.fetchall()
+
+    now = datetime.now(dt_timezone.utc).isoformat()
+    samples = []
+    for pid, blocked_by, wait_type, wait_event, wait_ms, query, relations in rows:
+        match = SEAT_ID_RE.search(query or '')
+        sample = {
+            'kind': 'pg_wait',
+            'at': now,
+            'pid': pid,
+            'blocked_by': list(blocked_by or []),
+            'wait_event': f'{wait_type}:{wait_event}',
+            'wait_ms': round(float(wait_ms or 0), 3),
+            'relations': relations.split(',') if relations else [],
+            'seat_id': int(match.group(1)) if match else None,
+            'query': (query or '')[:300],
+        }
+        samples.append(sample)
+        _emit(sample)
+    return samples
+
+
+def read_events(since=None, path=None):
+    """Contention events from logs/contention.ndjson and its rotated .gz files"""
+    path = path or str(settings.BASE_DIR / 'logs' / 'contention.ndjson')
+    events = []
+    for filename in sorted(glob.glob(f'{path}*')):
+        opener = gzip.open if filename.endswith('.gz') else open
+        try:
+            with opener(filename, 'rt') as handle:
+                for line in handle:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue
+                    if since is None or datetime.fromisoformat(event['at']) >= since:
+                        events.append(event)
+        except OSError as e:
+            logger.warning(f"Could not read contention log {filename}: {e}")
+    return events
+
+
+def _rank(groups, top):
+    ranked = sorted(groups.values(), key=lambda group: group['total_wait_ms'], reverse=True)[:top]
+    for group in ranked:
+        waits = sorted(group.pop('waits'))
+        group['p95_wait_ms'] = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0
+    return ranked
+
+
+def contention_report(events, top=10):
+    """Hottest flights and seats by total lock wait, with pg_locks sightings alongside"""
+    from .models import Seat
+
+    pg_seat_ids = {e['seat_id'] for e in events if e['kind'] == 'pg_wait' and e.get('seat_id')}
+    seat_flights = dict(Seat.objects.filter(id__in=pg_seat_ids).values_list('id', 'flight_id'))
+
+    flights, seats = {}, {}
+    for event in events:
+        if event['kind'] == 'lock_wait':
+            flight_id, seat_id = event['flight_id'], event['seat_id']
+        elif event.get('seat_id'):
+            seat_id = event['seat_id']
+            flight_id = seat_flights.get(seat_id)
+        else:
+            continue
+        for groups, key in ((flights, flight_id), (seats, seat_id)):
+            if key is None:
+                continue
+            group = groups.setdefault(key, {
+                'id': key, 'flight_id': flight_id, 'waits': [], 'total_wait_ms': 0.0,
+                'max_wait_ms': 0.0, 'lock_waits': 0, 'pg_sightings': 0,
+            })
+            if event['kind'] == 'lock_wait':
+                group['lock_waits'] += 1
+                group['waits'].append(event['wait_ms'])
+                group['total_wait_ms'] += event['wait_ms']
+                group['max_wait_ms'] = max(group['max_wait_ms'], event['wait_ms'])
+            else:
+                group['pg_sightings'] += 1
+                group['max_wait_ms'] = max(group['max_wait_ms'], event['wait_ms'])
+    return {'flights': _rank(flights, top), 'seats': _rank(seats, top)}
+
+
+def since_hours(hours):
+    return datetime.now(dt_timezone.utc) - timedelta(hours=hours)
@@ -0,0 +1,270 @@
+import functools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.http import HttpResponse
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger('bookings')
+
+PRIMARY = 'default'
+PIN_SESSION_KEY = 'pin_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class _ReadState:
+    def __init__(self, replica_ok=False):
+        self.replica_ok = replica_ok
+        self.wrote = False
+
+
+_read_state = ContextVar('read_state', default=None)
+
+
+@contextmanager
+def use_replica():
+    """Allow reads inside the block to go to a replica"""
+    token = _read_state.set(_ReadState(replica_ok=True))
+    try:
+        yield
+    finally:
+        _read_state.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """Force every read inside the block onto the primary"""
+    token = _read_state.set(_ReadState(replica_ok=False))
+    try:
+        yield
+    finally:
+        _read_state.reset(token)
+
+
+_workload = ContextVar('db_workload', default=None)
+
+# SQLSTATEs raised when statement_timeout / lock_timeout cancel a statement
+QUERY_CANCELED = '57014'
+LOCK_NOT_AVAILABLE = '55P03'
+
+
+@contextmanager
+def use_workload(name):
+    """Run reads inside the block on the ``name`` workload's connection (see DB_WORKLOADS)"""
+    if name not in settings.DB_WORKLOADS:
+        raise ValueError(f"Unknown DB workload {name!r}")
+    token = _workload.set(name)
+    try:
+        yield
+    finally:
+        _workload.reset(token)
+
+
+def _pgcode(exc):
+    return getattr(exc.__cause__, 'pgcode', None)
+
+
+def is_statement_timeout(exc):
+    return isinstance(exc, OperationalError) and _pgcode(exc) == QUERY_CANCELED
+
+
+def is_lock_timeout(exc):
+    return isinstance(exc, OperationalError) and _pgcode(exc) == LOCK_NOT_AVAILABLE
+
+
+def workload(name):
+    """View decorator binding the view's reads to a workload class.
+
+    A statement the workload's statement_timeout cancels becomes a 503 rather
+    than a server error.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            with use_workload(name):
+                try:
+                    return view(request, *args, **kwargs)
+                except OperationalError as e:
+                    if not is_statement_timeout(e):
+                        raise
+                    timeout = settings.DB_WORKLOADS[name]['statement_timeout_ms']
+                    logger.warning("%s query cancelled after %sms in %s: %s", name, timeout, request.path, e)
+                    return HttpResponse(
+                        f"This page took longer than {timeout / 1000:g}s to query and was cancelled. Try a narrower filter.",
+                        status=503, content_type='text/plain',
+                    )
+        return wrapped
+    return decorator
+
+
+def bound_transaction(name='transactional'):
+    """Apply the ``name`` workload's statement and lock timeouts to the current transaction.
+
+    The default connection has none of its own, so migrations and management
+    commands run unbounded; booking and payment transactions call this to opt in.
+    """
+    connection = connections[PRIMARY]
+    if connection.vendor != 'postgresql' or not connection.in_atomic_block:
+        return
+    workload = settings.DB_WORKLOADS[name]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config('statement_timeout', %s, true), set_config('lock_timeout', %s, true)",
+            [str(workload['statement_timeout_ms']), str(workload['lock_timeout_ms'])],
+        )
+
+
+def workload_alias():
+    """Alias the current workload reads from; the primary inside a primary transaction"""
+    name = _workload.get()
+    if name is None or connections[PRIMARY].in_atomic_block:
+        return PRIMARY
+    alias = settings.DB_WORKLOADS[name]['alias']
+    return alias if alias in settings.DATABASES else PRIMARY
+
+
+_lag_cache = {}
+_lag_lock = threading.Lock()
+
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def replica_lag(alias):
+    """Replication lag of a replica in seconds, cached for REPLICA_LAG_CHECK_SECONDS"""
+    now = time.monotonic()
+    with _lag_lock:
+        cached = _lag_cache.get(alias)
+        if cached and now - cached[0] < settings.REPLICA_LAG_CHECK_SECONDS:
+            return cached[1]
+
+    lag = 0.0
+    conn = connections[alias]
+    if conn.vendor == 'postgresql':
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                lag = float(cursor.fetchone()[0])
+        except Exception as e:
+            logger.warning(f"Lag check failed for replica {alias}: {e}")
+            lag = float('inf')
+
+    with _lag_lock:
+        _lag_cache[alias] = (now, lag)
+    if lag > settings.REPLICA_MAX_LAG_SECONDS:
+        logger.warning(f"Replica {alias} lagging {lag:.1f}s, reading from primary")
+    return lag
+
+
+def healthy_replicas():
+    return [
+        alias for alias in settings.REPLICA_DATABASES
+        if replica_lag(alias) <= settings.REPLICA_MAX_LAG_SECONDS
+    ]
+
+
+class PrimaryReplicaRouter:
+    """Sends reads from opted-in read-only code paths to a replica, else to the bound workload's alias.
+
+    Everything else, including any read inside an atomic block (services,
+    select_for_update), stays on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _read_state.get()
+        if not settings.REPLICA_DATABASES or state is None or not state.replica_ok:
+            return workload_alias()
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        replicas = healthy_replicas()
+        return random.choice(replicas) if replicas else workload_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _read_state.get()
+        if state is not None:
+            # The rest of this request, and the session's next few, read the primary
+            state.wrote = True
+            state.replica_ok = False
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {
+            PRIMARY, *settings.REPLICA_DATABASES,
+            *(workload['alias'] for workload in settings.DB_WORKLOADS.values()),
+        }
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReadYourWritesMiddleware:
+    """Lets REPLICA_READ_VIEWS read from replicas unless the session recently wrote"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = _ReadState()
+        token = _read_state.set(state)
+        try:
+            response = self.get_response(request)
+            if state.wrote or request.method not in SAFE_METHODS:
+                self._pin(request)
+            return response
+        finally:
+            _read_state.reset(token)
+
+    async def __acall__(self, request):
+        state = _ReadState()
+        token = _read_state.set(state)
+        try:
+            response = await self.get_response(request)
+            if state.wrote or request.method not in SAFE_METHODS:
+                # The session may still have to be loaded from the database
+                await sync_to_async(self._pin)(request)
+            return response
+        finally:
+            _read_state.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _read_state.get()
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        if (
+            state is not None
+            and request.method in SAFE_METHODS
+            and url_name in settings.REPLICA_READ_VIEWS
+            and not self._pinned(request)
+        ):
+            state.replica_ok = True
+        return None
+
+    def _pinned(self, request):
+        session = getattr(request, 'session', None)
+        if session is None:
+            return False
+        until = session.get(PIN_SESSION_KEY)
+        return until is not None and until > timezone.now().timestamp()
+
+    def _pin(self, request):
+        session = getattr(request, 'session', None)
+        if session is not None and settings.REPLICA_DATABASES:
+            session[PIN_SESSION_KEY] = timezone.now().timestamp() + settings.READ_YOUR_WRITES_SECONDS
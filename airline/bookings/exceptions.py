@@ -16,4 +16,8 @@ class PaymentError(BookingError):
 
 class BookingExpiredError(BookingError):
     """Raised when trying to operate on an expired booking"""
-    pass
\ No newline at end of file
+    pass
+
+class ConcurrentUpdateError(BookingError):
+    """Raised when a booking transaction keeps losing to concurrent ones"""
+    pass
@@ -0,0 +1,171 @@
+import hashlib
+import time
+from datetime import date as date_cls, datetime, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, IntegerField, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.utils import timezone
+from .airports import resolve_airports
+from .metrics import counter
+from .models import Flight, Seat
+from .pricing import fare_expression, pricing_key
+import logging
+
+logger = logging.getLogger('bookings')
+
+FARE_CALENDAR_REQUESTS = counter('airline_fare_calendar_requests_total', 'Fare calendar lookups, by cache outcome', ('cache',))
+
+
+def _version_key(origin_id, destination_id):
+    return f"fare_calendar:version:{origin_id}:{destination_id}"
+
+
+def route_version(origins, destinations):
+    """Current cache version of every (origin, destination) airport pair, as one string"""
+    keys = [_version_key(o, d) for o in sorted(origins) for d in sorted(destinations)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Seeded from the clock, so a version evicted from the cache never comes back as an old value
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def invalidate_route(origin_id, destination_id):
+    """Drop every cached calendar for one airport pair by moving its version on"""
+    if origin_id is None or destination_id is None:
+        return
+    key = _version_key(origin_id, destination_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def invalidate_flight(flight_id, flight=None):
+    """Invalidate the calendar of the route ``flight_id`` flies once the current transaction commits"""
+    def invalidate():
+        if flight is not None:
+            route = (flight.origin_airport_id, flight.destination_airport_id)
+        else:
+            route = Flight.objects.filter(id=flight_id).values_list('origin_airport_id', 'destination_airport_id').first()
+        if route:
+            invalidate_route(*route)
+    transaction.on_commit(invalidate)
+
+
+def _calendar(origins, destinations, first_day, last_day, passengers):
+    """Per-day lowest fare and seats for the route from one grouped query; days without flights included"""
+    start = max(timezone.make_aware(datetime.combine(first_day, datetime.min.time())), timezone.now())
+    end = timezone.make_aware(datetime.combine(last_day + timedelta(days=1), datetime.min.time()))
+    free_seats = (
+        Seat.objects.filter(flight=OuterRef('pk'), is_booked=False)
+        .order_by().values('flight').annotate(n=Count('id')).values('n')
+    )
+    bookable = Q(free__gte=passengers)
+    rows = (
+        Flight.objects.filter(
+            is_active=True,
+            origin_airport_id__in=origins,
+            destination_airport_id__in=destinations,
+            departure_time__gte=start,
+            departure_time__lt=end,
+        )
+        .annotate(
+            free=Coalesce(Subquery(free_seats, output_field=IntegerField()), 0),
+            fare=fare_expression(),
+            day=TruncDate('departure_time'),
+        )
+        .values('day')
+        .annotate(
+            lowest_fare=Min('fare', filter=bookable),
+            flights=Count('id'),
+            bookable_flights=Count('id', filter=bookable),
+            seats_available=Sum('free'),
+        )
+        .order_by('day')
+    )
+    by_day = {row['day']: row for row in rows}
+
+    days = []
+    day = first_day
+    while day <= last_day:
+        row = by_day.get(day, {})
+        days.append({
+            'date': day.isoformat(),
+            'lowest_fare': f"{row['lowest_fare']:.2f}" if row.get('lowest_fare') is not None else None,
+            'flights': row.get('flights', 0),
+            'bookable_flights': row.get('bookable_flights', 0),
+            'seats_available': row.get('seats_available') or 0,
+            'available': bool(row.get('bookable_flights')),
+        })
+        day += timedelta(days=1)
+    return days
+
+
+def fare_calendar(origin, destination, center, days=None, passengers=1):
+    """Lowest available fare and seats per day for ``center`` ± ``days``, cached per route"""
+    days = settings.FARE_CALENDAR_DAYS if days is None else days
+    origins, destinations = resolve_airports(origin), resolve_airports(destination)
+    if not origins or not destinations:
+        return []
+    first_day = max(center - timedelta(days=days), timezone.localdate())
+    last_day = center + timedelta(days=days)
+    if last_day < first_day:
+        return []
+
+    # Hashed: a short prefix can resolve to many airports
+    route = hashlib.sha1(f"{sorted(origins)}:{sorted(destinations)}".encode()).hexdigest()
+    # Repricing moves pricing_key on, so cached fares never outlive the run that set them
+    key = f"fare_calendar:{route}:{route_version(origins, destinations)}:{pricing_key()}:{first_day}:{last_day}:{passengers}"
+    calendar = cache.get(key)
+    if calendar is None:
+        FARE_CALENDAR_REQUESTS.inc(cache='miss')
+        calendar = _calendar(origins, destinations, first_day, last_day, passengers)
+        cache.set(key, calendar, settings.FARE_CALENDAR_CACHE_SECONDS)
+    else:
+        FARE_CALENDAR_REQUESTS.inc(cache='hit')
+    return calendar
+
+
+def fare_calendar_view(request):
+    """JSON fare calendar for ``?origin=&destination=&date=YYYY-MM-DD&days=N&passengers=N``"""
+    origin = request.GET.get('origin', '').strip()
+    destination = request.GET.get('destination', '').strip()
+    if not origin or not destination:
+        return HttpResponseBadRequest('origin and destination are required')
+    try:
+        center = date_cls.fromisoformat(request.GET.get('date', '')) if request.GET.get('date') else timezone.localdate()
+        days = min(max(int(request.GET.get('days', settings.FARE_CALENDAR_DAYS)), 0), settings.FARE_CALENDAR_MAX_DAYS)
+        passengers = min(max(int(request.GET.get('passengers', 1)), 1), 9)
+    except ValueError:
+        return HttpResponseBadRequest('date must be YYYY-MM-DD; days and passengers must be integers')
+
+    try:
+        calendar = fare_calendar(origin, destination, center, days, passengers)
+    except OverflowError:
+        # center ± days runs past the first or last representable date
+        return HttpResponseBadRequest('date is out of range')
+    return JsonResponse({
+        'origin': origin,
+        'destination': destination,
+        'date': center.isoformat(),
+        'passengers': passengers,
+        'days': calendar,
+    })
+
+
+def calendar_for_search(origin, destination, date, passengers):
+    """The flight list's date strip: the searched day ± FARE_CALENDAR_DAYS, or [] without a full route"""
+    if not (origin and destination):
+        return []
+    try:
+        center = date_cls.fromisoformat(date) if date else timezone.localdate()
+        passengers = min(max(int(passengers or 1), 1), 9)
+        return fare_calendar(origin, destination, center, passengers=passengers)
+    except (ValueError, OverflowError):
+        return []
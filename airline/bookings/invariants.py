@@ -0,0 +1,90 @@
+from django.db import connection
+from django.utils import timezone
+
+# States in which a booking still owns its seat. SEAT_HELD only counts while
+# the hold has not run out.
+LIVE_STATES = ('PAYMENT_PENDING', 'CONFIRMED')
+
+
+def _fetch(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _flight_filter(column, flight_ids):
+    if not flight_ids:
+        return '', []
+    placeholders = ', '.join(['%s'] * len(flight_ids))
+    return f' AND {column} IN ({placeholders})', list(flight_ids)
+
+
+def find_double_bookings(flight_ids=None, now=None):
+    """Seats with more than one live booking"""
+    now = now or timezone.now()
+    flight_sql, flight_params = _flight_filter('s.flight_id', flight_ids)
+    sql = f"""
+        SELECT b.seat_id, s.flight_id, s.seat_number, COUNT(*) AS live_bookings
+        FROM airline_bookings b
+        JOIN airline_seats s ON s.id = b.seat_id
+        WHERE (b.state IN (%s, %s) OR (b.state = 'SEAT_HELD' AND b.seat_hold_until > %s))
+        {flight_sql}
+        GROUP BY b.seat_id, s.flight_id, s.seat_number
+        HAVING COUNT(*) > 1
+        ORDER BY b.seat_id
+    """
+    return _fetch(sql, [*LIVE_STATES, now, *flight_params])
+
+
+def find_is_booked_mismatches(flight_ids=None):
+    """Seats whose is_booked flag disagrees with their CONFIRMED bookings"""
+    flight_sql, flight_params = _flight_filter('s.flight_id', flight_ids)
+    sql = f"""
+        SELECT s.id AS seat_id, s.flight_id, s.seat_number, s.is_booked,
+               COUNT(b.id) AS confirmed_bookings
+        FROM airline_seats s
+        LEFT JOIN airline_bookings b ON b.seat_id = s.id AND b.state = 'CONFIRMED'
+        WHERE 1 = 1 {flight_sql}
+        GROUP BY s.id, s.flight_id, s.seat_number, s.is_booked
+        HAVING (s.is_booked = %s AND COUNT(b.id) = 0)
+            OR (s.is_booked = %s AND COUNT(b.id) > 0)
+        ORDER BY s.id
+    """
+    return _fetch(sql, [*flight_params, True, False])
+
+
+def find_inventory_mismatches(flight_ids=None):
+    """Flights whose booked seat count differs from their CONFIRMED booking count"""
+    flight_sql, flight_params = _flight_filter('f.id', flight_ids)
+    sql = f"""
+        SELECT f.id AS flight_id, f.code, inventory.total_seats, inventory.booked_seats,
+               COALESCE(confirmed.confirmed_bookings, 0) AS confirmed_bookings
+        FROM airline_flights f
+        JOIN (
+            SELECT flight_id, COUNT(*) AS total_seats,
+                   SUM(CASE WHEN is_booked THEN 1 ELSE 0 END) AS booked_seats
+            FROM airline_seats
+            GROUP BY flight_id
+        ) inventory ON inventory.flight_id = f.id
+        LEFT JOIN (
+            SELECT s.flight_id, COUNT(*) AS confirmed_bookings
+            FROM airline_bookings b
+            JOIN airline_seats s ON s.id = b.seat_id
+            WHERE b.state = 'CONFIRMED'
+            GROUP BY s.flight_id
+        ) confirmed ON confirmed.flight_id = f.id
+        WHERE inventory.booked_seats <> COALESCE(confirmed.confirmed_bookings, 0)
+        {flight_sql}
+        ORDER BY f.id
+    """
+    return _fetch(sql, flight_params)
+
+
+def check_invariants(flight_ids=None, now=None):
+    """Run every seat/booking invariant and return the violations keyed by check name"""
+    return {
+        'double_booking': find_double_bookings(flight_ids, now),
+        'is_booked_mismatch': find_is_booked_mismatches(flight_ids),
+        'inventory_mismatch': find_inventory_mismatches(flight_ids),
+    }
@@ -0,0 +1,220 @@
+import importlib
+import os
+import random
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from .metrics import counter, histogram
+from .models import Job, JobStatus
+import logging
+
+logger = logging.getLogger('bookings')
+
+JOBS = counter('airline_jobs_total', 'Background jobs finished, by outcome', ('queue', 'task', 'result'))
+JOB_SECONDS = histogram('airline_job_seconds', 'Background job run time', ('queue', 'task'))
+JOB_QUEUE_DELAY_SECONDS = histogram(
+    'airline_job_queue_delay_seconds', 'Time from a job being due to a worker starting it', ('queue',),
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600),
+)
+
+_tasks = {}
+_tasks_loaded = False
+
+
+class Task:
+    def __init__(self, name, func, queue, max_attempts):
+        self.name = name
+        self.func = func
+        self.queue = queue
+        self.max_attempts = max_attempts
+
+
+def task(name, queue='default', max_attempts=None):
+    """Register a function as a job task; its keyword arguments must be JSON-serializable"""
+    def decorator(func):
+        _tasks[name] = Task(name, func, queue, max_attempts or settings.JOB_DEFAULT_MAX_ATTEMPTS)
+        return func
+    return decorator
+
+
+def get_task(name):
+    global _tasks_loaded
+    if not _tasks_loaded:
+        importlib.import_module('bookings.tasks')
+        _tasks_loaded = True
+    try:
+        return _tasks[name]
+    except KeyError:
+        raise LookupError(f"Unknown job task {name!r}")
+
+
+def enqueue(task_name, kwargs=None, queue=None, priority=0, delay=None, run_at=None, max_attempts=None):
+    """Queue a job. Inside a transaction it only becomes visible to workers on commit."""
+    registered = get_task(task_name)
+    return Job.objects.create(
+        task=task_name,
+        kwargs=kwargs or {},
+        queue=queue or registered.queue,
+        priority=priority,
+        run_at=run_at or timezone.now() + (delay or timedelta(0)),
+        max_attempts=max_attempts or registered.max_attempts,
+    )
+
+
+def retry_delay(attempts):
+    """Exponential backoff with +/-20% jitter, capped at JOB_RETRY_MAX_SECONDS"""
+    delay = min(settings.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def _lock_queue(queue):
+    # Serializes claimers of one concurrency-limited queue across processes;
+    # SQLite already serializes writers
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [f'background_jobs:{queue}'])
+
+
+def claim(queues, limit, worker_id):
+    """Mark up to ``limit`` due jobs RUNNING for this worker, SKIP LOCKED so workers never wait on each other"""
+    claimed = []
+    for queue in queues:
+        wanted = limit - len(claimed)
+        if wanted <= 0:
+            break
+        with transaction.atomic():
+            cap = settings.JOB_QUEUE_CONCURRENCY.get(queue)
+            if cap is not None:
+                _lock_queue(queue)
+                wanted = min(wanted, cap - Job.objects.filter(queue=queue, status=JobStatus.RUNNING).count())
+                if wanted <= 0:
+                    continue
+            jobs = list(
+                Job.objects.select_for_update(skip_locked=True)
+                .filter(queue=queue, status=JobStatus.QUEUED, run_at__lte=timezone.now())
+                .order_by('-priority', 'run_at', 'id')[:wanted]
+            )
+            now = timezone.now()
+            for job in jobs:
+                job.status = JobStatus.RUNNING
+                job.locked_by = worker_id
+                job.locked_at = now
+                job.attempts += 1
+            Job.objects.bulk_update(jobs, ['status', 'locked_by', 'locked_at', 'attempts'])
+            claimed.extend(jobs)
+    return claimed
+
+
+def _finish(job, **fields):
+    # Only the worker still holding the lease may record the outcome
+    updated = Job.objects.filter(id=job.id, status=JobStatus.RUNNING, locked_by=job.locked_by).update(
+        locked_by='', locked_at=None, **fields,
+    )
+    if not updated:
+        logger.warning(f"Job {job.id} {job.task} outcome not recorded: its lease expired and it was requeued")
+    return updated
+
+
+def execute(job):
+    """Run a claimed job and record success, a retry or the dead letter"""
+    started = time.perf_counter()
+    JOB_QUEUE_DELAY_SECONDS.observe(max((job.locked_at - job.run_at).total_seconds(), 0), queue=job.queue)
+    try:
+        get_task(job.task).func(**job.kwargs)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"[:2000]
+        if job.attempts >= job.max_attempts:
+            _finish(job, status=JobStatus.DEAD, last_error=error, finished_at=timezone.now())
+            result = 'dead'
+            logger.error(f"Job {job.id} {job.task} dead after {job.attempts} attempts: {error}")
+        else:
+            run_at = timezone.now() + retry_delay(job.attempts)
+            _finish(job, status=JobStatus.QUEUED, last_error=error, run_at=run_at)
+            result = 'retry'
+            logger.warning(f"Job {job.id} {job.task} attempt {job.attempts} failed, retrying at {run_at}: {error}")
+    else:
+        _finish(job, status=JobStatus.SUCCEEDED, last_error='', finished_at=timezone.now())
+        result = 'succeeded'
+    finally:
+        JOB_SECONDS.observe(time.perf_counter() - started, queue=job.queue, task=job.task)
+        # Worker threads each hold their own connection
+        close_old_connections()
+    JOBS.inc(queue=job.queue, task=job.task, result=result)
+    return result
+
+
+def requeue_stale():
+    """Put RUNNING jobs whose worker stopped renewing (crashed or killed) back on the queue"""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LEASE_SECONDS)
+    stale = Job.objects.filter(status=JobStatus.RUNNING, locked_at__lt=cutoff)
+    dead = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=JobStatus.DEAD, locked_by='', locked_at=None, finished_at=timezone.now(),
+        last_error='Worker lease expired',
+    )
+    requeued = stale.update(status=JobStatus.QUEUED, locked_by='', locked_at=None, last_error='Worker lease expired')
+    if dead or requeued:
+        logger.warning(f"Recovered stale jobs: {requeued} requeued, {dead} dead")
+    return requeued, dead
+
+
+def prune_finished():
+    """Delete succeeded jobs older than JOB_RETENTION_DAYS; dead ones stay until requeued or removed"""
+    cutoff = timezone.now() - timedelta(days=settings.JOB_RETENTION_DAYS)
+    deleted, _ = Job.objects.filter(status=JobStatus.SUCCEEDED, finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def renew_leases(worker_id, job_ids):
+    if job_ids:
+        Job.objects.filter(id__in=job_ids, status=JobStatus.RUNNING, locked_by=worker_id).update(locked_at=timezone.now())
+
+
+def schedule_periodic():
+    """Queue the next run of each JOB_SCHEDULE task that has none queued or running"""
+    for task_name, interval in settings.JOB_SCHEDULE.items():
+        registered = get_task(task_name)
+        with transaction.atomic():
+            _lock_queue(f'schedule:{task_name}')
+            if Job.objects.filter(task=task_name, status__in=[JobStatus.QUEUED, JobStatus.RUNNING]).exists():
+                continue
+            last = Job.objects.filter(task=task_name).aggregate(last=Max('finished_at'))['last']
+            run_at = max(timezone.now(), last + timedelta(seconds=interval)) if last else timezone.now()
+            enqueue(task_name, queue=registered.queue, run_at=run_at)
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def run_worker(queues, concurrency=4, interval=1.0, once=False):
+    """Claim and run jobs on a thread pool until interrupted (or, with ``once``, until nothing is due)"""
+    me = worker_id()
+    running = {}
+    last_housekeeping = 0
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='job') as pool:
+        while True:
+            if time.monotonic() - last_housekeeping >= settings.JOB_LEASE_SECONDS / 4:
+                renew_leases(me, [job.id for job in running.values()])
+                requeue_stale()
+                prune_finished()
+                schedule_periodic()
+                last_housekeeping = time.monotonic()
+
+            free = concurrency - len(running)
+            for job in claim(queues, free, me) if free else []:
+                running[pool.submit(execute, job)] = job
+
+            if not running:
+                if once:
+                    return
+                time.sleep(interval)
+                continue
+            done, _ = wait(running, timeout=interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                running.pop(future)
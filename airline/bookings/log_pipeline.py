@@ -0,0 +1,156 @@
+import atexit
+import gzip
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+
+# Records buffered between request threads and the writer before new ones are dropped
+QUEUE_SIZE = 10000
+
+
+class CompressedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Size-based rotation that gzips each rotated file (airline.log.1.gz, ...)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.namer = self._gz_name
+        self.rotator = self._gzip_rotate
+
+    @staticmethod
+    def _gz_name(name):
+        return f'{name}.gz'
+
+    @staticmethod
+    def _gzip_rotate(source, dest):
+        with open(source, 'rb') as plain, gzip.open(dest, 'wb') as compressed:
+            shutil.copyfileobj(plain, compressed)
+        os.remove(source)
+
+
+class SampleFilter(logging.Filter):
+    """Keeps one in N records below ``level`` per logger; everything else passes.
+
+    ``rates`` maps logger names to N; a record takes the rate of the nearest
+    listed name in its logger's dotted path, so {'bookings': 10} keeps every
+    tenth DEBUG record. Python runs a logger's filters only for records logged
+    on that logger itself, not ones propagated from its children. Attached to
+    the 'bookings' logger, as in settings, it drops records before they are
+    queued; attach it to a handler instead to also sample child loggers.
+    """
+
+    def __init__(self, rates=None, level=logging.INFO):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self.level = level
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _rate(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return self.rates.get('', 1)
+
+    def filter(self, record):
+        if record.levelno >= self.level:
+            return True
+        counter = self._counters.get(record.name)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(record.name, itertools.count())
+        rate = self._rate(record.name)
+        return rate <= 1 or next(counter) % rate == 0
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread unformatted.
+
+    The stock QueueHandler formats every message in the caller so the record
+    can be pickled; the listener here lives in the same process, so message
+    interpolation and formatting happen on the writer thread instead.
+    """
+
+    def __init__(self, record_queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block a request on logging; the drop is counted instead
+            self.dropped += 1
+
+
+_listeners = []
+_listener_pid = None
+_lock = threading.Lock()
+
+
+def install(logger_names=('',)):
+    """Move the handlers of the given loggers behind queues drained by background writers.
+
+    Loggers sharing the same handlers share one queue and writer thread.
+    Called from BookingsConfig.ready() once settings.LOGGING has been applied.
+    Safe to call again, e.g. after a fork, where it starts fresh writer threads.
+    """
+    global _listener_pid
+    with _lock:
+        if _listeners and _listener_pid == os.getpid():
+            return _listeners
+
+        if _listeners:
+            # Forked child: the parent's writer threads (and queue locks) did not come along
+            routes = [(listener.queue_handler, listener.handlers) for listener in _listeners]
+            for queue_handler, _ in routes:
+                queue_handler.queue = queue.Queue(QUEUE_SIZE)
+        else:
+            groups = {}
+            for name in logger_names:
+                logger = logging.getLogger(name)
+                if logger.handlers:
+                    groups.setdefault(tuple(logger.handlers), []).append(logger)
+            routes = []
+            for handlers, loggers in groups.items():
+                queue_handler = LazyQueueHandler(queue.Queue(QUEUE_SIZE))
+                for logger in loggers:
+                    logger.handlers = [queue_handler]
+                routes.append((queue_handler, handlers))
+
+        _listeners.clear()
+        for queue_handler, handlers in routes:
+            listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+            listener.queue_handler = queue_handler
+            listener.start()
+            _listeners.append(listener)
+        _listener_pid = os.getpid()
+        return _listeners
+
+
+def flush():
+    """Stop the writers once they have drained their queues"""
+    global _listener_pid
+    with _lock:
+        if _listeners and _listener_pid == os.getpid():
+            for listener in _listeners:
+                listener.stop()
+            _listener_pid = None
+
+
+def _restart_in_child():
+    global _lock
+    _lock = threading.Lock()
+    if _listeners and _listener_pid is not None:
+        install()
+
+
+atexit.register(flush)
+os.register_at_fork(after_in_child=_restart_in_child)
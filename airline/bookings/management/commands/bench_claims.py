@@ -0,0 +1,60 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection
+from bookings.coalescer import submit_claim
+from bookings.models import Booking, BookingEvent, OutboxMessage
+from bookings.services import create_booking
+from bookings.stress import create_stress_flight
+
+
+class Command(BaseCommand):
+    help = 'Compare seat claims per second on one hot flight: a transaction per claim vs the per-flight coalescer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--claims', type=int, default=300, help='Claims per mode, each on its own seat')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent callers')
+
+    def handle(self, *args, **options):
+        for mode, claim in (('direct', create_booking), ('coalesced', submit_claim)):
+            flight = create_stress_flight(options['claims'])
+            seat_ids = list(flight.seats.values_list('id', flat=True))
+            try:
+                result = self._run(claim, seat_ids, options['concurrency'])
+            finally:
+                booking_ids = list(Booking.objects.filter(seat__flight=flight).values_list('id', flat=True))
+                OutboxMessage.objects.filter(booking_id__in=booking_ids).delete()
+                BookingEvent.objects.filter(data__flight_id=flight.id).delete()
+                flight.delete()
+            self.stdout.write(
+                f"{mode:<10} {result['ok']:>5} ok {result['failed']:>4} failed  {result['cps']:>8.1f} claims/s  "
+                f"p50 {result['p50_ms']:>7.2f} ms  p95 {result['p95_ms']:>7.2f} ms"
+            )
+
+    def _run(self, claim, seat_ids, concurrency):
+        def call(seat_id):
+            started = time.perf_counter()
+            try:
+                claim(seat_id, {'passenger_name': 'Bench', 'passenger_email': f'bench{seat_id}@example.com'})
+                ok = True
+            except Exception:
+                ok = False
+            finally:
+                connection.close()
+            return ok, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(call, seat_ids))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for _, latency in results)
+        ok = sum(1 for success, _ in results if success)
+        return {
+            'ok': ok,
+            'failed': len(results) - ok,
+            'cps': ok / elapsed if elapsed else 0,
+            'p50_ms': statistics.median(latencies) * 1000,
+            'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        }
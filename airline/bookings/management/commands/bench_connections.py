@@ -0,0 +1,73 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from bookings.routes import Leg, RouteGraph, build_graph
+
+
+def synthetic_graph(flights, airports, hubs, days, seed):
+    """A hub-and-spoke network: most flights touch one of the first ``hubs`` airports"""
+    rng = random.Random(seed)
+    countries = ['India', 'India', 'India', 'United States', 'United Kingdom']
+    graph = RouteGraph({a: (f'A{a:02d}', f'City {a}', countries[a % len(countries)]) for a in range(airports)})
+    start = timezone.now().timestamp()
+    for flight_id in range(1, flights + 1):
+        origin = rng.randrange(airports)
+        destination = rng.randrange(hubs) if rng.random() < 0.7 else rng.randrange(airports)
+        if rng.random() < 0.5:
+            origin, destination = destination, origin
+        if origin == destination:
+            destination = (destination + 1) % airports
+        departs = start + rng.uniform(0, days * 86400)
+        graph.add(Leg(
+            flight_id, f'AI{flight_id % 10000:04d}', 'AI', origin, destination,
+            departs, departs + rng.uniform(3600, 5 * 3600), Decimal(rng.randrange(80, 900)),
+        ))
+    return graph
+
+
+class Command(BaseCommand):
+    help = 'Time 0-2 stop itinerary searches over the route graph (synthetic by default)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, default=30000, help='Synthetic flights in the graph')
+        parser.add_argument('--airports', type=int, default=150, help='Synthetic airports')
+        parser.add_argument('--hubs', type=int, default=8, help='Synthetic hub airports most flights touch')
+        parser.add_argument('--days', type=int, default=14, help='Days of schedule the flights spread over')
+        parser.add_argument('--queries', type=int, default=200, help='Searches to time')
+        parser.add_argument('--sort', choices=('arrival', 'price'), default='arrival')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--from-db', action='store_true', help='Search the graph built from this database instead')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['from_db']:
+            graph, _ = build_graph()
+        else:
+            graph = synthetic_graph(options['flights'], options['airports'], options['hubs'], options['days'], options['seed'])
+        built = time.perf_counter() - started
+        airports = sorted(graph.outbound.keys() | graph.inbound.keys())
+        if len(airports) < 2:
+            raise CommandError('The graph needs flights between at least two airports')
+        self.stdout.write(f"Graph: {len(graph.legs)} flights, {len(graph.pairs)} routes, {len(airports)} airports, built in {built:.2f}s")
+
+        rng = random.Random(options['seed'])
+        now = timezone.now().timestamp()
+        latencies, results = [], []
+        for _ in range(options['queries']):
+            origin, destination = rng.sample(airports, 2)
+            day = now + rng.randrange(max(options['days'] - 1, 1)) * 86400
+            started = time.perf_counter()
+            found = graph.search([origin], [destination], day, day + 86400, 2, options['sort'], 20)
+            latencies.append(time.perf_counter() - started)
+            results.append(len(found))
+
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f"{len(latencies)} searches: p50 {statistics.median(latencies) * 1000:.2f}ms, "
+            f"p99 {p99 * 1000:.2f}ms, max {latencies[-1] * 1000:.2f}ms, "
+            f"{statistics.mean(results):.1f} itineraries on average"
+        )
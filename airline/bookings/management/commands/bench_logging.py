@@ -0,0 +1,99 @@
+import logging
+import logging.handlers
+import os
+import queue
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from bookings.log_pipeline import CompressedRotatingFileHandler, LazyQueueHandler, SampleFilter
+
+FORMAT = '{levelname} {asctime} {module} {process:d} {thread:d} {message}'
+FLIGHTS_PER_REQUEST = 20
+
+
+def _file_handler(path, handler_class=logging.FileHandler, **kwargs):
+    handler = handler_class(path, **kwargs)
+    handler.setFormatter(logging.Formatter(FORMAT, style='{'))
+    return handler
+
+
+def _request_before(logger, params):
+    # flight_list as it used to log: eager f-strings, every step at INFO
+    logger.info(f"Flight list accessed with params: {params}")
+    for step in ('origin', 'destination', 'date'):
+        logger.info(f"After {step} filter '{params[step]}': {FLIGHTS_PER_REQUEST}")
+    logger.info(f"Final flights count: {FLIGHTS_PER_REQUEST}")
+    for index in range(FLIGHTS_PER_REQUEST):
+        logger.info(f"Flight XY{index:04d}: {index}/180 available")
+
+
+def _request_after(logger, params):
+    logger.info("Flight list accessed with params: %s", params)
+    for step in ('origin', 'destination', 'date'):
+        logger.debug("After %s filter '%s': %s", step, params[step], FLIGHTS_PER_REQUEST)
+    logger.info("Final flights count: %s", FLIGHTS_PER_REQUEST)
+    for index in range(FLIGHTS_PER_REQUEST):
+        logger.debug("Flight XY%04d: %s/180 available", index, index)
+
+
+class Command(BaseCommand):
+    help = 'Measure the logging cost per flight_list request with the old sync handlers and the queued pipeline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Simulated requests per mode')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent request threads')
+        parser.add_argument('--sample-rate', type=int, default=10, help='Keep one in N DEBUG records')
+
+    def handle(self, *args, **options):
+        params = {'origin': 'London', 'destination': 'Paris', 'date': '2026-01-01', 'passengers': '1'}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            before = logging.getLogger('bench_logging.before')
+            before.propagate = False
+            before.setLevel(logging.DEBUG)
+            before.handlers = [_file_handler(os.path.join(tmp, 'before.log'))]
+            before_result = self._run(lambda: _request_before(before, params), options)
+            before.handlers[0].close()
+
+            after = logging.getLogger('bench_logging.after')
+            after.propagate = False
+            after.setLevel(logging.DEBUG)
+            after.filters = [SampleFilter({'bench_logging': options['sample_rate']})]
+            file_handler = _file_handler(
+                os.path.join(tmp, 'after.log'), CompressedRotatingFileHandler,
+                maxBytes=1024 * 1024, backupCount=3,
+            )
+            queue_handler = LazyQueueHandler(queue.Queue())
+            listener = logging.handlers.QueueListener(queue_handler.queue, file_handler, respect_handler_level=True)
+            after.handlers = [queue_handler]
+            listener.start()
+            after_result = self._run(lambda: _request_after(after, params), options)
+            drain_started = time.perf_counter()
+            listener.stop()
+            drain = time.perf_counter() - drain_started
+            file_handler.close()
+
+        self.stdout.write(f"{'mode':<10}{'mean us':>10}{'p50 us':>10}{'p95 us':>10}{'total s':>10}")
+        for mode, result in (('sync', before_result), ('queued', after_result)):
+            self.stdout.write(
+                f"{mode:<10}{result['mean']:>10.1f}{result['p50']:>10.1f}{result['p95']:>10.1f}{result['total']:>10.2f}"
+            )
+        self.stdout.write(f"Writer drained the remaining backlog in {drain * 1000:.0f} ms after the run")
+
+    def _run(self, request, options):
+        def call(_):
+            started = time.perf_counter()
+            request()
+            return (time.perf_counter() - started) * 1_000_000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            latencies = sorted(pool.map(call, range(options['requests'])))
+        return {
+            'mean': statistics.fmean(latencies),
+            'p50': statistics.median(latencies),
+            'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            'total': time.perf_counter() - started,
+        }
@@ -0,0 +1,99 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, AsyncRequestFactory
+from bookings.models import Flight
+from bookings.template_views import flight_list, flight_seats
+from bookings.api_autocomplete import city_suggestions
+from bookings.views import FlightListCreateView
+from bookings.async_views import (
+    flight_list_async,
+    flight_seats_async,
+    city_suggestions_async,
+    flight_list_api_async,
+)
+
+
+def _prepare(request, staff=False):
+    SessionMiddleware(lambda r: None).process_request(request)
+    request.user = User(username='bench', is_staff=True, is_active=True) if staff else AnonymousUser()
+    return request
+
+
+def _summary(latencies, elapsed):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return {
+        'rps': len(latencies) / elapsed if elapsed else 0,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': p95 * 1000,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare the sync (WSGI) and async (ASGI) read views under concurrent load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and mode')
+        parser.add_argument('--concurrency', type=int, default=20, help='Threads (sync) or in-flight tasks (async)')
+        parser.add_argument('--flight', type=int, help='Flight id for the seat map (default: first active flight)')
+
+    def handle(self, *args, **options):
+        flight = Flight.objects.filter(is_active=True).first()
+        if options['flight']:
+            flight = Flight.objects.filter(id=options['flight']).first()
+        if not flight:
+            raise CommandError('No flight available; run populate_flights first')
+
+        endpoints = [
+            ('flight_list', '/', {'origin': flight.origin[:3]}, flight_list, flight_list_async, {}, False),
+            ('flight_seats', f'/flights/{flight.id}/seats/', {}, flight_seats, flight_seats_async,
+             {'flight_id': flight.id}, False),
+            ('city_suggestions', '/api/cities/', {'q': flight.origin[:2]}, city_suggestions,
+             city_suggestions_async, {}, False),
+            ('api_flights', '/api/flights/', {}, FlightListCreateView.as_view(), flight_list_api_async, {}, True),
+        ]
+
+        self.stdout.write(f"{'endpoint':<18}{'mode':<7}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, path, params, sync_view, async_view, kwargs, staff in endpoints:
+            sync_result = self._run_sync(sync_view, path, params, kwargs, staff, options)
+            async_result = asyncio.run(self._run_async(async_view, path, params, kwargs, staff, options))
+            for mode, result in (('wsgi', sync_result), ('asgi', async_result)):
+                self.stdout.write(
+                    f"{name:<18}{mode:<7}{result['rps']:>10.1f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+                )
+
+    def _run_sync(self, view, path, params, kwargs, staff, options):
+        factory = RequestFactory()
+
+        def call(_):
+            request = _prepare(factory.get(path, params), staff)
+            started = time.perf_counter()
+            response = view(request, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            latencies = list(pool.map(call, range(options['requests'])))
+        return _summary(latencies, time.perf_counter() - started)
+
+    async def _run_async(self, view, path, params, kwargs, staff, options):
+        factory = AsyncRequestFactory()
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def call():
+            async with semaphore:
+                request = _prepare(factory.get(path, params), staff)
+                started = time.perf_counter()
+                await view(request, **kwargs)
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(call() for _ in range(options['requests'])))
+        return _summary(latencies, time.perf_counter() - started)
@@ -0,0 +1,58 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from bookings.cdc import DEFAULT_BATCH, assign_sequence, ndjson_lines, upper_bound
+from bookings.db_router import use_workload
+
+
+class Command(BaseCommand):
+    help = 'Write booking events after a cursor to stdout as NDJSON (the /api/booking-events/ feed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--after', type=int, help='Start after this seq (default: the cursor file, else 0)')
+        parser.add_argument('--cursor-file', help='Read the starting cursor from, and save progress to, this file')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH, help='Events per batch')
+        parser.add_argument('--follow', action='store_true', help='Keep polling for new events')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between polls with --follow')
+
+    def handle(self, *args, **options):
+        cursor_file = options['cursor_file']
+        after = options['after']
+        if after is None:
+            after = self._read_cursor(cursor_file) if cursor_file else 0
+
+        try:
+            with use_workload('batch'):
+                while True:
+                    assign_sequence()
+                    upper = upper_bound(after, options['batch_size'])
+                    if upper > after:
+                        for line in ndjson_lines(after, upper):
+                            self.stdout.write(line, ending='')
+                        self.stdout.flush()
+                        after = upper
+                        if cursor_file:
+                            self._save_cursor(cursor_file, after)
+                        continue
+                    if not options['follow']:
+                        break
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stderr.write(f"Cursor: {after}")
+
+    def _read_cursor(self, path):
+        if not os.path.exists(path):
+            return 0
+        with open(path) as handle:
+            try:
+                return int(handle.read().strip() or 0)
+            except ValueError:
+                raise CommandError(f"{path} does not hold a cursor")
+
+    def _save_cursor(self, path, cursor):
+        # Write then rename, so a crash never leaves a half-written cursor
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as handle:
+            handle.write(str(cursor))
+        os.replace(tmp, path)
@@ -0,0 +1,106 @@
+import difflib
+import os
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from bookings import query_plans
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN (ANALYZE, BUFFERS) the hot querysets on a synthetic dataset and diff the plans against baselines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--update', action='store_true', help='Write the current plans as the new baselines')
+        parser.add_argument('--existing-data', action='store_true',
+                            help='Explain against the data already in the database instead of a synthetic dataset')
+        parser.add_argument('--flights', type=int, default=500, help='Synthetic flights to create')
+        parser.add_argument('--seats', type=int, default=60, help='Seats per synthetic flight')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--cost-factor', type=float, default=2.0,
+                            help='Fail when estimated cost grows past this multiple of the baseline')
+        parser.add_argument('--baselines', default=query_plans.BASELINE_PATH, help='Baseline file')
+        parser.add_argument('--only', nargs='*', help='Only these catalogue entries')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Plan snapshots need PostgreSQL (EXPLAIN ANALYZE, BUFFERS)')
+
+        catalogue = [(name, build) for name, build in query_plans.HOT_QUERIES
+                     if not options['only'] or name in options['only']]
+
+        # Everything, including the dataset and its ANALYZE stats, is rolled back
+        plans, timings = {}, {}
+        with transaction.atomic():
+            # Building the dataset and EXPLAIN ANALYZE can outrun any statement_timeout set for the role
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = 0")
+            if options['existing_data']:
+                ctx = self._existing_ctx()
+            else:
+                ctx = query_plans.build_dataset(options['flights'], options['seats'], options['seed'])
+            for name, build in catalogue:
+                explained = query_plans.explain(build(ctx))
+                plans[name] = query_plans.normalize(explained)
+                timings[name] = query_plans.runtime(explained)
+            transaction.set_rollback(True)
+        if not options['existing_data']:
+            query_plans.vacuum_dataset()
+
+        for name, plan in plans.items():
+            timing = timings[name]
+            self.stdout.write(
+                f"{name:<26} cost {plan['total_cost']:>10.1f}  {timing['time_ms']:>8.2f} ms  "
+                f"buffers hit={timing['shared_hit']} read={timing['shared_read']}"
+            )
+
+        if options['update']:
+            baselines = {}
+            if options['only'] and os.path.exists(options['baselines']):
+                baselines = query_plans.load_baselines(options['baselines'])
+            baselines.update(plans)
+            query_plans.save_baselines(baselines, options['baselines'])
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(plans)} plan baseline(s) to {options['baselines']}"))
+            return
+
+        if not os.path.exists(options['baselines']):
+            raise CommandError(f"No baselines at {options['baselines']}; run with --update and commit the file")
+        baselines = query_plans.load_baselines(options['baselines'])
+
+        failures = 0
+        for name, plan in plans.items():
+            baseline = baselines.get(name)
+            if baseline is None:
+                self.stdout.write(self.style.WARNING(f"{name}: no baseline yet"))
+                continue
+            if plan['nodes'] != baseline['nodes']:
+                self.stdout.write(f"{name}: plan changed")
+                for line in difflib.unified_diff(baseline['nodes'], plan['nodes'], 'baseline', 'current', lineterm=''):
+                    self.stdout.write(f"    {line}")
+            problems = query_plans.regressions(baseline, plan, options['cost_factor'])
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(f"{name}: {problem}"))
+            failures += bool(problems)
+
+        if failures:
+            raise CommandError(f"{failures} query plan regression(s)")
+        self.stdout.write(self.style.SUCCESS('No plan regressions'))
+
+    def _existing_ctx(self):
+        from django.contrib.auth.models import User
+        from django.utils import timezone
+        from bookings.airports import resolve_airports
+        from bookings.models import Flight
+
+        flight = Flight.objects.filter(is_active=True).order_by('id').first()
+        if flight is None:
+            raise CommandError('No active flights; drop --existing-data to use a synthetic dataset')
+        user = User.objects.filter(bookings__isnull=False).first() or User.objects.first()
+        return {
+            'origin': flight.origin,
+            'destination': flight.destination,
+            'origin_airports': resolve_airports(flight.origin),
+            'destination_airports': resolve_airports(flight.destination),
+            'date': flight.departure_time.date(),
+            'flight_id': flight.id,
+            'user_id': user.id if user else 0,
+            'now': timezone.now(),
+        }
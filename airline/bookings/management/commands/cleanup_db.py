@@ -2,20 +2,23 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
 from bookings.models import Booking
+from bookings.partitions import ensure_partitions
 
 class Command(BaseCommand):
     help = 'Clean up old expired bookings to improve performance'
 
     def handle(self, *args, **options):
-        # Delete expired bookings older than 7 days
+        # Delete expired bookings older than 7 days. Nothing references
+        # bookings, so this is a single DELETE with no per-row cascade.
         cutoff_date = timezone.now() - timedelta(days=7)
         
-        old_expired = Booking.objects.filter(
+        count, _ = Booking.objects.filter(
             state='EXPIRED',
             updated_at__lt=cutoff_date
-        )
+        ).delete()
         
-        count = old_expired.count()
-        old_expired.delete()
-        
-        self.stdout.write(f'Cleaned up {count} old expired bookings')
\ No newline at end of file
+        self.stdout.write(f'Cleaned up {count} old expired bookings')
+
+        # Whole months are purged by dropping partitions: manage_booking_partitions --retain-months N
+        for name in ensure_partitions():
+            self.stdout.write(f'Created booking partition {name}')
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from bookings.contention import contention_report, read_events, since_hours
+from bookings.models import Flight, Seat
+
+
+class Command(BaseCommand):
+    help = 'Rank the flights and seats with the most row-lock waiting'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help='Look back this many hours')
+        parser.add_argument('--top', type=int, default=10, help='Rows per ranking')
+        parser.add_argument('--log', help='Contention log to read (default: logs/contention.ndjson)')
+
+    def handle(self, *args, **options):
+        events = read_events(since_hours(options['hours']), options['log'])
+        if not events:
+            self.stdout.write(f"No contention recorded in the last {options['hours']:g}h")
+            return
+
+        report = contention_report(events, options['top'])
+        flights = Flight.objects.in_bulk([row['flight_id'] for row in report['flights'] + report['seats']])
+        seats = Seat.objects.in_bulk([row['id'] for row in report['seats']])
+
+        header = f"{'waits':>7}{'total ms':>12}{'p95 ms':>10}{'max ms':>10}{'pg seen':>9}"
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Hottest flights ({len(events)} events)"))
+        self.stdout.write(f"{'flight':<28}{header}")
+        for row in report['flights']:
+            self.stdout.write(f"{self._flight(flights, row['id']):<28}{self._numbers(row)}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Hottest seats'))
+        self.stdout.write(f"{'seat':<28}{header}")
+        for row in report['seats']:
+            seat = seats.get(row['id'])
+            label = f"{self._flight(flights, row['flight_id']).split()[0]} {seat.seat_number if seat else row['id']}"
+            self.stdout.write(f"{label:<28}{self._numbers(row)}")
+
+    def _flight(self, flights, flight_id):
+        flight = flights.get(flight_id)
+        if flight is None:
+            return f"#{flight_id} (deleted)"
+        return f"{flight.code} {flight.origin[:8]}-{flight.destination[:8]}"
+
+    def _numbers(self, row):
+        return (
+            f"{row['lock_waits']:>7}{row['total_wait_ms']:>12.1f}{row['p95_wait_ms']:>10.1f}"
+            f"{row['max_wait_ms']:>10.1f}{row['pg_sightings']:>9}"
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from bookings.outbox import dispatch_batch, dispatch_forever
+
+
+class Command(BaseCommand):
+    help = 'Send pending booking notifications from the outbox (SKIP LOCKED, so several can run at once)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Messages claimed per transaction (default: OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--once', action='store_true', help='Send everything due now and exit')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when nothing is due')
+
+    def handle(self, *args, **options):
+        if not options['once']:
+            try:
+                dispatch_forever(options['interval'], options['batch_size'])
+            except KeyboardInterrupt:
+                return
+
+        totals = [0, 0, 0]
+        while True:
+            batch = dispatch_batch(options['batch_size'])
+            if not any(batch):
+                break
+            totals = [total + count for total, count in zip(totals, batch)]
+        sent, retried, failed = totals
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} message(s)"))
+        if retried or failed:
+            self.stdout.write(self.style.WARNING(f"{retried} will be retried, {failed} gave up"))
@@ -1,23 +1,11 @@
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from bookings.models import Booking
-from bookings.state_machine import transition
+from bookings.services import expire_holds
 
 class Command(BaseCommand):
     help = 'Expire seat holds that have exceeded 10 minutes'
 
     def handle(self, *args, **options):
-        expired_bookings = Booking.objects.filter(
-            state='SEAT_HELD',
-            seat_hold_until__lt=timezone.now()
-        )
-        
-        count = 0
-        for booking in expired_bookings:
-            try:
-                transition(booking, 'EXPIRED')
-                count += 1
-            except Exception as e:
-                self.stdout.write(f'Error expiring booking {booking.id}: {e}')
-        
-        self.stdout.write(f'Expired {count} seat holds')
\ No newline at end of file
+        expired, failed = expire_holds('expire_holds')
+        if failed:
+            self.stdout.write(f'Failed to expire {failed} seat holds, see the log')
+        self.stdout.write(f'Expired {expired} seat holds')
\ No newline at end of file
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Min
+from django.utils import timezone
+from bookings.jobs import enqueue
+from bookings.models import Job, JobStatus
+
+
+class Command(BaseCommand):
+    help = 'Show background job counts, queue a job, or requeue dead-lettered jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--enqueue', metavar='TASK', help='Queue a job for this task')
+        parser.add_argument('--kwarg', action='append', default=[], metavar='KEY=VALUE', help='Task argument (repeatable)')
+        parser.add_argument('--priority', type=int, default=0)
+        parser.add_argument('--requeue-dead', action='store_true', help='Give dead jobs another full set of attempts')
+        parser.add_argument('--queue', help='Limit --requeue-dead to one queue')
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            kwargs = dict(item.split('=', 1) for item in options['kwarg'])
+            try:
+                job = enqueue(options['enqueue'], kwargs, priority=options['priority'])
+            except LookupError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"Queued job {job.id} on {job.queue}"))
+            return
+
+        if options['requeue_dead']:
+            dead = Job.objects.filter(status=JobStatus.DEAD)
+            if options['queue']:
+                dead = dead.filter(queue=options['queue'])
+            count = dead.update(status=JobStatus.QUEUED, attempts=0, run_at=timezone.now(), finished_at=None)
+            self.stdout.write(self.style.SUCCESS(f"Requeued {count} dead job(s)"))
+            return
+
+        now = timezone.now()
+        rows = (
+            Job.objects.exclude(status=JobStatus.SUCCEEDED).values('queue', 'status')
+            .annotate(jobs=Count('id'), oldest=Min('run_at')).order_by('queue', 'status')
+        )
+        self.stdout.write(f"{'queue':<16}{'status':<10}{'jobs':>8}  oldest due")
+        for row in rows:
+            age = (now - row['oldest']).total_seconds()
+            due = f"{age:.0f}s ago" if age >= 0 else f"in {-age:.0f}s"
+            self.stdout.write(f"{row['queue']:<16}{row['status']:<10}{row['jobs']:>8}  {due}")
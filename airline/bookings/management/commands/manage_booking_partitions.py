@@ -0,0 +1,47 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from bookings.partitions import (
+    is_supported,
+    is_partitioned,
+    ensure_partitions,
+    list_partitions,
+    purge_partitions,
+    add_months,
+    month_start,
+)
+
+
+class Command(BaseCommand):
+    help = 'Pre-create, list and purge monthly airline_bookings partitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3, help='Future months to pre-create')
+        parser.add_argument('--list', action='store_true', help='List partitions and approximate row counts')
+        parser.add_argument('--retain-months', type=int, help='Purge partitions older than this many months')
+        parser.add_argument('--archive-dir', help='Export purged partitions here as .csv.gz before dropping')
+        parser.add_argument('--keep-detached', action='store_true',
+                            help='Leave purged partitions as standalone tables instead of dropping them')
+
+    def handle(self, *args, **options):
+        if not is_supported() or not is_partitioned():
+            raise CommandError('airline_bookings is not partitioned (PostgreSQL only, see migration 0012)')
+
+        created = ensure_partitions(options['months_ahead'])
+        for name in created:
+            self.stdout.write(f'Created partition {name}')
+
+        if options['retain_months'] is not None:
+            cutoff = add_months(month_start(date.today()), -options['retain_months'])
+            purged = purge_partitions(
+                cutoff,
+                archive_dir=options['archive_dir'],
+                drop=not options['keep_detached'],
+            )
+            for name, rows, path in purged:
+                action = 'Detached' if options['keep_detached'] else 'Dropped'
+                self.stdout.write(f'{action} {name} (~{rows} rows){f" -> {path}" if path else ""}')
+            self.stdout.write(self.style.SUCCESS(f'Purged {len(purged)} partition(s) before {cutoff:%Y-%m}'))
+
+        if options['list']:
+            for month, name, rows in list_partitions():
+                self.stdout.write(f'{month:%Y-%m}  {name}  ~{rows} rows')
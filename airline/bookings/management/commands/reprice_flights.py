@@ -0,0 +1,41 @@
+import random
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from bookings import pricing
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dynamic fare of every seat class on every future active flight'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--benchmark', type=int, metavar='FARES',
+            help='Instead of repricing, time the fare formula on this many synthetic fares with each backend',
+        )
+
+    def handle(self, *args, **options):
+        if options['benchmark']:
+            return self._benchmark(options['benchmark'])
+        if not settings.DYNAMIC_PRICING:
+            self.stdout.write('DYNAMIC_PRICING is off: fares are written but bookings still pay Flight.price')
+        version, count = pricing.reprice_all()
+        if version is None:
+            self.stdout.write('No future active flights with seats to price')
+        else:
+            self.stdout.write(f"Repriced {count} fares as version {version} ({'numpy' if pricing.np is not None else 'python'})")
+
+    def _benchmark(self, count):
+        rng = random.Random(1)
+        base = [rng.uniform(80, 3000) for _ in range(count)]
+        load_factor = [rng.random() for _ in range(count)]
+        days = [rng.uniform(0, 90) for _ in range(count)]
+        backends = [('python', pricing.compute_fares_python)]
+        if pricing.np is not None:
+            backends.append(('numpy', pricing.compute_fares_numpy))
+        else:
+            self.stdout.write('NumPy is not installed; timing the Python fallback only')
+        for name, compute in backends:
+            started = time.perf_counter()
+            compute(base, load_factor, days)
+            self.stdout.write(f"{name:<7} {count} fares in {(time.perf_counter() - started) * 1000:.1f}ms")
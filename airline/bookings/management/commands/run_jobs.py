@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from bookings.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs; start more of these (on any host) to scale out'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queues', default='default,notifications,refunds,maintenance,exports',
+                            help='Comma-separated queues, claimed from in this order')
+        parser.add_argument('--concurrency', type=int, default=4, help='Jobs run at once by this worker')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when nothing is due')
+        parser.add_argument('--once', action='store_true', help='Exit once nothing is due')
+
+    def handle(self, *args, **options):
+        queues = [queue.strip() for queue in options['queues'].split(',') if queue.strip()]
+        self.stdout.write(f"Worker on {', '.join(queues)} with {options['concurrency']} slot(s)")
+        try:
+            run_worker(queues, options['concurrency'], options['interval'], options['once'])
+        except KeyboardInterrupt:
+            pass
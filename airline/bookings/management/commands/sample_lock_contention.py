@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from bookings.contention import sample_waiting_sessions
+
+
+class Command(BaseCommand):
+    help = 'Periodically sample pg_locks/pg_stat_activity for sessions blocked on locks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between samples')
+        parser.add_argument('--duration', type=float, default=0,
+                            help='Stop after this many seconds (default: run until interrupted)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Lock sampling needs PostgreSQL')
+
+        deadline = time.monotonic() + options['duration'] if options['duration'] else None
+        samples = 0
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                waiting = sample_waiting_sessions()
+                samples += 1
+                for session in waiting:
+                    self.stdout.write(
+                        f"pid {session['pid']} waiting {session['wait_ms']:.0f} ms on {session['wait_event']}"
+                        f" (blocked by {session['blocked_by']}, seat {session['seat_id'] or '-'})"
+                    )
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Took {samples} sample(s); details are in logs/contention.ndjson"))
@@ -0,0 +1,75 @@
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from bookings.models import Flight
+from bookings.retries import retry_counts
+from bookings.stress import (
+    create_stress_flight, delete_stress_flight, is_stress_flight, run_stress, interleaving_for, format_event,
+)
+
+
+class Command(BaseCommand):
+    help = 'Fire concurrent booking operations at a few seats and check seat/booking invariants'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flight', type=int, help='Stress flight kept by an earlier --keep run to target again (default: a new throwaway flight)')
+        parser.add_argument('--seats', type=int, default=4, help='Number of seats to contend on')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent worker threads')
+        parser.add_argument('--operations', type=int, default=400, help='Total operations across all workers')
+        parser.add_argument('--seed', type=int, help='Random seed for a reproducible run')
+        parser.add_argument('--max-events', type=int, default=20, help='Interleaving events shown per violation')
+        parser.add_argument('--keep', action='store_true', help='Keep the throwaway flight after the run')
+        parser.add_argument('--no-fail', action='store_true', help='Exit 0 even when invariants are violated')
+
+    def handle(self, *args, **options):
+        flight = None
+        if options['flight']:
+            try:
+                flight = Flight.objects.get(id=options['flight'])
+            except Flight.DoesNotExist:
+                raise CommandError(f"Flight {options['flight']} does not exist")
+            if not is_stress_flight(flight):
+                # Workers cancel and delete whatever bookings they find, real passengers' included
+                raise CommandError(f"Flight {flight.code} is not a stress flight; only flights kept with --keep can be reused")
+            seats = list(flight.seats.order_by('row_number', 'seat_letter')[:options['seats']])
+        else:
+            flight = create_stress_flight(options['seats'])
+            seats = list(flight.seats.all())
+
+        if not seats:
+            raise CommandError(f"Flight {flight.code} has no seats")
+        seat_ids_by_flight = {flight.id: [seat.id for seat in seats]}
+
+        try:
+            log, violations = run_stress(
+                seats,
+                workers=options['workers'],
+                operations=options['operations'],
+                seed=options['seed'],
+            )
+        finally:
+            if not options['flight'] and not options['keep']:
+                delete_stress_flight(flight)
+
+        events = log.events
+        outcomes = Counter((e['op'], e['outcome']) for e in events)
+        self.stdout.write(f"Ran {len(events)} operations on {len(seats)} seats of flight {flight.code}")
+        for (op, outcome), count in sorted(outcomes.items()):
+            self.stdout.write(f"  {op:<6} {outcome:<8} {count}")
+        self.stdout.write(f"Retries (BOOKING_SERIALIZABLE={settings.BOOKING_SERIALIZABLE}):")
+        for (function, reason), (retried, exhausted) in sorted(retry_counts().items()):
+            self.stdout.write(f"  {function:<16} {reason:<22} {retried:g} retried, {exhausted:g} gave up")
+
+        total = 0
+        for check, rows in violations.items():
+            for violation in rows:
+                total += 1
+                self.stdout.write(self.style.ERROR(f"{check}: {violation}"))
+                interleaving = interleaving_for(log, check, violation, seat_ids_by_flight)
+                for event in interleaving[-options['max_events']:]:
+                    self.stdout.write(f"    {format_event(event)}")
+
+        if not total:
+            self.stdout.write(self.style.SUCCESS('All invariants hold'))
+        elif not options['no_fail']:
+            raise CommandError(f"{total} invariant violation(s)")
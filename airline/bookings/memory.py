@@ -0,0 +1,219 @@
+import os
+import threading
+import tracemalloc
+from collections import deque
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+from .metrics import histogram
+import logging
+
+logger = logging.getLogger('bookings')
+
+MEMORY_HEADER = 'X-Memory-Profile'
+
+REQUEST_PEAK_BYTES = histogram(
+    'airline_request_peak_memory_bytes', 'Peak traced memory of memory-profiled requests', ('view',),
+    buckets=tuple(mb * 1024 * 1024 for mb in (1, 2, 5, 10, 25, 50, 100, 250, 500)),
+)
+
+# Allocations made by tracemalloc itself and by the import machinery are noise
+_NOISE = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+# Instrumentation wrapping the view is never the interesting call site
+_SKIPPED_FILES = {
+    __file__,
+    *(str(settings.BASE_DIR / 'bookings' / name) for name in (
+        'tracing.py', 'metrics.py', 'profiling.py', 'slow_queries.py', 'db_router.py',
+    )),
+}
+
+# Only one request is traced at a time: tracemalloc is process-wide
+_tracing_lock = threading.Lock()
+
+
+class MemoryReportLog:
+    """Bounded ring buffer of memory-profiled requests"""
+
+    def __init__(self, size):
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+MEMORY_REPORTS = MemoryReportLog(settings.MEMORY_REPORT_BUFFER_SIZE)
+
+
+def _site(frame):
+    filename = frame.filename
+    base_dir = str(settings.BASE_DIR)
+    if filename.startswith(base_dir) and 'site-packages' not in filename:
+        filename = filename[len(base_dir) + 1:]
+    elif 'site-packages' in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    return f'{filename}:{frame.lineno}'
+
+
+def _app_frame(traceback):
+    # Most recent frame in project code, i.e. the line in our code that caused the allocation
+    base_dir = str(settings.BASE_DIR)
+    for frame in reversed(traceback):
+        if frame.filename.startswith(base_dir) and 'site-packages' not in frame.filename \
+                and frame.filename not in _SKIPPED_FILES:
+            return frame
+    return None
+
+
+def diff_snapshots(before, after, top=15):
+    """Top allocation sites between two snapshots.
+
+    ``sites`` groups by the allocating line (often inside Django); ``app_sites``
+    charges each allocation to the innermost line of project code on its stack.
+    """
+    before, after = before.filter_traces(_NOISE), after.filter_traces(_NOISE)
+    by_traceback = after.compare_to(before, 'traceback')
+
+    sites, app_sites = {}, {}
+    for stat in by_traceback:
+        if stat.size_diff <= 0:
+            continue
+        targets = [(sites, _site(stat.traceback[-1]))]
+        app_frame = _app_frame(stat.traceback)
+        if app_frame is not None:
+            targets.append((app_sites, _site(app_frame)))
+        for groups, key in targets:
+            group = groups.setdefault(key, {'site': key, 'size_diff': 0, 'count_diff': 0})
+            group['size_diff'] += stat.size_diff
+            group['count_diff'] += stat.count_diff
+
+    def ranked(groups):
+        return sorted(groups.values(), key=lambda group: group['size_diff'], reverse=True)[:top]
+
+    return {
+        'sites': ranked(sites),
+        'app_sites': ranked(app_sites),
+        'net_bytes': sum(stat.size_diff for stat in by_traceback),
+    }
+
+
+def _selected(request):
+    if request.headers.get(MEMORY_HEADER) == '1':
+        user = getattr(request, 'user', None)
+        if (user is not None and user.is_staff) or getattr(request, 'session', {}).get('monitoring_user_id'):
+            return True
+    if not settings.MEMORY_PROFILE_VIEWS:
+        return False
+    try:
+        return resolve(request.path_info).view_name in settings.MEMORY_PROFILE_VIEWS
+    except Resolver404:
+        return False
+
+
+class MemoryProfilingMiddleware:
+    """Snapshots tracemalloc around MEMORY_PROFILE_VIEWS requests and staff requests sent with ``X-Memory-Profile: 1``.
+
+    Goes after AuthenticationMiddleware. Tracing slows allocation down, so it
+    is only switched on for the selected request, one at a time per process;
+    others arriving meanwhile run untraced. Allocations by other threads (and,
+    under ASGI, other requests on the event loop) during the request are
+    included in its numbers.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not _selected(request) or not _tracing_lock.acquire(blocking=False):
+            return self.get_response(request)
+
+        started_here = not tracemalloc.is_tracing()
+        try:
+            baseline, before = self._start(started_here)
+            response = self.get_response(request)
+            peak, after = self._snapshot()
+        finally:
+            self._stop(started_here)
+        self._report(request, response, baseline, peak, before, after)
+        return response
+
+    async def __acall__(self, request):
+        # The staff check may load the user and session from the database
+        selected = await sync_to_async(_selected)(request) if request.headers.get(MEMORY_HEADER) == '1' else _selected(request)
+        if not selected or not _tracing_lock.acquire(blocking=False):
+            return await self.get_response(request)
+
+        started_here = not tracemalloc.is_tracing()
+        try:
+            baseline, before = self._start(started_here)
+            response = await self.get_response(request)
+            peak, after = self._snapshot()
+        finally:
+            self._stop(started_here)
+        self._report(request, response, baseline, peak, before, after)
+        return response
+
+    def _start(self, started_here):
+        if started_here:
+            tracemalloc.start(settings.MEMORY_TRACE_FRAMES)
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        return baseline, tracemalloc.take_snapshot()
+
+    def _snapshot(self):
+        _, peak = tracemalloc.get_traced_memory()
+        return peak, tracemalloc.take_snapshot()
+
+    def _stop(self, started_here):
+        if started_here:
+            tracemalloc.stop()
+        _tracing_lock.release()
+
+    def _report(self, request, response, baseline, peak, before, after):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        diff = diff_snapshots(before, after)
+        entry = {
+            'at': timezone.now(),
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'peak_bytes': max(0, peak - baseline),
+            **diff,
+        }
+        entry['over_budget'] = entry['peak_bytes'] > settings.MEMORY_BUDGET_MB * 1024 * 1024
+        MEMORY_REPORTS.add(entry)
+        REQUEST_PEAK_BYTES.observe(entry['peak_bytes'], view=view)
+
+        if entry['over_budget']:
+            top = entry['app_sites'][0]['site'] if entry['app_sites'] else '-'
+            logger.warning(
+                f"Request over memory budget: {request.method} {request.path} view={view} "
+                f"peak={entry['peak_bytes'] / 1048576:.1f}MB budget={settings.MEMORY_BUDGET_MB}MB "
+                f"retained={entry['net_bytes'] / 1048576:.1f}MB top_site={top}"
+            )
@@ -0,0 +1,389 @@
+import atexit
+import glob
+import json
+import math
+import os
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+import logging
+
+logger = logging.getLogger('bookings')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), self._copy(value)] for key, value in self._values.items()]
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        REGISTRY.changed()
+
+
+class Gauge(_Metric):
+    """A value that goes up and down.
+
+    ``mode`` says how processes combine: 'sum' adds up live processes only,
+    'max' takes the highest value ever written, exited processes included.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), mode='sum'):
+        super().__init__(name, documentation, labelnames)
+        self.mode = mode
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+        REGISTRY.changed()
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        REGISTRY.changed()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][index] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+        REGISTRY.changed()
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def _copy(self, value):
+        return {'buckets': list(value['buckets']), 'sum': value['sum'], 'count': value['count']}
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    """Holds this process's metrics and, with METRICS_DIR set, shares them through files.
+
+    Each process writes its snapshot to METRICS_DIR/<pid>-<start>.json about
+    once a second; /metrics merges every file in the directory. Counters and
+    histograms from exited processes (cron jobs, recycled workers) still count.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._flusher_pid = None
+        self._started = int(time.time())
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def snapshot(self):
+        snapshot = {}
+        for metric in self.metrics():
+            snapshot[metric.name] = {
+                'kind': metric.kind,
+                'documentation': metric.documentation,
+                'labelnames': list(metric.labelnames),
+                'buckets': list(getattr(metric, 'buckets', ())),
+                'mode': getattr(metric, 'mode', None),
+                'values': metric.snapshot(),
+            }
+        return snapshot
+
+    # -- multi-process sharing -------------------------------------------
+
+    def _directory(self):
+        return getattr(settings, 'METRICS_DIR', '')
+
+    def _path(self):
+        return os.path.join(self._directory(), f'{os.getpid()}-{self._started}.json')
+
+    def changed(self):
+        if not self._directory():
+            return
+        self._dirty.set()
+        if self._flusher_pid != os.getpid():
+            with self._lock:
+                if self._flusher_pid != os.getpid():
+                    self._flusher_pid = os.getpid()
+                    threading.Thread(target=self._flush_loop, name='metrics-flusher', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            self._dirty.wait()
+            time.sleep(settings.METRICS_FLUSH_SECONDS)
+            self._dirty.clear()
+            self.flush()
+
+    def flush(self):
+        if not self._directory() or self._flusher_pid != os.getpid():
+            return
+        path = self._path()
+        try:
+            os.makedirs(self._directory(), exist_ok=True)
+            with open(f'{path}.tmp', 'w') as handle:
+                json.dump(self.snapshot(), handle)
+            os.replace(f'{path}.tmp', path)
+        except OSError as e:
+            logger.error(f"Failed to write metrics snapshot {path}: {e}")
+
+    def collect(self):
+        """Snapshots from every process, this one included"""
+        if not self._directory():
+            return [(True, self.snapshot())]
+        self.flush()
+        snapshots = [] if self._flusher_pid == os.getpid() else [(True, self.snapshot())]
+        for path in glob.glob(os.path.join(self._directory(), '*.json')):
+            pid = int(os.path.basename(path).split('-', 1)[0])
+            try:
+                with open(path) as handle:
+                    snapshots.append((_alive(pid), json.load(handle)))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush)
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=(), mode='sum'):
+    return REGISTRY.register(Gauge(name, documentation, labelnames, mode))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# -- exposition ----------------------------------------------------------
+
+def _merge(snapshots):
+    merged = {}
+    for alive, snapshot in snapshots:
+        for name, data in snapshot.items():
+            if data['kind'] == 'gauge' and data['mode'] != 'max' and not alive:
+                continue
+            target = merged.setdefault(name, {**data, 'values': {}})
+            for key, value in data['values']:
+                key = tuple(key)
+                current = target['values'].get(key)
+                if current is None:
+                    target['values'][key] = value
+                elif data['kind'] == 'histogram':
+                    current['buckets'] = [a + b for a, b in zip(current['buckets'], value['buckets'])]
+                    current['sum'] += value['sum']
+                    current['count'] += value['count']
+                elif data['kind'] == 'gauge' and data['mode'] == 'max':
+                    target['values'][key] = max(current, value)
+                else:
+                    target['values'][key] = current + value
+    return merged
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def render(snapshots=None):
+    """Prometheus text exposition format (version 0.0.4)"""
+    merged = _merge(REGISTRY.collect() if snapshots is None else snapshots)
+    lines = []
+    for name in sorted(merged):
+        data = merged[name]
+        lines.append(f"# HELP {name} {data['documentation']}")
+        lines.append(f"# TYPE {name} {data['kind']}")
+        for key, value in sorted(data['values'].items()):
+            if data['kind'] != 'histogram':
+                lines.append(f"{name}{_labels(data['labelnames'], key)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(data['buckets'], value['buckets']):
+                cumulative += count
+                le = (('le', _number(bound)),)
+                lines.append(f"{name}_bucket{_labels(data['labelnames'], key, le)} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(data['labelnames'], key, (('le', '+Inf'),))} {value['count']}")
+            lines.append(f"{name}_sum{_labels(data['labelnames'], key)} {_number(value['sum'])}")
+            lines.append(f"{name}_count{_labels(data['labelnames'], key)} {value['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden('Metrics are only served to allowed scrapers')
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
+# -- application metrics -------------------------------------------------
+
+BOOKINGS_CREATED = counter('airline_bookings_created_total', 'Bookings created (seat holds placed)')
+BOOKING_TRANSITIONS = counter(
+    'airline_booking_transitions_total', 'Booking state transitions', ('from_state', 'to_state'),
+)
+PAYMENTS = counter('airline_payments_total', 'Payment attempts by result', ('result',))
+HOLD_TO_CONFIRM_SECONDS = histogram(
+    'airline_hold_to_confirm_seconds', 'Time from booking creation to confirmation',
+    buckets=(5, 15, 30, 60, 120, 180, 300, 450, 600, 900),
+)
+EXPIRY_LAG_SECONDS = histogram(
+    'airline_expiry_lag_seconds', 'How long after seat_hold_until a hold was actually expired',
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800),
+)
+EXPIRY_RUNS = counter('airline_expiry_runs_total', 'Expiry sweeps run', ('job',))
+EXPIRY_RUN_SECONDS = histogram('airline_expiry_run_seconds', 'Duration of one expiry sweep', ('job',))
+EXPIRY_LAST_RUN = gauge(
+    'airline_expiry_last_run_timestamp_seconds', 'Unix time the last expiry sweep finished', ('job',), mode='max',
+)
+EXPIRY_FAILURES = counter('airline_expiry_failures_total', 'Holds an expiry sweep failed to expire', ('job',))
+HTTP_REQUEST_SECONDS = histogram(
+    'airline_http_request_duration_seconds', 'Request latency by view', ('view', 'method', 'status'),
+)
+HTTP_REQUESTS_IN_PROGRESS = gauge('airline_http_requests_in_progress', 'Requests being handled right now')
+
+
+def record_expiry_run(job, started, failed=0):
+    EXPIRY_RUNS.inc(job=job)
+    EXPIRY_RUN_SECONDS.observe(time.perf_counter() - started, job=job)
+    EXPIRY_LAST_RUN.set(time.time(), job=job)
+    if failed:
+        EXPIRY_FAILURES.inc(failed, job=job)
+
+
+class MetricsMiddleware:
+    """Records latency for every request, labelled by the resolved view"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            self._observe(request, started, status)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        status = 500
+        try:
+            response = await self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            self._observe(request, started, status)
+
+    def _observe(self, request, started, status):
+        HTTP_REQUESTS_IN_PROGRESS.dec()
+        match = getattr(request, 'resolver_match', None)
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            view=match.view_name if match else 'unmatched',
+            method=request.method,
+            status=status,
+        )
@@ -0,0 +1,112 @@
+import re
+from datetime import date, datetime, timezone
+
+from django.db import migrations
+
+
+LEGACY = 'airline_bookings_legacy'
+
+
+def _next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _bound(month):
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+
+def partition_bookings(apps, schema_editor):
+    """Rebuild airline_bookings as a table range-partitioned by month of created_at.
+
+    Postgres requires the partition key in every unique constraint, so the
+    primary key becomes (id, created_at) and booking_reference is unique per
+    created_at. Both stay unique in practice (sequence ids, uuid4 references).
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE airline_bookings RENAME TO {LEGACY}")
+
+        # Indexes and constraints are recreated on the partitioned parent
+        cursor.execute("""
+            SELECT i.indexname, i.indexdef
+            FROM pg_indexes i
+            WHERE i.tablename = %s
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname)
+        """, [LEGACY])
+        indexes = cursor.fetchall()
+        cursor.execute("""
+            SELECT conname, pg_get_constraintdef(oid)
+            FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+        """, [LEGACY])
+        foreign_keys = cursor.fetchall()
+        cursor.execute("""
+            SELECT conname FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f')
+        """, [LEGACY])
+        for (name,) in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {LEGACY} DROP CONSTRAINT "{name}"')
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX "{name}"')
+
+        cursor.execute(f"""
+            CREATE TABLE airline_bookings (
+                LIKE {LEGACY} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS
+            ) PARTITION BY RANGE (created_at)
+        """)
+        cursor.execute("ALTER TABLE airline_bookings ADD PRIMARY KEY (id, created_at)")
+        cursor.execute(
+            "ALTER TABLE airline_bookings ADD CONSTRAINT airline_bookings_reference_created_uniq "
+            "UNIQUE (booking_reference, created_at)"
+        )
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE airline_bookings ADD CONSTRAINT "{name}" {definition}')
+        for name, definition in indexes:
+            cursor.execute(re.sub(rf' ON (\S+\.)?{LEGACY} ', ' ON airline_bookings ', definition))
+
+        cursor.execute("CREATE TABLE airline_bookings_default PARTITION OF airline_bookings DEFAULT")
+        # Monthly partitions from the oldest booking to three months ahead
+        cursor.execute(f"SELECT MIN(created_at) FROM {LEGACY}")
+        oldest = cursor.fetchone()[0] or datetime.now(timezone.utc)
+        month = date(oldest.year, oldest.month, 1)
+        horizon = _next_month(_next_month(_next_month(date.today())))
+        while month <= horizon:
+            cursor.execute(
+                f"CREATE TABLE airline_bookings_p{month.year:04d}{month.month:02d} "
+                f"PARTITION OF airline_bookings FOR VALUES FROM (%s) TO (%s)",
+                [_bound(month), _bound(_next_month(month))],
+            )
+            month = _next_month(month)
+
+        cursor.execute(f"INSERT INTO airline_bookings OVERRIDING SYSTEM VALUE SELECT * FROM {LEGACY}")
+
+        # Keep the id sequence going from where the old table left off
+        cursor.execute("SELECT pg_get_serial_sequence('airline_bookings', 'id')")
+        sequence = cursor.fetchone()[0]
+        if sequence:
+            cursor.execute(
+                "SELECT setval(%s, COALESCE((SELECT MAX(id) FROM airline_bookings), 0) + 1, false)",
+                [sequence],
+            )
+        else:
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [LEGACY])
+            legacy_sequence = cursor.fetchone()[0]
+            if legacy_sequence:
+                cursor.execute(f"ALTER SEQUENCE {legacy_sequence} OWNED BY airline_bookings.id")
+
+        cursor.execute(f"DROP TABLE {LEGACY}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0011_monitoringuser_actual_password'),
+    ]
+
+    operations = [
+        # The partitioned table is schema-compatible with the model, so
+        # unapplying leaves it in place
+        migrations.RunPython(partition_bookings, migrations.RunPython.noop),
+    ]
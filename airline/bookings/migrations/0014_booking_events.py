@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 13:08
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0013_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField(blank=True, null=True, unique=True)),
+                ('event_type', models.CharField(max_length=30)),
+                ('booking_id', models.BigIntegerField()),
+                ('booking_reference', models.UUIDField()),
+                ('from_state', models.CharField(blank=True, max_length=20)),
+                ('to_state', models.CharField(blank=True, max_length=20)),
+                ('data', models.JSONField(default=dict)),
+                ('occurred_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'booking_events',
+                'ordering': ['seq'],
+                'indexes': [models.Index(condition=models.Q(('seq__isnull', True)), fields=['id'], name='booking_events_unsequenced')],
+            },
+        ),
+    ]
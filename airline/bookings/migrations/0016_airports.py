@@ -0,0 +1,158 @@
+# Generated by Django 4.2.30 on 2026-10-19 13:21
+
+import re
+import string
+import unicodedata
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Frozen copies of the bookings.airports helpers as they were when this
+# migration was written, so later changes there can't change what it does.
+
+# City → (IATA code, airport name, country, other names) for the cities we fly
+KNOWN_AIRPORTS = {
+    'Mumbai': ('BOM', 'Chhatrapati Shivaji Maharaj International', 'India', ['Bombay']),
+    'Delhi': ('DEL', 'Indira Gandhi International', 'India', ['New Delhi']),
+    'Bangalore': ('BLR', 'Kempegowda International', 'India', ['Bengaluru']),
+    'Chennai': ('MAA', 'Chennai International', 'India', ['Madras']),
+    'Kolkata': ('CCU', 'Netaji Subhas Chandra Bose International', 'India', ['Calcutta']),
+    'Hyderabad': ('HYD', 'Rajiv Gandhi International', 'India', []),
+    'Pune': ('PNQ', 'Pune International', 'India', ['Poona']),
+    'Ahmedabad': ('AMD', 'Sardar Vallabhbhai Patel International', 'India', []),
+    'Jaipur': ('JAI', 'Jaipur International', 'India', []),
+    'Kochi': ('COK', 'Cochin International', 'India', ['Cochin']),
+    'Goa': ('GOI', 'Dabolim', 'India', []),
+    'New York': ('JFK', 'John F. Kennedy International', 'United States', ['NYC']),
+    'Los Angeles': ('LAX', 'Los Angeles International', 'United States', ['LA']),
+    'Chicago': ('ORD', "O'Hare International", 'United States', []),
+    'Miami': ('MIA', 'Miami International', 'United States', []),
+    'London': ('LHR', 'Heathrow', 'United Kingdom', []),
+    'Paris': ('CDG', 'Charles de Gaulle', 'France', []),
+}
+
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode()
+    return ' '.join(_NON_WORD_RE.sub(' ', text.casefold()).split())
+
+
+def alias_keys(airport):
+    keys = set()
+    for value in (airport.iata_code, airport.city, airport.name, *airport.aliases):
+        value = normalize(value)
+        if value:
+            keys.add(value)
+            keys.update(word for word in value.split() if len(word) >= 2)
+    return keys
+
+
+def known_airport(city):
+    key = normalize(city)
+    for name, (code, airport_name, country, aliases) in KNOWN_AIRPORTS.items():
+        if key in {normalize(name), normalize(code), *(normalize(alias) for alias in aliases)}:
+            return name, code, airport_name, country, aliases
+    return None
+
+
+def generated_code(city, taken):
+    taken = set(taken) | {code for code, *_ in KNOWN_AIRPORTS.values()}
+    letters = [c for c in normalize(city).upper() if c in string.ascii_uppercase] or ['X']
+    first = letters[0]
+    for second in dict.fromkeys(letters[1:] + list(string.ascii_uppercase)):
+        for third in dict.fromkeys(letters[2:] + list(string.ascii_uppercase)):
+            code = first + second + third
+            if code not in taken:
+                return code
+    raise ValueError(f"No free airport code for {city!r}")
+
+
+def backfill_airports(apps, schema_editor):
+    """One airport per distinct city string in flights, then point every flight at its airports"""
+    Airport = apps.get_model('bookings', 'Airport')
+    AirportAlias = apps.get_model('bookings', 'AirportAlias')
+    Flight = apps.get_model('bookings', 'Flight')
+
+    cities = set(Flight.objects.values_list('origin', flat=True)) | set(Flight.objects.values_list('destination', flat=True))
+    by_key, by_code = {}, {}
+    for city in sorted(cities):
+        key = normalize(city)
+        if not key or key in by_key:
+            continue
+        known = known_airport(city)
+        if known:
+            name, code, airport_name, country, aliases = known
+        else:
+            name, airport_name, country, aliases = city.strip(), f"{city.strip()} Airport", '', []
+            code = generated_code(city, by_code)
+        if code not in by_code:
+            airport = Airport.objects.create(iata_code=code, name=airport_name, city=name, country=country, aliases=aliases)
+            AirportAlias.objects.bulk_create([AirportAlias(airport=airport, alias=alias) for alias in sorted(alias_keys(airport))])
+            by_code[code] = airport
+        by_key[key] = by_code[code]
+
+    for city in cities:
+        airport = by_key.get(normalize(city))
+        if airport:
+            Flight.objects.filter(origin=city).update(origin_airport=airport)
+            Flight.objects.filter(destination=city).update(destination_airport=airport)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0015_background_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Airport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('iata_code', models.CharField(max_length=3, unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('city', models.CharField(max_length=100)),
+                ('country', models.CharField(blank=True, max_length=100)),
+                ('aliases', models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                'db_table': 'airline_airports',
+                'ordering': ['city'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AirportAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(db_index=True, max_length=100)),
+            ],
+            options={
+                'db_table': 'airline_airport_aliases',
+            },
+        ),
+        migrations.AddField(
+            model_name='airportalias',
+            name='airport',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alias_index', to='bookings.airport'),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='destination_airport',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='arrivals', to='bookings.airport'),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='origin_airport',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='departures', to='bookings.airport'),
+        ),
+        migrations.AddConstraint(
+            model_name='airportalias',
+            constraint=models.UniqueConstraint(fields=('alias', 'airport'), name='airport_alias_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['origin_airport', 'destination_airport', 'departure_time'], name='airline_fli_origin__87950a_idx'),
+        ),
+        migrations.RunPython(backfill_airports, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 13:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0016_airports'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightFare',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seat_class', models.CharField(choices=[('ECONOMY', 'Economy'), ('BUSINESS', 'Business'), ('FIRST', 'First Class')], max_length=20)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('load_factor', models.FloatField()),
+                ('version', models.PositiveIntegerField(db_index=True)),
+                ('computed_at', models.DateTimeField()),
+                ('flight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fares', to='bookings.flight')),
+            ],
+            options={
+                'db_table': 'airline_flight_fares',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='flightfare',
+            constraint=models.UniqueConstraint(fields=('flight', 'seat_class'), name='flight_fare_unique'),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -15,6 +15,39 @@ class BookingState(models.TextChoices):
     REFUNDED = "REFUNDED"
 
 
+class Airport(models.Model):
+    iata_code = models.CharField(max_length=3, unique=True)
+    name = models.CharField(max_length=100)
+    city = models.CharField(max_length=100)
+    country = models.CharField(max_length=100, blank=True)
+    # Other names people search by, e.g. "Bombay" for Mumbai
+    aliases = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        db_table = 'airline_airports'
+        ordering = ['city']
+
+    def save(self, *args, **kwargs):
+        from .airports import index_aliases
+        super().save(*args, **kwargs)
+        index_aliases(self)
+
+    def __str__(self):
+        return f"{self.iata_code} - {self.city}"
+
+
+class AirportAlias(models.Model):
+    """Normalized codes, names and words airports are searched by; prefix lookups use the alias index"""
+    alias = models.CharField(max_length=100, db_index=True)
+    airport = models.ForeignKey(Airport, on_delete=models.CASCADE, related_name='alias_index')
+
+    class Meta:
+        db_table = 'airline_airport_aliases'
+        constraints = [
+            models.UniqueConstraint(fields=['alias', 'airport'], name='airport_alias_unique'),
+        ]
+
+
 class Flight(models.Model):
     code = models.CharField(max_length=10, unique=True, db_index=True)
     airline_code = models.CharField(max_length=2, default='AI', db_index=True)
@@ -22,6 +55,13 @@ class Flight(models.Model):
     arrival_time = models.DateTimeField()
     origin = models.CharField(max_length=100, db_index=True)
     destination = models.CharField(max_length=100, db_index=True)
+    # Searches go through these; origin/destination stay as the display names
+    origin_airport = models.ForeignKey(
+        Airport, on_delete=models.PROTECT, null=True, blank=True, related_name='departures'
+    )
+    destination_airport = models.ForeignKey(
+        Airport, on_delete=models.PROTECT, null=True, blank=True, related_name='arrivals'
+    )
     price = models.DecimalField(
         max_digits=10, 
         decimal_places=2,
@@ -55,6 +95,7 @@ class Flight(models.Model):
         indexes = [
             models.Index(fields=['departure_time', 'origin', 'destination']),
             models.Index(fields=['is_active', 'departure_time']),
+            models.Index(fields=['origin_airport', 'destination_airport', 'departure_time']),
         ]
 
     def clean(self):
@@ -64,9 +105,39 @@ class Flight(models.Model):
                 raise ValidationError('Arrival time must be after departure time')
     
     def save(self, *args, **kwargs):
+        from .airports import airport_for_city
+        from .fares import invalidate_flight, invalidate_route
+        previous = None
+        if self.pk:
+            previous = Flight.objects.filter(pk=self.pk).values(
+                'origin', 'destination', 'origin_airport_id', 'destination_airport_id',
+            ).first()
+        # Resolved on creation and again whenever the city text is edited without picking an airport
+        if self.origin and (
+            self.origin_airport_id is None
+            or (previous and previous['origin'] != self.origin and previous['origin_airport_id'] == self.origin_airport_id)
+        ):
+            self.origin_airport = airport_for_city(self.origin)
+        if self.destination and (
+            self.destination_airport_id is None
+            or (previous and previous['destination'] != self.destination and previous['destination_airport_id'] == self.destination_airport_id)
+        ):
+            self.destination_airport = airport_for_city(self.destination)
         if not self.pk:  # Only validate on creation, not updates
             self.full_clean()
         super().save(*args, **kwargs)
+        # Price, schedule or status may have changed
+        invalidate_flight(self.id, self)
+        if previous:
+            old_route = (previous['origin_airport_id'], previous['destination_airport_id'])
+            if old_route != (self.origin_airport_id, self.destination_airport_id):
+                # The flight also left the calendar of the route it used to fly
+                transaction.on_commit(lambda: invalidate_route(*old_route))
+
+    def delete(self, *args, **kwargs):
+        from .fares import invalidate_flight
+        invalidate_flight(self.id, self)
+        return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"{self.code} - {self.origin} to {self.destination}"
@@ -124,6 +195,26 @@ class Seat(models.Model):
         return f"{self.flight.code}-{self.seat_number}"
 
 
+class FlightFare(models.Model):
+    """Dynamic fare of one seat class on one flight; rewritten in bulk by bookings.pricing"""
+    flight = models.ForeignKey(Flight, on_delete=models.CASCADE, related_name='fares')
+    seat_class = models.CharField(max_length=20, choices=Seat.SEAT_CLASS_CHOICES)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    load_factor = models.FloatField()
+    # The repricing run that wrote this fare
+    version = models.PositiveIntegerField(db_index=True)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'airline_flight_fares'
+        constraints = [
+            models.UniqueConstraint(fields=['flight', 'seat_class'], name='flight_fare_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.flight.code} {self.seat_class} {self.price}"
+
+
 class Booking(models.Model):
     booking_reference = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bookings', null=True, blank=True)
@@ -266,3 +357,93 @@ class AdminUser(models.Model):
     
     def __str__(self):
         return f"{self.airline_code} - {self.admin_name}"
+
+
+class OutboxStatus(models.TextChoices):
+    PENDING = "PENDING"
+    SENT = "SENT"
+    FAILED = "FAILED"
+
+
+class OutboxMessage(models.Model):
+    """A notification written in the same transaction as the booking change it announces"""
+    kind = models.CharField(max_length=40)
+    # Plain ids rather than a ForeignKey: airline_bookings is partitioned, its primary key is (id, created_at)
+    booking_id = models.BigIntegerField(db_index=True)
+    recipient = models.EmailField()
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=OutboxStatus.choices, default=OutboxStatus.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'notification_outbox'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for booking {self.booking_id} - {self.status}"
+
+
+class BookingEvent(models.Model):
+    """Change feed entry for a booking; ``seq`` is assigned once the writing transaction has committed"""
+    seq = models.BigIntegerField(null=True, blank=True, unique=True)
+    event_type = models.CharField(max_length=30)
+    # Plain ids rather than a ForeignKey: airline_bookings is partitioned, its primary key is (id, created_at)
+    booking_id = models.BigIntegerField()
+    booking_reference = models.UUIDField()
+    from_state = models.CharField(max_length=20, blank=True)
+    to_state = models.CharField(max_length=20, blank=True)
+    data = models.JSONField(default=dict)
+    occurred_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'booking_events'
+        ordering = ['seq']
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(seq__isnull=True), name='booking_events_unsequenced'),
+        ]
+
+    def __str__(self):
+        return f"#{self.seq} {self.event_type} booking {self.booking_id}"
+
+
+class JobStatus(models.TextChoices):
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    SUCCEEDED = "SUCCEEDED"
+    DEAD = "DEAD"
+
+
+class Job(models.Model):
+    """A unit of background work, claimed by `manage.py run_jobs` workers"""
+    queue = models.CharField(max_length=50, default='default')
+    task = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict)
+    priority = models.SmallIntegerField(default=0)  # higher runs first
+    status = models.CharField(max_length=10, choices=JobStatus.choices, default=JobStatus.QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'background_jobs'
+        ordering = ['-priority', 'run_at', 'id']
+        indexes = [
+            models.Index(fields=['queue', 'status', 'priority', 'run_at']),
+            models.Index(fields=['status', 'locked_at']),
+            models.Index(fields=['task', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.task} [{self.queue}] - {self.status}"
@@ -1,6 +1,7 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from .models import Flight, Seat, Booking, MonitoringUser, AdminUser
+from .db_router import workload
 from django.contrib.auth.models import User
 
 def monitoring_login_new(request):
@@ -47,6 +48,7 @@ def monitoring_required_new(view_func):
     return wrapper
 
 @monitoring_required_new
+@workload('analytics')
 def monitoring_dashboard_new(request):
     # Get all data
     total_users = User.objects.count()
@@ -7,6 +7,15 @@ from django.db.models import Q, Count
 from .models import Flight, Seat, Booking, MonitoringUser, AdminUser
 from django.contrib.auth.models import User
 from django.db.models import Count
+from django.conf import settings
+from .slow_queries import SLOW_QUERIES
+from .db_router import workload
+from .tracing import get_collector
+from .contention import since_hours
+from .memory import MEMORY_REPORTS
+from .profiling import by_view, collapsed_text, flame_rows, hottest_frames, read_profiles
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
+from datetime import datetime, timezone as dt_timezone
 import logging
 
 logger = logging.getLogger('bookings')
@@ -58,6 +67,7 @@ def monitoring_required(view_func):
     return wrapper
 
 @monitoring_required
+@workload('analytics')
 def monitoring_dashboard(request):
     print("*** MONITORING DASHBOARD VIEW CALLED ***")
     # System-wide statistics - ALL data from ALL tables
@@ -118,6 +128,7 @@ def monitoring_dashboard(request):
     })
 
 @monitoring_required
+@workload('analytics')
 def monitoring_flights(request):
     # Show ALL flights from ALL airlines
     flights = Flight.objects.all().order_by('-departure_time')
@@ -128,6 +139,7 @@ def monitoring_flights(request):
     })
 
 @monitoring_required
+@workload('analytics')
 def monitoring_bookings(request):
     # Show ALL bookings from ALL airlines
     bookings = Booking.objects.all().select_related('seat__flight', 'created_by').order_by('-created_at')
@@ -137,6 +149,142 @@ def monitoring_bookings(request):
         'monitoring_user': request.monitoring_user
     })
 
+@monitoring_required
+def monitoring_slow_queries(request):
+    # Slow queries seen by this worker process, grouped by normalized SQL
+    if request.method == 'POST':
+        SLOW_QUERIES.clear()
+        messages.success(request, 'Slow query buffer cleared')
+        return redirect('monitoring-slow-queries')
+    
+    entries = SLOW_QUERIES.entries()
+    return render(request, 'monitoring/slow_queries.html', {
+        'offenders': SLOW_QUERIES.top_offenders(),
+        'recent': list(reversed(entries))[:50],
+        'captured': len(entries),
+        'threshold_ms': settings.SLOW_QUERY_MS,
+        'buffer_size': settings.SLOW_QUERY_BUFFER_SIZE,
+        'monitoring_user': request.monitoring_user
+    })
+
+@monitoring_required
+def monitoring_traces(request):
+    # Sampled requests recorded by this worker process
+    collector = get_collector()
+    traces = [{
+        'trace_id': root['trace_id'],
+        'name': root['name'],
+        'view': root['attributes'].get('view'),
+        'status': root['attributes'].get('http.status'),
+        'error': root['attributes'].get('error'),
+        'duration_ms': root['duration_ms'],
+        'started': datetime.fromtimestamp(root['start'], tz=dt_timezone.utc),
+    } for root in (collector.recent() if collector else [])]
+    return render(request, 'monitoring/traces.html', {
+        'traces': traces,
+        'collector_enabled': collector is not None,
+        'sample_rate': settings.TRACE_SAMPLE_RATE,
+        'monitoring_user': request.monitoring_user
+    })
+
+@monitoring_required
+def monitoring_trace_detail(request, trace_id):
+    collector = get_collector()
+    trace = collector.get(trace_id) if collector else None
+    if trace is None:
+        raise Http404("Trace not found (it may have been evicted or recorded by another worker)")
+    
+    root = trace['root']
+    total_ms = root['duration_ms'] or 1
+    depths = {root['span_id']: 0}
+    rows = []
+    for span in sorted(trace['spans'], key=lambda s: s['start']):
+        depth = depths.get(span['parent_id'], 0) + 1 if span['span_id'] != root['span_id'] else 0
+        depths[span['span_id']] = depth
+        offset_ms = (span['start'] - root['start']) * 1000
+        rows.append({
+            **span,
+            'depth': depth,
+            'indent': depth * 16,
+            'offset_ms': offset_ms,
+            'offset_pct': max(0, min(100, offset_ms / total_ms * 100)),
+            'width_pct': max(0.3, min(100, span['duration_ms'] / total_ms * 100)),
+        })
+    
+    return render(request, 'monitoring/trace_detail.html', {
+        'root': root,
+        'rows': rows,
+        'monitoring_user': request.monitoring_user
+    })
+
+def _profile_window(request):
+    # (hours, cutoff) from ?hours=; ValueError unless it's a positive number of hours after year 1
+    hours = float(request.GET.get('hours', 24))
+    if not hours > 0:
+        raise ValueError(hours)
+    try:
+        return hours, since_hours(hours)
+    except OverflowError as e:
+        raise ValueError(hours) from e
+
+@monitoring_required
+def monitoring_profiles(request):
+    # Profiled requests from every worker (logs/profiles.ndjson), aggregated per view
+    try:
+        hours, since = _profile_window(request)
+    except ValueError:
+        return HttpResponseBadRequest('hours must be a positive number')
+    views = by_view(read_profiles(since))
+    return render(request, 'monitoring/profiles.html', {
+        'views': views,
+        'hours': hours,
+        'sample_rate': settings.PROFILE_SAMPLE_RATE,
+        'interval_ms': settings.PROFILE_INTERVAL_MS,
+        'monitoring_user': request.monitoring_user
+    })
+
+@monitoring_required
+def monitoring_profile_detail(request, view_name):
+    try:
+        hours, since = _profile_window(request)
+    except ValueError:
+        return HttpResponseBadRequest('hours must be a positive number')
+    entry = next((v for v in by_view(read_profiles(since)) if v['view'] == view_name), None)
+    if entry is None:
+        raise Http404(f"No profiles for {view_name} in the last {hours:g}h")
+    
+    if request.GET.get('format') == 'collapsed':
+        response = HttpResponse(collapsed_text(entry['stacks']), content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{view_name}.collapsed"'
+        return response
+    
+    rows = flame_rows(entry['stacks'])
+    for row in rows:
+        row['top_px'] = row['depth'] * 20
+    return render(request, 'monitoring/profile_detail.html', {
+        'entry': entry,
+        'hours': hours,
+        'rows': rows,
+        'graph_height': (max((row['depth'] for row in rows), default=0) + 1) * 20,
+        'hottest': hottest_frames(entry['stacks']),
+        'monitoring_user': request.monitoring_user
+    })
+
+@monitoring_required
+def monitoring_memory(request):
+    # tracemalloc reports for memory-profiled requests in this worker process
+    if request.method == 'POST':
+        MEMORY_REPORTS.clear()
+        messages.success(request, 'Memory reports cleared')
+        return redirect('monitoring-memory')
+    
+    return render(request, 'monitoring/memory.html', {
+        'reports': list(reversed(MEMORY_REPORTS.entries())),
+        'budget_mb': settings.MEMORY_BUDGET_MB,
+        'profiled_views': settings.MEMORY_PROFILE_VIEWS,
+        'monitoring_user': request.monitoring_user
+    })
+
 @monitoring_required
 def toggle_flight_status(request, flight_id):
     flight = get_object_or_404(Flight, id=flight_id)
@@ -183,6 +331,7 @@ def add_monitoring_user(request):
     })
 
 @monitoring_required
+@workload('analytics')
 def monitoring_tables(request):
     # Get data from all tables
     users = User.objects.all().order_by('-date_joined')[:20]
@@ -0,0 +1,142 @@
+import random
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from .metrics import counter, histogram
+from .models import OutboxMessage, OutboxStatus
+import logging
+
+logger = logging.getLogger('bookings')
+
+OUTBOX_MESSAGES = counter(
+    'airline_outbox_messages_total', 'Outbox messages handled by the dispatcher', ('kind', 'result'),
+)
+OUTBOX_BATCH_SECONDS = histogram('airline_outbox_batch_seconds', 'Time to claim and send one outbox batch')
+OUTBOX_DELIVERY_LAG_SECONDS = histogram(
+    'airline_outbox_delivery_lag_seconds', 'Time from the booking change to the notification being sent', ('kind',),
+    buckets=(1, 5, 15, 30, 60, 120, 300, 900, 3600, 21600),
+)
+
+# (from_state, to_state) → message kind; None matches any previous state
+NOTIFY_ON = {
+    (None, 'CONFIRMED'): 'booking_confirmed',
+    ('CONFIRMED', 'CANCELLED'): 'booking_cancelled',
+    (None, 'REFUNDED'): 'booking_refunded',
+}
+
+SUBJECTS = {
+    'booking_confirmed': 'Your booking on {flight_code} is confirmed',
+    'booking_cancelled': 'Your booking on {flight_code} has been cancelled',
+    'booking_refunded': 'Your refund for {flight_code} has been processed',
+}
+
+
+def notification_kind(previous_state, next_state):
+    return NOTIFY_ON.get((previous_state, next_state)) or NOTIFY_ON.get((None, next_state))
+
+
+def enqueue_booking_notification(booking, kind):
+    """Write an outbox row; call inside the transaction that changes the booking"""
+    seat = booking.seat
+    flight = seat.flight
+    return OutboxMessage.objects.create(
+        kind=kind,
+        booking_id=booking.id,
+        recipient=booking.passenger_email,
+        payload={
+            'booking_reference': str(booking.booking_reference),
+            'passenger_name': booking.passenger_name,
+            'flight_code': flight.code,
+            'origin': flight.origin,
+            'destination': flight.destination,
+            'departure_time': flight.departure_time.isoformat(),
+            'seat_number': seat.seat_number,
+            'amount': str(booking.payment_amount),
+            'refund_amount': str(booking.refund_amount or booking.payment_amount),
+        },
+    )
+
+
+def build_email(message, connection=None):
+    context = {**message.payload, 'kind': message.kind}
+    return EmailMessage(
+        subject=SUBJECTS[message.kind].format(**context),
+        body=render_to_string(f'emails/{message.kind}.txt', context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[message.recipient],
+        connection=connection,
+    )
+
+
+def retry_delay(attempts):
+    """Exponential backoff with +/-20% jitter, capped at OUTBOX_RETRY_MAX_SECONDS"""
+    delay = min(settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.OUTBOX_RETRY_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def dispatch_batch(batch_size=None):
+    """Claim due messages with SKIP LOCKED, send them and record the outcome.
+
+    The row locks are held while sending, so concurrent dispatchers each get
+    a disjoint batch. Returns (sent, retried, failed).
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    started = time.perf_counter()
+    sent = retried = failed = 0
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxStatus.PENDING, available_at__lte=timezone.now())
+            .order_by('available_at', 'id')[:batch_size]
+        )
+        if not messages:
+            return 0, 0, 0
+
+        with get_connection() as connection:
+            for message in messages:
+                message.attempts += 1
+                try:
+                    build_email(message, connection).send()
+                except Exception as e:
+                    message.last_error = f"{type(e).__name__}: {e}"[:2000]
+                    if message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                        message.status = OutboxStatus.FAILED
+                        failed += 1
+                        logger.error(f"Outbox message {message.id} ({message.kind}) failed for good after {message.attempts} attempts: {e}")
+                    else:
+                        message.available_at = timezone.now() + retry_delay(message.attempts)
+                        retried += 1
+                        logger.warning(f"Outbox message {message.id} ({message.kind}) attempt {message.attempts} failed, retrying at {message.available_at}: {e}")
+                    OUTBOX_MESSAGES.inc(kind=message.kind, result='failed' if message.status == OutboxStatus.FAILED else 'retry')
+                else:
+                    message.status = OutboxStatus.SENT
+                    message.sent_at = timezone.now()
+                    message.last_error = ''
+                    sent += 1
+                    OUTBOX_MESSAGES.inc(kind=message.kind, result='sent')
+                    OUTBOX_DELIVERY_LAG_SECONDS.observe((message.sent_at - message.created_at).total_seconds(), kind=message.kind)
+
+        OutboxMessage.objects.bulk_update(messages, ['status', 'attempts', 'available_at', 'last_error', 'sent_at'])
+    OUTBOX_BATCH_SECONDS.observe(time.perf_counter() - started)
+    return sent, retried, failed
+
+
+def dispatch_forever(interval, batch_size=None):
+    """Drain the outbox, sleeping ``interval`` seconds whenever nothing is due"""
+    while True:
+        try:
+            sent, retried, failed = dispatch_batch(batch_size)
+        except Exception as e:
+            # e.g. the mail server or database is unreachable; the batch rolled back and stays pending
+            logger.error(f"Outbox batch failed: {e}")
+            close_old_connections()
+            time.sleep(interval)
+            continue
+        if sent or retried or failed:
+            logger.info(f"Outbox batch: {sent} sent, {retried} to retry, {failed} failed")
+        else:
+            time.sleep(interval)
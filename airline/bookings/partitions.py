@@ -0,0 +1,146 @@
+import gzip
+import os
+import re
+from datetime import date, datetime, timezone as dt_timezone
+from django.db import connection, transaction
+import logging
+
+logger = logging.getLogger('bookings')
+
+BOOKINGS_TABLE = 'airline_bookings'
+DEFAULT_PARTITION = f'{BOOKINGS_TABLE}_default'
+PARTITION_NAME_RE = re.compile(rf'^{BOOKINGS_TABLE}_p(\d{{4}})(\d{{2}})$')
+
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{BOOKINGS_TABLE}_p{month.year:04d}{month.month:02d}'
+
+
+def _bound(month):
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+
+
+def is_partitioned():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+            [BOOKINGS_TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """Monthly partitions of airline_bookings as (month, table name, approximate rows)"""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT child.relname, child.reltuples::bigint
+            FROM pg_inherits i
+            JOIN pg_class parent ON parent.oid = i.inhparent
+            JOIN pg_class child ON child.oid = i.inhrelid
+            WHERE parent.relname = %s
+            ORDER BY child.relname
+        """, [BOOKINGS_TABLE])
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, rows_estimate in rows:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            partitions.append((month, name, max(rows_estimate, 0)))
+    return partitions
+
+
+@transaction.atomic
+def create_partition(month):
+    """Create the partition for one month, moving any rows the default partition caught"""
+    name = partition_name(month)
+    start, end = _bound(month), _bound(add_months(month, 1))
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s)",
+            [start, end],
+        )
+        stray_rows = cursor.fetchone()[0]
+        if stray_rows:
+            cursor.execute(f"ALTER TABLE {BOOKINGS_TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+
+        cursor.execute(
+            f"CREATE TABLE {name} PARTITION OF {BOOKINGS_TABLE} FOR VALUES FROM (%s) TO (%s)",
+            [start, end],
+        )
+
+        if stray_rows:
+            cursor.execute(
+                f"INSERT INTO {BOOKINGS_TABLE} OVERRIDING SYSTEM VALUE SELECT * FROM {DEFAULT_PARTITION} "
+                f"WHERE created_at >= %s AND created_at < %s",
+                [start, end],
+            )
+            cursor.execute(
+                f"DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s",
+                [start, end],
+            )
+            cursor.execute(f"ALTER TABLE {BOOKINGS_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+
+    logger.info(f"Created booking partition {name}")
+    return True
+
+
+def ensure_partitions(months_ahead=3, today=None):
+    """Pre-create partitions for the current month and the next few"""
+    if not is_supported() or not is_partitioned():
+        return []
+    current = month_start(today or date.today())
+    return [
+        partition_name(add_months(current, offset))
+        for offset in range(months_ahead + 1)
+        if create_partition(add_months(current, offset))
+    ]
+
+
+def archive_partition(name, archive_dir):
+    """Export a partition to a gzip-compressed CSV file and return its path"""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f'{name}.csv.gz')
+    with gzip.open(path, 'wb') as archive, connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER true)", archive)
+    return path
+
+
+def purge_partitions(before, archive_dir=None, drop=True):
+    """Detach every monthly partition older than ``before``, archiving and dropping it.
+
+    Detaching and dropping are catalog operations, so purging a month costs
+    the same regardless of how many bookings it holds.
+    """
+    cutoff = month_start(before)
+    purged = []
+    for month, name, rows in list_partitions():
+        if month >= cutoff:
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {BOOKINGS_TABLE} DETACH PARTITION {name}")
+        path = archive_partition(name, archive_dir) if archive_dir else None
+        if drop:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE {name}")
+        logger.info(f"Purged booking partition {name} (~{rows} rows){f', archived to {path}' if path else ''}")
+        purged.append((name, rows, path))
+    return purged
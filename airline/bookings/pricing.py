@@ -0,0 +1,187 @@
+import math
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Max, Min, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .metrics import gauge, histogram
+from .models import FlightFare, Seat
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # optional: repricing falls back to a per-fare Python loop
+    np = None
+
+logger = logging.getLogger('bookings')
+
+REPRICE_SECONDS = histogram(
+    'airline_reprice_seconds', 'Time to recompute and write back every dynamic fare',
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+PRICING_VERSION = gauge('airline_pricing_version', 'Latest repricing run this process has published', mode='max')
+
+VERSION_KEY = 'pricing:version'
+
+
+def _fare_key(version, flight_id, seat_class):
+    return f"pricing:{version}:{flight_id}:{seat_class}"
+
+
+def load_inventory(now=None):
+    """(flight, seat class) rows of future active flights with base price, departure and seat counts; one grouped query"""
+    now = now or timezone.now()
+    return list(
+        Seat.objects.filter(flight__is_active=True, flight__departure_time__gt=now)
+        .values('flight_id', 'seat_class', 'flight__price', 'flight__departure_time')
+        .annotate(total=Count('id'), booked=Count('id', filter=Q(is_booked=True)))
+        .order_by()
+    )
+
+
+def compute_fares_numpy(base, load_factor, days):
+    """Fares for whole arrays at once; ``base`` already includes the seat class multiplier"""
+    low, high = settings.PRICING_LOAD_MULTIPLIERS
+    floor, cap = settings.PRICING_BOUNDS
+    base = np.asarray(base, dtype=np.float64)
+    load_factor = np.asarray(load_factor, dtype=np.float64)
+    days = np.maximum(np.asarray(days, dtype=np.float64), 0)
+    fares = (
+        base
+        * (low + (high - low) * load_factor ** 2)
+        * (1 + settings.PRICING_URGENCY_WEIGHT * np.exp(-days / settings.PRICING_URGENCY_DAYS))
+    )
+    return np.round(np.clip(fares, base * floor, base * cap), 2).tolist()
+
+
+def compute_fares_python(base, load_factor, days):
+    """The same formula one fare at a time, for installs without NumPy"""
+    low, high = settings.PRICING_LOAD_MULTIPLIERS
+    floor, cap = settings.PRICING_BOUNDS
+    fares = []
+    for b, lf, d in zip(base, load_factor, days):
+        fare = (
+            b
+            * (low + (high - low) * lf ** 2)
+            * (1 + settings.PRICING_URGENCY_WEIGHT * math.exp(-max(d, 0) / settings.PRICING_URGENCY_DAYS))
+        )
+        fares.append(round(min(max(fare, b * floor), b * cap), 2))
+    return fares
+
+
+def compute_fares(base, load_factor, days):
+    if np is not None:
+        return compute_fares_numpy(base, load_factor, days)
+    return compute_fares_python(base, load_factor, days)
+
+
+def _lock_versions():
+    # Serializes repricing runs (the command and the job) across processes, so
+    # each gets its own version; SQLite already serializes writers
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext('flight_fares.version'))")
+
+
+def reprice_all():
+    """Recompute the fare of every seat class on every future active flight and publish them as a new version"""
+    started = time.perf_counter()
+    with transaction.atomic():
+        # Taken before reading inventory, so a later version is never computed from older data
+        _lock_versions()
+        now = timezone.now()
+        rows = load_inventory(now)
+        if not rows:
+            return None, 0
+        multipliers = settings.PRICING_CLASS_MULTIPLIERS
+        base = [float(row['flight__price']) * multipliers.get(row['seat_class'], 1.0) for row in rows]
+        load_factor = [row['booked'] / row['total'] for row in rows]
+        days = [(row['flight__departure_time'] - now).total_seconds() / 86400 for row in rows]
+        fares = compute_fares(base, load_factor, days)
+
+        version = (FlightFare.objects.aggregate(latest=Max('version'))['latest'] or 0) + 1
+        FlightFare.objects.bulk_create(
+            [
+                FlightFare(
+                    flight_id=row['flight_id'], seat_class=row['seat_class'], price=Decimal(f'{fare:.2f}'),
+                    load_factor=lf, version=version, computed_at=now,
+                )
+                for row, fare, lf in zip(rows, fares, load_factor)
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['flight', 'seat_class'],
+            update_fields=['price', 'load_factor', 'version', 'computed_at'],
+        )
+        transaction.on_commit(lambda: publish(version, rows, fares))
+
+    elapsed = time.perf_counter() - started
+    REPRICE_SECONDS.observe(elapsed)
+    logger.info("Repriced %s fares as version %s in %.2fs (%s)", len(rows), version, elapsed, 'numpy' if np is not None else 'python')
+    return version, len(rows)
+
+
+def publish(version, rows, fares):
+    """Warm the cache with a run's fares, then switch quotes over to its version"""
+    entries = {
+        _fare_key(version, row['flight_id'], row['seat_class']): Decimal(f'{fare:.2f}')
+        for row, fare in zip(rows, fares)
+    }
+    items = list(entries.items())
+    for start in range(0, len(items), 1000):
+        cache.set_many(dict(items[start:start + 1000]), settings.PRICING_CACHE_SECONDS)
+    # Runs commit in version order, but never let a slow publish move quotes back
+    if (cache.get(VERSION_KEY) or 0) < version:
+        cache.set(VERSION_KEY, version, settings.PRICING_CACHE_SECONDS)
+    PRICING_VERSION.set(version)
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = FlightFare.objects.aggregate(latest=Max('version'))['latest']
+        if version is not None:
+            cache.set(VERSION_KEY, version, settings.PRICING_CACHE_SECONDS)
+    return version
+
+
+def quote(flight, seat_class):
+    """Price of one ``seat_class`` seat on ``flight``: its dynamic fare, or the flight's base price"""
+    if not settings.DYNAMIC_PRICING:
+        return flight.price
+    version = current_version()
+    if version is None:
+        return flight.price
+    key = _fare_key(version, flight.id, seat_class)
+    price = cache.get(key)
+    if price is None:
+        price = FlightFare.objects.filter(flight_id=flight.id, seat_class=seat_class).values_list('price', flat=True).first()
+        # Not repriced yet, e.g. added since the last run
+        if price is None:
+            price = flight.price
+        cache.set(key, price, settings.PRICING_CACHE_SECONDS)
+    return price
+
+
+def fare_expression():
+    """Flight queryset expression for the price shown before a seat is picked.
+
+    With DYNAMIC_PRICING on, the lowest current fare of the flight's seat
+    classes (what quote() charges for the cheapest one); else, or until the
+    flight is repriced, Flight.price. Searches sort and filter on it.
+    """
+    if not settings.DYNAMIC_PRICING:
+        return F('price')
+    lowest = (
+        FlightFare.objects.filter(flight=OuterRef('pk'))
+        .order_by().values('flight').annotate(lowest=Min('price')).values('lowest')
+    )
+    return Coalesce(Subquery(lowest), F('price'), output_field=DecimalField(max_digits=10, decimal_places=2))
+
+
+def pricing_key():
+    """Part of cache keys for anything showing fares: changes with every published repricing run"""
+    return f"p{current_version()}" if settings.DYNAMIC_PRICING else 'base'
@@ -0,0 +1,242 @@
+import glob
+import gzip
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+import logging
+
+logger = logging.getLogger('bookings')
+profile_logger = logging.getLogger('bookings.profiles')
+
+PROFILE_HEADER = 'X-Profile'
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    # co_qualname (Class.method) is Python 3.11+; older versions only have the bare name
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def collapse(frame, stop_code=None, stop_frame=None):
+    """``frame``'s stack as a root-first, ';'-joined line, cut below ``stop_code``.
+
+    With ``stop_frame``, cut below that one frame instead, and None when the
+    stack doesn't pass through it.
+    """
+    names = []
+    while frame is not None and frame is not stop_frame and (stop_frame is not None or frame.f_code is not stop_code):
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    if stop_frame is not None and frame is None:
+        return None
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Samples another thread's stack every ``interval`` seconds (wall clock, so I/O waits show up)"""
+
+    def __init__(self, thread_id, interval, stop_code=None, stop_frame=None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stop_code = stop_code
+        # Event loop threads run other requests too: keep only stacks inside this one coroutine frame
+        self.stop_frame = stop_frame
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = collapse(frame, self.stop_code, self.stop_frame)
+            if stack is not None:
+                self.stacks[stack] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+def _requested_by_staff(request):
+    if request.headers.get(PROFILE_HEADER) != '1':
+        return False
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_staff) or bool(getattr(request, 'session', {}).get('monitoring_user_id'))
+
+
+class ProfilingMiddleware:
+    """Profiles a PROFILE_SAMPLE_RATE share of requests, plus staff requests sent with ``X-Profile: 1``.
+
+    Goes after AuthenticationMiddleware; stacks are cut at this middleware,
+    so they start at the rest of the chain and the view. Under ASGI the event
+    loop thread is sampled and only stacks running through the profiled request's
+    own coroutine frame are kept, not those of other requests sharing the loop; sync views that Django hands to a worker thread don't
+    show up there.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        explicit = _requested_by_staff(request)
+        if not explicit and random.random() >= settings.PROFILE_SAMPLE_RATE:
+            return self.get_response(request)
+
+        sampler = StackSampler(
+            threading.get_ident(), settings.PROFILE_INTERVAL_MS / 1000, self.__call__.__code__,
+        ).start()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            self._record(request, started, sampler.stop())
+        if explicit:
+            response['X-Profile-Samples'] = str(sum(sampler.stacks.values()))
+        return response
+
+    async def __acall__(self, request):
+        # The staff check may load the user and session from the database
+        explicit = request.headers.get(PROFILE_HEADER) == '1' and await sync_to_async(_requested_by_staff)(request)
+        if not explicit and random.random() >= settings.PROFILE_SAMPLE_RATE:
+            return await self.get_response(request)
+
+        # This request's own coroutine frame: every request on the loop runs the same __acall__ code
+        sampler = StackSampler(
+            threading.get_ident(), settings.PROFILE_INTERVAL_MS / 1000, stop_frame=sys._getframe(),
+        ).start()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._record(request, started, sampler.stop())
+        if explicit:
+            response['X-Profile-Samples'] = str(sum(sampler.stacks.values()))
+        return response
+
+    def _record(self, request, started, stacks):
+        duration_ms = (time.perf_counter() - started) * 1000
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        record_profile(view, request, duration_ms, stacks)
+
+
+def record_profile(view, request, duration_ms, stacks):
+    if not stacks:
+        return
+    profile_logger.info(json.dumps({
+        'at': datetime.now(dt_timezone.utc).isoformat(),
+        'view': view,
+        'method': request.method,
+        'path': request.path,
+        'duration_ms': round(duration_ms, 3),
+        'interval_ms': settings.PROFILE_INTERVAL_MS,
+        'stacks': stacks,
+    }))
+
+
+# -- aggregation -------------------------------------------------------------
+
+def read_profiles(since=None, path=None):
+    """Profiled requests from the profiles log (logs/profiles.ndjson) and its rotated .gz files"""
+    path = path or str(settings.LOGGING['handlers']['profiles']['filename'])
+    profiles = []
+    for filename in sorted(glob.glob(f'{path}*')):
+        opener = gzip.open if filename.endswith('.gz') else open
+        try:
+            with opener(filename, 'rt') as handle:
+                for line in handle:
+                    try:
+                        profile = json.loads(line)
+                    except ValueError:
+                        continue
+                    if since is None or datetime.fromisoformat(profile['at']) >= since:
+                        profiles.append(profile)
+        except OSError as e:
+            logger.warning(f"Could not read profile log {filename}: {e}")
+    return profiles
+
+
+def by_view(profiles):
+    """Per-view request count, timings and merged stack counts"""
+    views = {}
+    for profile in profiles:
+        entry = views.setdefault(profile['view'], {
+            'view': profile['view'], 'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'samples': 0, 'stacks': Counter(),
+        })
+        entry['requests'] += 1
+        entry['total_ms'] += profile['duration_ms']
+        entry['max_ms'] = max(entry['max_ms'], profile['duration_ms'])
+        entry['stacks'].update(profile['stacks'])
+    for entry in views.values():
+        entry['samples'] = sum(entry['stacks'].values())
+        entry['avg_ms'] = entry['total_ms'] / entry['requests']
+    return sorted(views.values(), key=lambda entry: entry['total_ms'], reverse=True)
+
+
+def collapsed_text(stacks):
+    """Brendan Gregg's collapsed format, as read by flamegraph.pl and speedscope"""
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+def hottest_frames(stacks, top=15):
+    """Frames by self samples (leaf of the stack) and total samples (anywhere on it)"""
+    self_counts, total_counts = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        self_counts[frames[-1]] += count
+        for frame in set(frames):
+            total_counts[frame] += count
+    samples = sum(stacks.values()) or 1
+    return [{
+        'frame': frame,
+        'self': self_counts[frame],
+        'total': total_counts[frame],
+        'self_pct': self_counts[frame] / samples * 100,
+        'total_pct': total_counts[frame] / samples * 100,
+    } for frame, _ in self_counts.most_common(top)]
+
+
+def flame_rows(stacks, min_pct=0.5):
+    """Flame-graph boxes (depth, left/width percentages) for the monitoring page"""
+    tree = {'children': {}, 'count': 0}
+    for stack, count in stacks.items():
+        node = tree
+        node['count'] += count
+        for frame in stack.split(';'):
+            node = node['children'].setdefault(frame, {'children': {}, 'count': 0})
+            node['count'] += count
+
+    samples = tree['count'] or 1
+    rows = []
+
+    def walk(node, depth, left):
+        for name, child in sorted(node['children'].items()):
+            width = child['count'] / samples * 100
+            if width >= min_pct:
+                rows.append({'name': name, 'depth': depth, 'left_pct': left, 'width_pct': width, 'samples': child['count']})
+                walk(child, depth + 1, left)
+            left += width
+
+    walk(tree, 0, 0.0)
+    return rows
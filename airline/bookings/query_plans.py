@@ -0,0 +1,278 @@
+import json
+import os
+import random
+import re
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+from .airports import airport_for_city, normalize as normalize_text, resolve_airports
+from .models import Airport, AirportAlias, Flight, Seat, Booking
+from .search import keyset_page
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'plan_baselines.json')
+
+INDEX_SCANS = {'Index Scan', 'Index Only Scan', 'Bitmap Index Scan', 'Bitmap Heap Scan'}
+CITIES = ['Delhi', 'Mumbai', 'Bangalore', 'Chennai', 'Kolkata', 'Hyderabad', 'Pune', 'Goa', 'Jaipur', 'Kochi']
+PLAN_USER = 'plan_snapshot_user'
+
+_PARTITION_RE = re.compile(r'_p\d{6}')
+
+
+# -- catalogue -------------------------------------------------------------
+# Each entry mirrors the ORM call of a hot code path; ctx holds the sample values.
+
+def _airport_lookup(ctx):
+    # airports.resolve_airports: typed text to airport ids
+    return AirportAlias.objects.filter(alias__startswith=normalize_text(ctx['origin'])[:3]).values_list('airport_id', flat=True).distinct()
+
+
+def _route_flights(ctx):
+    return Flight.objects.filter(
+        is_active=True,
+        origin_airport_id__in=ctx['origin_airports'],
+        destination_airport_id__in=ctx['destination_airports'],
+        departure_time__date=ctx['date'],
+    )
+
+
+def _flight_search(ctx):
+    # template_views.flight_list, after resolving the typed cities
+    return keyset_page(_route_flights(ctx), 'departure')
+
+
+def _flight_search_by_price(ctx):
+    # flight_list sorted by price; later pages add a keyset filter rather than an OFFSET
+    return keyset_page(_route_flights(ctx), 'price')
+
+
+def _seat_map_holds(ctx):
+    # flight_seats: held seats for one flight
+    return Booking.objects.filter(
+        seat__flight_id=ctx['flight_id'],
+        state__in=['SEAT_HELD', 'PAYMENT_PENDING'],
+        seat_hold_until__gt=ctx['now'],
+    ).values_list('seat_id', flat=True)
+
+
+def _seat_map_seats(ctx):
+    return Seat.objects.filter(flight_id=ctx['flight_id']).order_by('row_number', 'seat_letter')
+
+
+def _booking_list_user(ctx):
+    # booking_list for a passenger, filtered by status
+    return Booking.objects.select_related('seat__flight').filter(
+        created_by_id=ctx['user_id'], state='CONFIRMED',
+    ).order_by('-created_at')
+
+
+def _booking_list_staff(ctx):
+    # booking_list for staff, filtered by origin
+    return Booking.objects.select_related('seat__flight', 'created_by').filter(
+        seat__flight__origin_airport_id__in=ctx['origin_airports'],
+    ).order_by('-created_at')[:100]
+
+
+def _expiry_scan(ctx):
+    # expire_bookings / expire_holds / expire_scheduler
+    return Booking.objects.select_related('seat').filter(state='SEAT_HELD', seat_hold_until__lt=ctx['now'])
+
+
+def _dashboard_booking_states(ctx):
+    # monitoring dashboard: the per-state booking counts, as one grouped query
+    return Booking.objects.values('state').annotate(total=Count('id')).order_by()
+
+
+def _dashboard_seat_counts(ctx):
+    return Seat.objects.values('is_booked').annotate(total=Count('id')).order_by()
+
+
+def _autocomplete(ctx):
+    # api_autocomplete.city_suggestions
+    return Airport.objects.filter(
+        departures__is_active=True, id__in=ctx['origin_airports'],
+    ).values_list('city', flat=True).distinct().order_by('city')[:10]
+
+
+HOT_QUERIES = [
+    ('airport_lookup', _airport_lookup),
+    ('flight_search', _flight_search),
+    ('flight_search_by_price', _flight_search_by_price),
+    ('seat_map_holds', _seat_map_holds),
+    ('seat_map_seats', _seat_map_seats),
+    ('booking_list_user', _booking_list_user),
+    ('booking_list_staff', _booking_list_staff),
+    ('expiry_scan', _expiry_scan),
+    ('dashboard_booking_states', _dashboard_booking_states),
+    ('dashboard_seat_counts', _dashboard_seat_counts),
+    ('autocomplete', _autocomplete),
+]
+
+
+# -- synthetic dataset -----------------------------------------------------
+
+def _dataset_tables():
+    return ', '.join(model._meta.db_table for model in (Flight, Seat, Booking, Airport, AirportAlias, User))
+
+
+def vacuum_dataset():
+    """Reclaim the pages a rolled-back dataset left behind; outside any transaction.
+
+    The planner scales its estimates by table size on disk, so without this
+    every run would see bigger tables, and higher costs, than the one before.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"VACUUM {_dataset_tables()}")
+
+
+def build_dataset(flights=500, seats_per_flight=60, seed=42):
+    """Insert a deterministic flights/seats/bookings dataset and return sample query values"""
+    rng = random.Random(seed)
+    now = timezone.now()
+    user, _ = User.objects.get_or_create(username=PLAN_USER, defaults={'email': 'plans@example.com'})
+
+    # bulk_create skips Flight.save, which would otherwise fill in the airports
+    airports = {city: airport_for_city(city) for city in CITIES}
+    flight_rows = []
+    for index in range(flights):
+        origin, destination = rng.sample(CITIES, 2)
+        departure = now + timedelta(days=rng.randint(1, 90), hours=rng.randint(0, 23))
+        flight_rows.append(Flight(
+            code=f'PL{seed % 100:02d}{index:05d}',
+            departure_time=departure,
+            arrival_time=departure + timedelta(hours=2),
+            origin=origin,
+            destination=destination,
+            origin_airport=airports[origin],
+            destination_airport=airports[destination],
+            price=Decimal(rng.randint(2000, 15000)),
+            total_seats=seats_per_flight,
+        ))
+    flight_rows = Flight.objects.bulk_create(flight_rows)
+
+    seat_rows = []
+    for flight in flight_rows:
+        for number in range(seats_per_flight):
+            row, letter = number // 6 + 1, 'ABCDEF'[number % 6]
+            seat_rows.append(Seat(
+                flight=flight, seat_number=f'{row}{letter}', row_number=row, seat_letter=letter,
+                is_booked=rng.random() < 0.4, is_window=letter in 'AF', is_aisle=letter in 'CD',
+            ))
+    seat_rows = Seat.objects.bulk_create(seat_rows, batch_size=5000)
+
+    booking_rows = []
+    states = ['CONFIRMED'] * 6 + ['SEAT_HELD', 'EXPIRED', 'CANCELLED', 'REFUNDED']
+    for seat in seat_rows:
+        if not seat.is_booked and rng.random() > 0.1:
+            continue
+        state = 'CONFIRMED' if seat.is_booked else rng.choice(states)
+        booking_rows.append(Booking(
+            seat=seat, user=user, created_by=user, state=state,
+            passenger_name='Plan Snapshot', passenger_email=f'p{seat.id}@example.com',
+            travel_date=now.date(), payment_amount=Decimal('5000'),
+            seat_hold_until=now + timedelta(minutes=rng.randint(-30, 10)),
+        ))
+    Booking.objects.bulk_create(booking_rows, batch_size=5000)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {_dataset_tables()}")
+
+    sample = flight_rows[len(flight_rows) // 2]
+    return {
+        'origin': sample.origin,
+        'destination': sample.destination,
+        'origin_airports': resolve_airports(sample.origin),
+        'destination_airports': resolve_airports(sample.destination),
+        'date': sample.departure_time.date(),
+        'flight_id': sample.id,
+        'user_id': user.id,
+        'now': now,
+    }
+
+
+# -- plans -----------------------------------------------------------------
+
+def explain(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    return json.loads(plan) if isinstance(plan, str) else plan
+
+
+def _describe(node):
+    parts = [node['Node Type']]
+    if node.get('Index Name'):
+        parts.append(f"using {_PARTITION_RE.sub('_p*', node['Index Name'])}")
+    if node.get('Relation Name'):
+        parts.append(f"on {_PARTITION_RE.sub('_p*', node['Relation Name'])}")
+    return ' '.join(parts)
+
+
+def _lines(node, depth=0):
+    lines = [f"{'  ' * depth}{_describe(node)}"]
+    previous = None
+    for child in node.get('Plans', []):
+        child_lines = _lines(child, depth + 1)
+        # Monthly partitions produce identical sibling scans; keep one
+        if child_lines != previous:
+            lines.extend(child_lines)
+        previous = child_lines
+    return lines
+
+
+def _scans(node, scans):
+    relation = node.get('Relation Name')
+    if relation:
+        scans.setdefault(_PARTITION_RE.sub('_p*', relation), set()).add(node['Node Type'])
+    for child in node.get('Plans', []):
+        _scans(child, scans)
+    return scans
+
+
+def normalize(explained):
+    """The stable parts of an EXPLAIN JSON plan: node tree, scan types and estimated cost"""
+    root = explained[0]['Plan']
+    return {
+        'nodes': _lines(root),
+        'scans': {relation: sorted(types) for relation, types in _scans(root, {}).items()},
+        'total_cost': root['Total Cost'],
+    }
+
+
+def runtime(explained):
+    """Actual time and buffer hits/reads for the report; too noisy to store"""
+    root = explained[0]['Plan']
+    return {
+        'time_ms': explained[0].get('Execution Time', root.get('Actual Total Time')),
+        'shared_hit': root.get('Shared Hit Blocks', 0),
+        'shared_read': root.get('Shared Read Blocks', 0),
+    }
+
+
+def regressions(baseline, current, cost_factor):
+    """Reasons the current plan is worse than the baseline, if any"""
+    problems = []
+    for relation, types in current['scans'].items():
+        before = set(baseline['scans'].get(relation, []))
+        if 'Seq Scan' in types and 'Seq Scan' not in before and before & INDEX_SCANS:
+            problems.append(f"{relation}: {'/'.join(sorted(before & INDEX_SCANS))} became Seq Scan")
+    if baseline['total_cost'] and current['total_cost'] > baseline['total_cost'] * cost_factor:
+        problems.append(
+            f"estimated cost {baseline['total_cost']:.1f} -> {current['total_cost']:.1f} "
+            f"(x{current['total_cost'] / baseline['total_cost']:.1f})"
+        )
+    return problems
+
+
+def load_baselines(path=BASELINE_PATH):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def save_baselines(plans, path=BASELINE_PATH):
+    with open(path, 'w') as handle:
+        json.dump(plans, handle, indent=2, sort_keys=True)
+        handle.write('\n')
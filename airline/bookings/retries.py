@@ -0,0 +1,114 @@
+import functools
+import random
+import time
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import OperationalError, connection
+from django.db.models import Model
+from .exceptions import ConcurrentUpdateError
+from .metrics import counter
+import logging
+
+logger = logging.getLogger('bookings')
+
+DB_RETRIES = counter('airline_db_retries_total', 'Service calls retried after a retryable database error', ('function', 'reason'))
+DB_RETRIES_EXHAUSTED = counter(
+    'airline_db_retries_exhausted_total', 'Service calls that still failed after their last retry', ('function', 'reason'),
+)
+
+# SQLSTATE → reason; Postgres rolls the whole transaction back for both, so it is safe to rerun
+RETRYABLE_SQLSTATES = {
+    '40001': 'serialization_failure',
+    '40P01': 'deadlock',
+}
+
+
+def retry_reason(exc):
+    """Why ``exc`` is worth retrying in a fresh transaction, or None"""
+    if not isinstance(exc, OperationalError):
+        return None
+    pgcode = getattr(exc.__cause__, 'pgcode', None)
+    if pgcode in RETRYABLE_SQLSTATES:
+        return RETRYABLE_SQLSTATES[pgcode]
+    if connection.vendor == 'sqlite' and 'database is locked' in str(exc):
+        # SQLite's equivalent: two transactions both tried to upgrade to a write lock
+        return 'database_locked'
+    return None
+
+
+def retry_delay(attempt):
+    """Exponential backoff with +/-20% jitter, capped at DB_RETRY_MAX_MS, in seconds"""
+    delay_ms = min(settings.DB_RETRY_BASE_MS * 2 ** (attempt - 1), settings.DB_RETRY_MAX_MS)
+    return delay_ms * random.uniform(0.8, 1.2) / 1000
+
+
+def _refresh(args, kwargs):
+    # The failed attempt may have changed model instances in memory; its writes were rolled back
+    for value in (*args, *kwargs.values()):
+        if isinstance(value, Model) and value.pk is not None:
+            try:
+                value.refresh_from_db()
+            except ObjectDoesNotExist:
+                # Deleted meanwhile; the next attempt finds that out under its own locks
+                pass
+
+
+def retry_on_conflict(name):
+    """Rerun a transactional service function after a deadlock or serialization failure.
+
+    Goes outside ``@transaction.atomic``, so every attempt gets a fresh
+    transaction. Called inside someone else's transaction it runs once: only
+    the outermost transaction can be retried. After DB_RETRY_ATTEMPTS
+    attempts it raises ConcurrentUpdateError.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            if connection.in_atomic_block:
+                return func(*args, **kwargs)
+            attempt = 1
+            while True:
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as e:
+                    reason = retry_reason(e)
+                    if reason is None:
+                        raise
+                    if attempt >= settings.DB_RETRY_ATTEMPTS:
+                        DB_RETRIES_EXHAUSTED.inc(function=name, reason=reason)
+                        logger.error("%s failed after %s attempts (%s): %s", name, attempt, reason, e)
+                        raise ConcurrentUpdateError("Too many people are changing this booking right now, please try again") from e
+                    DB_RETRIES.inc(function=name, reason=reason)
+                    delay = retry_delay(attempt)
+                    logger.info("%s attempt %s hit a %s, retrying in %.0fms", name, attempt, reason, delay * 1000)
+                    time.sleep(delay)
+                    _refresh(args, kwargs)
+                    attempt += 1
+        return wrapped
+    return decorator
+
+
+def begin_serializable():
+    """Run the current booking transaction at SERIALIZABLE when BOOKING_SERIALIZABLE is on.
+
+    Must be the first statement of the outermost transaction; nested calls
+    and other databases are left alone (SQLite transactions already are).
+    """
+    if (
+        settings.BOOKING_SERIALIZABLE
+        and connection.vendor == 'postgresql'
+        and len(connection.atomic_blocks) == 1
+    ):
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL SERIALIZABLE")
+
+
+def retry_counts():
+    """{(function, reason): (retried, exhausted)} recorded by this process"""
+    counts = {}
+    for key, value in DB_RETRIES.snapshot():
+        counts[tuple(key)] = (value, 0)
+    for key, value in DB_RETRIES_EXHAUSTED.snapshot():
+        retried, _ = counts.get(tuple(key), (0, 0))
+        counts[tuple(key)] = (retried, value)
+    return counts
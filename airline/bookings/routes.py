@@ -0,0 +1,352 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, namedtuple
+from datetime import date as date_cls, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db.models import Count
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.utils import timezone
+from .airports import resolve_airports
+from .metrics import gauge, histogram
+from .models import Airport, Flight, Seat
+from .pricing import fare_expression, pricing_key
+import logging
+
+logger = logging.getLogger('bookings')
+
+CONNECTION_SEARCH_SECONDS = histogram(
+    'airline_connection_search_seconds', 'Time to search the route graph for itineraries',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+ROUTE_GRAPH_FLIGHTS = gauge('airline_route_graph_flights', 'Flights in this process\'s route graph', mode='max')
+
+SORTS = ('arrival', 'price')
+
+CENTS = Decimal('0.01')
+
+# Times are epoch seconds so the window arithmetic stays on plain numbers
+Leg = namedtuple('Leg', 'id code airline origin destination departs arrives price')
+
+
+def _epoch(value):
+    return value.timestamp()
+
+
+class RouteGraph:
+    """Future active flights indexed by (origin, destination) airport, each list sorted by departure.
+
+    An itinerary is a chain of legs where each connection leaves at least the
+    minimum connection time and at most CONNECTION_MAX_HOURS after the
+    previous leg lands, and never revisits an airport.
+    """
+
+    def __init__(self, airports=None):
+        self.legs = {}
+        self.pairs = defaultdict(list)
+        self.outbound = defaultdict(set)
+        self.inbound = defaultdict(set)
+        # airport id → (iata code, city, country)
+        self.airports = airports or {}
+        self.min_connection = settings.CONNECTION_MIN_MINUTES * 60
+        self.min_connection_international = settings.CONNECTION_MIN_MINUTES_INTERNATIONAL * 60
+        self.max_connection = settings.CONNECTION_MAX_HOURS * 3600
+
+    def add(self, leg):
+        if leg.id in self.legs:
+            self.remove(leg.id)
+        self.legs[leg.id] = leg
+        pair = (leg.origin, leg.destination)
+        lst = self.pairs[pair]
+        lst.insert(bisect_left(lst, (leg.departs, leg.id)), (leg.departs, leg.id))
+        self.outbound[leg.origin].add(leg.destination)
+        self.inbound[leg.destination].add(leg.origin)
+
+    def remove(self, leg_id):
+        leg = self.legs.pop(leg_id, None)
+        if leg is None:
+            return
+        pair = (leg.origin, leg.destination)
+        lst = self.pairs[pair]
+        index = bisect_left(lst, (leg.departs, leg.id))
+        if index < len(lst) and lst[index] == (leg.departs, leg.id):
+            del lst[index]
+        if not lst:
+            del self.pairs[pair]
+            self.outbound[leg.origin].discard(leg.destination)
+            self.inbound[leg.destination].discard(leg.origin)
+
+    def _country(self, airport):
+        return self.airports.get(airport, ('', '', ''))[2]
+
+    def _min_connection(self, arriving, hub, next_destination):
+        # Either side crossing a border needs the longer international connection
+        hub_country = self._country(hub)
+        if hub_country and (
+            self._country(arriving.origin) not in ('', hub_country)
+            or self._country(next_destination) not in ('', hub_country)
+        ):
+            return self.min_connection_international
+        return self.min_connection
+
+    def _window(self, pair, earliest, latest):
+        lst = self.pairs.get(pair)
+        if not lst:
+            return ()
+        start = bisect_left(lst, (earliest,))
+        end = bisect_right(lst, (latest, float('inf')))
+        return [self.legs[leg_id] for _, leg_id in lst[start:end]]
+
+    def _connections(self, arriving, destination):
+        hub = arriving.destination
+        earliest = arriving.arrives + self._min_connection(arriving, hub, destination)
+        return self._window((hub, destination), earliest, arriving.arrives + self.max_connection)
+
+    def search(self, origins, destinations, start, end, max_stops=2, sort='arrival', limit=20):
+        """Best ``limit`` itineraries (tuples of legs) whose first leg departs in [start, end)"""
+        destinations = set(destinations)
+        # Airports one flight away from a destination: the only useful second hubs
+        feeders = set().union(*(self.inbound[d] for d in destinations)) if destinations else set()
+        found = []
+        for origin in set(origins):
+            for hub in self.outbound[origin]:
+                for first in self._window((origin, hub), start, end - 1e-6):
+                    if hub in destinations:
+                        found.append((first,))
+                        continue
+                    if max_stops >= 1:
+                        for destination in self.outbound[hub] & destinations:
+                            found.extend((first, second) for second in self._connections(first, destination))
+                    if max_stops >= 2:
+                        for hub2 in (self.outbound[hub] & feeders) - destinations - {origin}:
+                            for second in self._connections(first, hub2):
+                                for destination in self.outbound[hub2] & destinations:
+                                    found.extend(
+                                        (first, second, third) for third in self._connections(second, destination)
+                                    )
+
+        if sort == 'price':
+            key = lambda legs: (sum(leg.price for leg in legs), legs[-1].arrives, len(legs))
+        else:
+            key = lambda legs: (legs[-1].arrives, len(legs), sum(leg.price for leg in legs))
+        return heapq.nsmallest(limit, found, key=key)
+
+    def describe(self, legs):
+        def airport(airport_id):
+            code, city, _ = self.airports.get(airport_id, ('', '', ''))
+            return {'id': airport_id, 'code': code, 'city': city}
+
+        def moment(epoch):
+            return datetime.fromtimestamp(epoch, tz=dt_timezone.utc).isoformat()
+
+        return {
+            'stops': len(legs) - 1,
+            'total_price': str(sum((leg.price for leg in legs), Decimal('0'))),
+            'departure_time': moment(legs[0].departs),
+            'arrival_time': moment(legs[-1].arrives),
+            'duration_minutes': round((legs[-1].arrives - legs[0].departs) / 60),
+            'layover_minutes': [round((b.departs - a.arrives) / 60) for a, b in zip(legs, legs[1:])],
+            'legs': [
+                {
+                    'flight_id': leg.id,
+                    'code': leg.code,
+                    'airline_code': leg.airline,
+                    'origin': airport(leg.origin),
+                    'destination': airport(leg.destination),
+                    'departure_time': moment(leg.departs),
+                    'arrival_time': moment(leg.arrives),
+                    'price': str(leg.price),
+                }
+                for leg in legs
+            ],
+        }
+
+
+_FIELDS = (
+    'id', 'code', 'airline_code', 'origin_airport_id', 'destination_airport_id',
+    'departure_time', 'arrival_time', 'is_active', 'updated_at',
+)
+
+
+def _rows(flights):
+    # Legs carry the shown fare (see pricing.fare_expression), so price ranking matches search
+    return flights.values(*_FIELDS, fare=fare_expression()).order_by()
+
+
+def _leg(row):
+    return Leg(
+        row['id'], row['code'], row['airline_code'], row['origin_airport_id'], row['destination_airport_id'],
+        _epoch(row['departure_time']), _epoch(row['arrival_time']), row['fare'].quantize(CENTS),
+    )
+
+
+def _airports():
+    return {
+        airport_id: (code, city, country)
+        for airport_id, code, city, country in Airport.objects.values_list('id', 'iata_code', 'city', 'country')
+    }
+
+
+def _routable(rows, now):
+    for row in rows:
+        if row['is_active'] and row['origin_airport_id'] and row['destination_airport_id'] and row['departure_time'] > now:
+            yield row
+
+
+# One graph per process, replaced wholesale on rebuild and patched in place on refresh
+_graph = None
+_watermark = None
+_built_at = 0.0
+_pricing_key = None
+_refreshed_at = 0.0
+_lock = threading.Lock()
+# Held by the one thread querying for changes, so the others don't repeat it
+_refresh_lock = threading.Lock()
+
+
+def build_graph():
+    """Load every future active flight into a fresh graph; returns (graph, newest updated_at)"""
+    now = timezone.now()
+    graph = RouteGraph(_airports())
+    watermark = None
+    rows = _rows(Flight.objects.filter(is_active=True, departure_time__gt=now))
+    for row in _routable(rows.iterator(chunk_size=5000), now):
+        graph.add(_leg(row))
+        watermark = max(watermark or row['updated_at'], row['updated_at'])
+    return graph, watermark or now
+
+
+def _changes(since):
+    """(legs to add, flight ids to remove, airports or None, new watermark) for flights changed since ``since``"""
+    now = timezone.now()
+    watermark = since
+    # Overlap the window: a transaction can commit after rows with later timestamps were read
+    changed = _rows(Flight.objects.filter(
+        updated_at__gt=since - timedelta(seconds=settings.ROUTE_GRAPH_REFRESH_SECONDS),
+    ))
+    legs, removed = [], []
+    for row in changed:
+        if next(_routable([row], now), None) is None:
+            removed.append(row['id'])
+        else:
+            legs.append(_leg(row))
+        watermark = max(watermark, row['updated_at'])
+    airports = _airports() if legs or removed else None
+    return legs, removed, airports, watermark
+
+
+def _apply(graph, legs, removed, airports):
+    for flight_id in removed:
+        graph.remove(flight_id)
+    for leg in legs:
+        graph.add(leg)
+    if airports is not None:
+        graph.airports = airports
+
+
+def get_graph():
+    """This process's route graph, rebuilt every ROUTE_GRAPH_REBUILD_SECONDS and refreshed incrementally in between"""
+    global _graph, _watermark, _built_at, _refreshed_at, _pricing_key
+    now = time.monotonic()
+    prices = pricing_key()
+    if _graph is None or now - _built_at >= settings.ROUTE_GRAPH_REBUILD_SECONDS or prices != _pricing_key:
+        # Built outside the lock so searches keep using the old graph meanwhile;
+        # deleted and bulk-updated flights, and repriced fares, only show up here
+        started = time.perf_counter()
+        graph, watermark = build_graph()
+        with _lock:
+            _graph, _watermark, _built_at, _refreshed_at, _pricing_key = graph, watermark, now, now, prices
+        ROUTE_GRAPH_FLIGHTS.set(len(graph.legs))
+        logger.info(f"Route graph built: {len(graph.legs)} flights, {len(graph.pairs)} routes in {time.perf_counter() - started:.2f}s")
+    elif now - _refreshed_at >= settings.ROUTE_GRAPH_REFRESH_SECONDS and _refresh_lock.acquire(blocking=False):
+        # Queried without _lock, so searches carry on against the graph meanwhile; only patching it holds the lock
+        try:
+            graph = _graph
+            legs, removed, airports, watermark = _changes(_watermark)
+            with _lock:
+                # A rebuild may have replaced the graph while the query ran; it already has these changes
+                if _graph is graph:
+                    _apply(graph, legs, removed, airports)
+                    _watermark, _refreshed_at = watermark, now
+        finally:
+            _refresh_lock.release()
+        ROUTE_GRAPH_FLIGHTS.set(len(_graph.legs))
+    return _graph
+
+
+def _available_seats(flight_ids):
+    return dict(
+        Seat.objects.filter(flight_id__in=flight_ids, is_booked=False)
+        .values('flight_id').annotate(free=Count('id')).values_list('flight_id', 'free')
+    )
+
+
+def search_itineraries(origin, destination, day, sort='arrival', max_stops=2, passengers=1, limit=20):
+    """Direct and connecting itineraries departing on ``day``, with seats for ``passengers`` on every leg"""
+    origins, destinations = resolve_airports(origin), resolve_airports(destination)
+    if not origins or not destinations:
+        return []
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    end = start + timedelta(days=1)
+    start = max(start, timezone.now())
+
+    graph = get_graph()
+    started = time.perf_counter()
+    with _lock:
+        # Over-fetch: some candidates drop out on seat availability below
+        candidates = graph.search(origins, destinations, _epoch(start), _epoch(end), max_stops, sort, limit * 4)
+        described = [(legs, graph.describe(legs)) for legs in candidates]
+    CONNECTION_SEARCH_SECONDS.observe(time.perf_counter() - started)
+
+    free = _available_seats({leg.id for legs, _ in described for leg in legs})
+    return [
+        itinerary for legs, itinerary in described
+        if all(free.get(leg.id, 0) >= passengers for leg in legs)
+    ][:limit]
+
+
+def connection_search_view(request):
+    """JSON itineraries for ``?origin=&destination=&date=YYYY-MM-DD`` with optional sort, max_stops, passengers and limit"""
+    origin = request.GET.get('origin', '').strip()
+    destination = request.GET.get('destination', '').strip()
+    sort = request.GET.get('sort', 'arrival')
+    if not origin or not destination:
+        return HttpResponseBadRequest('origin and destination are required')
+    if sort not in SORTS:
+        return HttpResponseBadRequest(f"sort must be one of {', '.join(SORTS)}")
+    try:
+        day = date_cls.fromisoformat(request.GET.get('date', '')) if request.GET.get('date') else timezone.localdate()
+        max_stops = min(max(int(request.GET.get('max_stops', 2)), 0), 2)
+        passengers = max(int(request.GET.get('passengers', 1)), 1)
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+    except ValueError:
+        return HttpResponseBadRequest('date must be YYYY-MM-DD; max_stops, passengers and limit must be integers')
+
+    try:
+        itineraries = search_itineraries(origin, destination, day, sort, max_stops, passengers, limit)
+    except OverflowError:
+        # The day after date.max, or a timestamp past the platform's range
+        return HttpResponseBadRequest('date is out of range')
+    return JsonResponse({
+        'origin': origin,
+        'destination': destination,
+        'date': day.isoformat(),
+        'sort': sort,
+        'count': len(itineraries),
+        'itineraries': itineraries,
+    })
+
+
+def connections_for_search(origin, destination, date, passengers):
+    """Connecting itineraries for the flight list's search form; direct flights are already listed there"""
+    if not (origin and destination and date):
+        return []
+    try:
+        day = date_cls.fromisoformat(date)
+        passengers = max(int(passengers or 1), 1)
+        itineraries = search_itineraries(origin, destination, day, 'arrival', 2, passengers, settings.CONNECTION_RESULTS_LIMIT)
+    except (ValueError, OverflowError):
+        return []
+    return [itinerary for itinerary in itineraries if itinerary['stops']]
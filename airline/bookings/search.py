@@ -0,0 +1,238 @@
+import base64
+import json
+from datetime import date as date_cls, datetime, timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import and_, or_
+from django.conf import settings
+from django.db.models import Count, DurationField, Exists, ExpressionWrapper, F, OuterRef, Q
+from django.db.models.lookups import GreaterThanOrEqual, LessThan
+from django.http import HttpResponseBadRequest, JsonResponse
+from .airports import resolve_airports
+from .models import AdminUser, Flight, Seat
+from .pricing import fare_expression
+
+# Sort name → the (ascending) column it keys on; ties are broken by id
+SORTS = {
+    'departure': 'departure_time',
+    'price': 'fare',
+    'duration': 'duration',
+}
+
+FACETS = ('airline', 'time', 'price', 'seat_class')
+
+# Local departure hour ranges, [start, end)
+TIME_BUCKETS = (
+    ('night', 0, 6),
+    ('morning', 6, 12),
+    ('afternoon', 12, 18),
+    ('evening', 18, 24),
+)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _price_buckets():
+    # On the shown fare itself rather than an annotation, so the facet aggregate stays one flat query
+    fare = fare_expression()
+    edges = [0, *settings.SEARCH_PRICE_BUCKETS]
+    buckets = [
+        (f'{lo}-{hi}', Q(GreaterThanOrEqual(fare, lo), LessThan(fare, hi)))
+        for lo, hi in zip(edges, edges[1:])
+    ]
+    buckets.append((f'{edges[-1]}+', Q(GreaterThanOrEqual(fare, edges[-1]))))
+    return buckets
+
+
+def facet_options():
+    """Facet → [(value, condition on a Flight row)]"""
+    return {
+        'airline': [(code, Q(airline_code=code)) for code, _ in AdminUser.AIRLINE_CHOICES],
+        'time': [
+            (name, Q(departure_time__hour__gte=start, departure_time__hour__lt=end))
+            for name, start, end in TIME_BUCKETS
+        ],
+        'price': _price_buckets(),
+        'seat_class': [
+            (seat_class, Q(Exists(Seat.objects.filter(flight=OuterRef('pk'), seat_class=seat_class, is_booked=False))))
+            for seat_class, _ in Seat.SEAT_CLASS_CHOICES
+        ],
+    }
+
+
+def search_date(value):
+    """The search form's ``date`` (YYYY-MM-DD) as a date, or None when empty; ValueError when malformed"""
+    if not value:
+        return None
+    try:
+        return date_cls.fromisoformat(value)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid date {value!r}, expected YYYY-MM-DD") from e
+
+
+def route_flights(origin='', destination='', date=None):
+    """Active flights matching the search form's route and date; what the facets count over"""
+    flights = Flight.objects.filter(is_active=True)
+    if origin:
+        flights = flights.filter(origin_airport_id__in=resolve_airports(origin))
+    if destination:
+        flights = flights.filter(destination_airport_id__in=resolve_airports(destination))
+    if date:
+        flights = flights.filter(departure_time__date=date)
+    return flights
+
+
+def chosen_filters(options, selected):
+    """Facet → one condition ORing its selected values; facets with nothing selected are left out"""
+    chosen = {}
+    for facet, values in options.items():
+        conditions = [condition for value, condition in values if value in selected.get(facet, ())]
+        if conditions:
+            chosen[facet] = reduce(or_, conditions)
+    return chosen
+
+
+def facet_aggregates(options, chosen):
+    """Count() per facet value for one ``aggregate()`` call.
+
+    Each count applies every selected facet except its own, so the other values
+    of a facet stay visible (and countable) after one of them is picked.
+    """
+    aggregates = {}
+    for facet, values in options.items():
+        others = [condition for other, condition in chosen.items() if other != facet]
+        for index, (value, condition) in enumerate(values):
+            aggregates[f'{facet}_{index}'] = Count('id', filter=reduce(and_, others, condition))
+    return aggregates
+
+
+def facet_counts(options, totals, selected):
+    return {
+        facet: [
+            {'value': value, 'count': totals[f'{facet}_{index}'], 'selected': value in selected.get(facet, ())}
+            for index, (value, _) in enumerate(values)
+            if totals[f'{facet}_{index}'] or value in selected.get(facet, ())
+        ]
+        for facet, values in options.items()
+    }
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value // timedelta(microseconds=1)
+    return str(value)
+
+
+def _decode_value(sort, value):
+    if sort == 'departure':
+        return datetime.fromisoformat(value)
+    if sort == 'duration':
+        return timedelta(microseconds=int(value))
+    return Decimal(value)
+
+
+def encode_cursor(flight, sort):
+    payload = json.dumps([_encode_value(getattr(flight, SORTS[sort])), flight.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, sort):
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return _decode_value(sort, value), int(last_id)
+    except (ValueError, TypeError, ArithmeticError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+
+def keyset_page(flights, sort, cursor=None, size=None):
+    """One page of ``flights`` in ``sort`` order after ``cursor``; fetches size + 1 rows to know if there is more"""
+    size = size or settings.SEARCH_PAGE_SIZE
+    key = SORTS[sort]
+    flights = flights.annotate(
+        duration=ExpressionWrapper(F('arrival_time') - F('departure_time'), output_field=DurationField()),
+        # The price shown, sorted and faceted on (see pricing.fare_expression)
+        fare=fare_expression(),
+    )
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort)
+        flights = flights.filter(Q(**{f'{key}__gt': value}) | Q(**{key: value, 'id__gt': last_id}))
+    return flights.order_by(key, 'id')[:size + 1]
+
+
+def split_page(rows, sort, size=None):
+    """(this page, cursor for the next one or None) from keyset_page's size + 1 rows"""
+    size = size or settings.SEARCH_PAGE_SIZE
+    rows = list(rows)
+    if len(rows) > size:
+        return rows[:size], encode_cursor(rows[size - 1], sort)
+    return rows, None
+
+
+def search_params(query):
+    """(sort, cursor, {facet: [selected values]}) from a request's GET parameters"""
+    sort = query.get('sort', 'departure')
+    if sort not in SORTS:
+        sort = 'departure'
+    selected = {facet: query.getlist(facet) for facet in FACETS if query.getlist(facet)}
+    return sort, query.get('cursor') or None, selected
+
+
+def with_links(query, facets, next_cursor):
+    """Add a toggle ``url`` to every facet value plus the sort and next-page links, keeping the rest of the search"""
+    def url(**changes):
+        params = query.copy()
+        params.pop('cursor', None)
+        for name, values in changes.items():
+            params.setlist(name, values)
+        return '?' + params.urlencode()
+
+    for facet, values in facets.items():
+        current = query.getlist(facet)
+        for option in values:
+            toggled = [v for v in current if v != option['value']] if option['selected'] else current + [option['value']]
+            option['url'] = url(**{facet: toggled})
+    links = {name: url(sort=[name]) for name in SORTS}
+    next_url = url(cursor=[next_cursor]) if next_cursor else None
+    return links, next_url
+
+
+def flight_search_view(request):
+    """JSON flight search: ``?origin=&destination=&date=&sort=&cursor=`` plus facet values, with facet counts"""
+    sort, cursor, selected = search_params(request.GET)
+    try:
+        date = search_date(request.GET.get('date', ''))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    options = facet_options()
+    chosen = chosen_filters(options, selected)
+    flights = route_flights(request.GET.get('origin', ''), request.GET.get('destination', ''), date)
+
+    try:
+        rows, next_cursor = split_page(keyset_page(flights.filter(*chosen.values()), sort, cursor), sort)
+    except InvalidCursor as e:
+        return HttpResponseBadRequest(str(e))
+    totals = flights.aggregate(**facet_aggregates(options, chosen))
+
+    return JsonResponse({
+        'sort': sort,
+        'next_cursor': next_cursor,
+        'flights': [
+            {
+                'id': flight.id,
+                'code': flight.code,
+                'airline_code': flight.airline_code,
+                'origin': flight.origin,
+                'destination': flight.destination,
+                'departure_time': flight.departure_time.isoformat(),
+                'arrival_time': flight.arrival_time.isoformat(),
+                'duration_minutes': round(flight.duration.total_seconds() / 60),
+                'price': f'{flight.fare:.2f}',
+            }
+            for flight in rows
+        ],
+        'facets': facet_counts(options, totals, selected),
+    })
@@ -0,0 +1,197 @@
+import asyncio
+import itertools
+import json
+import select
+import threading
+import time
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .fares import invalidate_flight
+import logging
+
+logger = logging.getLogger('bookings')
+
+# Seat status pushed to watchers for each booking state a seat moves into
+SEAT_STATUS_BY_STATE = {
+    'SEAT_HELD': 'held',
+    'CONFIRMED': 'booked',
+    'CANCELLED': 'released',
+    'EXPIRED': 'expired',
+}
+
+# Events buffered per watcher before it is told to resync instead
+WATCHER_QUEUE_SIZE = 100
+
+_event_ids = itertools.count(1)
+
+
+class LocalSeatEventBroker:
+    """In-process broker: publishes straight to this process's subscribers"""
+
+    def __init__(self):
+        self._callbacks = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, flight_id, callback):
+        with self._lock:
+            self._callbacks.setdefault(flight_id, set()).add(callback)
+
+    def unsubscribe(self, flight_id, callback):
+        with self._lock:
+            callbacks = self._callbacks.get(flight_id, set())
+            callbacks.discard(callback)
+            if not callbacks:
+                self._callbacks.pop(flight_id, None)
+
+    def publish(self, flight_id, event):
+        self.deliver(flight_id, event)
+
+    def deliver(self, flight_id, event):
+        with self._lock:
+            callbacks = list(self._callbacks.get(flight_id, ()))
+        for callback in callbacks:
+            callback(event)
+
+
+class PostgresSeatEventBroker(LocalSeatEventBroker):
+    """Multi-node broker over Postgres LISTEN/NOTIFY.
+
+    Every process runs one listener connection and fans notifications out to
+    its local subscribers, so a flight costs one subscription per node.
+    """
+
+    channel = 'seat_events'
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def publish(self, flight_id, event):
+        payload = json.dumps({'flight_id': flight_id, **event})
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [self.channel, payload])
+
+    def subscribe(self, flight_id, callback):
+        super().subscribe(flight_id, callback)
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='seat-events-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                raw = connection.get_new_connection(connection.get_connection_params())
+                raw.autocommit = True
+                with raw.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                logger.info(f"Listening for seat events on channel {self.channel}")
+                while True:
+                    if select.select([raw], [], [], 5) == ([], [], []):
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        notify = raw.notifies.pop(0)
+                        event = json.loads(notify.payload)
+                        self.deliver(event.pop('flight_id'), event)
+            except Exception as e:
+                logger.error(f"Seat event listener failed, reconnecting: {e}")
+                time.sleep(1)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.SEAT_EVENTS_BROKER)()
+        return _broker
+
+
+def _offer(queue, event):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # The watcher fell behind; drop its backlog and tell it to reload
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait({'id': next(_event_ids), 'status': 'resync'})
+
+
+class FlightHub:
+    """Fans one broker subscription for a flight out to every local watcher"""
+
+    def __init__(self, flight_id):
+        self.flight_id = flight_id
+        self._watchers = {}
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=WATCHER_QUEUE_SIZE)
+        with _hubs_lock:
+            if not self._watchers:
+                get_broker().subscribe(self.flight_id, self.dispatch)
+            self._watchers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue):
+        with _hubs_lock:
+            self._watchers.pop(queue, None)
+            if not self._watchers:
+                get_broker().unsubscribe(self.flight_id, self.dispatch)
+                _hubs.pop(self.flight_id, None)
+
+    @property
+    def watcher_count(self):
+        return len(self._watchers)
+
+    def dispatch(self, event):
+        with _hubs_lock:
+            watchers = list(self._watchers.items())
+        for queue, loop in watchers:
+            loop.call_soon_threadsafe(_offer, queue, event)
+
+
+_hubs = {}
+_hubs_lock = threading.RLock()
+
+
+def get_hub(flight_id):
+    with _hubs_lock:
+        hub = _hubs.get(flight_id)
+        if hub is None:
+            hub = _hubs[flight_id] = FlightHub(flight_id)
+        return hub
+
+
+def publish_seat_event(flight_id, seat_id, seat_number, status):
+    event = {
+        'id': next(_event_ids),
+        'seat_id': seat_id,
+        'seat_number': seat_number,
+        'status': status,
+        'at': timezone.now().isoformat(),
+    }
+    try:
+        get_broker().publish(flight_id, event)
+    except Exception as e:
+        # Live updates are best effort; never fail a booking over them
+        logger.error(f"Failed to publish seat event for flight {flight_id}: {e}")
+
+
+def notify_seat_change(seat, status):
+    """Publish a seat status change once the surrounding transaction commits"""
+    transaction.on_commit(
+        lambda: publish_seat_event(seat.flight_id, seat.id, seat.seat_number, status)
+    )
+    # Availability changed, so the route's cached fare calendars are stale
+    invalidate_flight(seat.flight_id, seat.flight if type(seat).flight.is_cached(seat) else None)
+
+
+def format_sse(event):
+    name = 'resync' if event['status'] == 'resync' else 'seat'
+    return f"id: {event['id']}\nevent: {name}\ndata: {json.dumps(event)}\n\n"
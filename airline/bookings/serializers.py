@@ -18,6 +18,9 @@ class FlightSerializer(serializers.ModelSerializer):
         ]
         
     def get_available_seats(self, obj):
+        # Querysets annotated with available_seats_count skip the per-flight COUNT
+        if hasattr(obj, 'available_seats_count'):
+            return obj.available_seats_count
         return obj.seats.filter(is_booked=False).count()
         
     def validate_code(self, value):
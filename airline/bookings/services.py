@@ -1,20 +1,48 @@
 import random
+import time
 from datetime import timedelta
-from django.db import transaction
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import Q
 from django.utils import timezone
 from .models import Seat, Booking
+from .pricing import quote
+from .metrics import BOOKINGS_CREATED, PAYMENTS, record_expiry_run
+from .tracing import traced
+from .contention import record_lock_wait
+from .cdc import record_booking_event
+from .db_router import bound_transaction, is_lock_timeout
+from .retries import begin_serializable, retry_on_conflict
 from .state_machine import transition
-from .exceptions import SeatNotAvailableError, PaymentError, BookingError
+from .exceptions import SeatNotAvailableError, PaymentError, BookingError, BookingExpiredError, InvalidStateTransitionError
 import logging
 
 logger = logging.getLogger('bookings')
 
+@traced('services.create_booking')
+@retry_on_conflict('create_booking')
 @transaction.atomic
 def create_booking(seat_id, passenger_data, user=None):
-    logger.info(f"Creating booking for seat {seat_id} by user {user.username if user else 'Anonymous'}")
+    begin_serializable()
+    bound_transaction()
+    logger.debug("Creating booking for seat %s by user %s", seat_id, user.username if user else 'Anonymous')
     
-    seat = Seat.objects.select_for_update().filter(id=seat_id).first()
+    lock_started = time.perf_counter()
+    try:
+        seat = Seat.objects.select_for_update().filter(id=seat_id).first()
+    except OperationalError as e:
+        if not is_lock_timeout(e):
+            raise
+        # lock_timeout (DB_LOCK_TIMEOUT_MS) gave up waiting on another booking of this seat
+        logger.warning("Timed out waiting for the lock on seat %s", seat_id)
+        raise SeatNotAvailableError("This seat is being booked by someone else, please try again")
+    record_lock_wait('create_booking', seat, lock_started)
 
+    return hold_seat(seat, seat_id, passenger_data, user)
+
+
+def hold_seat(seat, seat_id, passenger_data, user=None):
+    """Place a hold on an already locked ``seat``; runs inside the caller's transaction"""
     if not seat:
         logger.warning(f"Seat {seat_id} does not exist")
         raise SeatNotAvailableError("Seat does not exist")
@@ -22,6 +50,13 @@ def create_booking(seat_id, passenger_data, user=None):
     if seat.is_booked:
         logger.warning(f"Seat {seat_id} already booked")
         raise SeatNotAvailableError("Seat already booked")
+
+    # Checked under the seat lock, so two claims can't both hold the seat
+    if seat.bookings.filter(
+        Q(state__in=('PAYMENT_PENDING', 'CONFIRMED')) | Q(state='SEAT_HELD', seat_hold_until__gt=timezone.now())
+    ).exists():
+        logger.warning("Seat %s already held", seat_id)
+        raise SeatNotAvailableError("Seat is held by another passenger")
     
     # Check if flight is in the future
     if seat.flight.departure_time <= timezone.now():
@@ -37,29 +72,90 @@ def create_booking(seat_id, passenger_data, user=None):
         travel_date=seat.flight.departure_time.date(),
         state="INITIATED",
         seat_hold_until=timezone.now() + timedelta(minutes=10),
-        payment_amount=seat.flight.price,
+        payment_amount=quote(seat.flight, seat.seat_class),
         created_by=user
     )
+    record_booking_event(booking, 'booking.created', to_state=booking.state)
     
     # Follow state machine: INITIATED → SEAT_HELD
     transition(booking, "SEAT_HELD")
+    transaction.on_commit(BOOKINGS_CREATED.inc)
     
-    logger.info(f"Booking {booking.booking_reference} created successfully")
+    logger.info("Booking %s created successfully", booking.booking_reference)
     return booking
 
 
+def claim_seat(seat_id, passenger_data, user=None):
+    """Create a booking, through the per-flight coalescer when BOOKING_COALESCE is on"""
+    if settings.BOOKING_COALESCE:
+        from .coalescer import submit_claim
+        return submit_claim(seat_id, passenger_data, user)
+    return create_booking(seat_id, passenger_data, user)
+
+
+def lock_booking(booking, operation):
+    """Lock ``booking``'s seat, then reload ``booking`` and its seat; runs inside the caller's transaction.
+
+    Claims lock the same seat row, so every change to a seat's bookings is
+    serialized on it and acts on the current state, not on the caller's copy.
+    The wait is recorded under ``operation``. Raises BookingError when the
+    booking was deleted meanwhile.
+    """
+    lock_started = time.perf_counter()
+    seat = Seat.objects.select_for_update().get(id=booking.seat_id)
+    record_lock_wait(operation, seat, lock_started)
+    try:
+        booking.refresh_from_db()
+    except Booking.DoesNotExist:
+        raise BookingError("This booking no longer exists")
+    booking.seat = seat
+
+
 def mock_payment():
     return random.choice(["SUCCESS", "FAILURE"])
 
 
-@transaction.atomic
+@traced('services.process_payment')
 def process_payment(booking, user=None):
+    """Charge for a held seat; returns whether the payment succeeded"""
+    start_payment(booking)
+    # Charged once, between the two transactions, so a rerun after a conflict never charges again
+    payment_result = mock_payment()
+    PAYMENTS.inc(result=payment_result.lower())
+    try:
+        return record_payment(booking, payment_result == "SUCCESS", user)
+    except Exception:
+        # Left PAYMENT_PENDING with the charge already made; needs reconciling by hand
+        logger.error("Payment %s for booking %s was made but not recorded", payment_result, booking.id)
+        raise
+
+
+@retry_on_conflict('start_payment')
+@transaction.atomic
+def start_payment(booking):
+    """Move a live hold to PAYMENT_PENDING before it is charged.
+
+    Checked under the seat lock, so an expired hold is never charged; once
+    PAYMENT_PENDING, the hold can no longer expire or be claimed by someone else.
+    """
+    begin_serializable()
+    bound_transaction()
+    lock_booking(booking, 'start_payment')
+    if booking.state == "SEAT_HELD" and booking.seat_hold_until and booking.seat_hold_until <= timezone.now():
+        # The seat may already be someone else's
+        raise BookingExpiredError("The seat hold has expired, please select the seat again")
     # Follow state machine: SEAT_HELD → PAYMENT_PENDING
     transition(booking, "PAYMENT_PENDING")
 
-    payment_result = mock_payment()
-    
-    if payment_result == "SUCCESS":
+
+@retry_on_conflict('record_payment')
+@transaction.atomic
+def record_payment(booking, succeeded, user=None):
+    """Apply a payment's outcome to a PAYMENT_PENDING ``booking``: CONFIRMED, or CANCELLED when it failed"""
+    begin_serializable()
+    bound_transaction()
+    lock_booking(booking, 'record_payment')
+    if succeeded:
         # PAYMENT_PENDING → CONFIRMED
         transition(booking, "CONFIRMED")
         booking.seat.is_booked = True
@@ -74,8 +170,13 @@ def process_payment(booking, user=None):
         return False
 
 
+@traced('services.cancel_booking')
+@retry_on_conflict('cancel_booking')
 @transaction.atomic
 def cancel_booking(booking, user=None):
+    begin_serializable()
+    bound_transaction()
+    lock_booking(booking, 'cancel_booking')
     if booking.state != "CONFIRMED":
         raise BookingError("Only confirmed bookings can be cancelled")
     
@@ -91,18 +192,54 @@ def cancel_booking(booking, user=None):
     booking.save()
 
 
+@traced('services.refund_booking')
+@retry_on_conflict('refund_booking')
 @transaction.atomic
 def refund_booking(booking, user=None):
+    begin_serializable()
+    bound_transaction()
+    lock_booking(booking, 'refund_booking')
     if booking.refund_processed:
         raise BookingError("Refund already processed")
     if booking.state != "CANCELLED":
         raise BookingError("Only cancelled bookings can be refunded")
 
-    # CANCELLED → REFUNDED
-    transition(booking, "REFUNDED")
-    
     booking.refund_processed = True
     booking.refund_date = timezone.now()
     booking.refund_amount = booking.payment_amount
     booking.updated_by = user
-    booking.save()
+
+    # CANCELLED → REFUNDED; set the refund first so the feed event and notification carry it
+    transition(booking, "REFUNDED")
+
+
+@retry_on_conflict('expire_hold')
+@transaction.atomic
+def expire_hold(booking, now=None):
+    """Expire ``booking`` if it is still a hold past its seat_hold_until; returns whether it did"""
+    now = now or timezone.now()
+    # Re-read under the seat lock: a payment or delete that got in first leaves nothing to expire
+    try:
+        lock_booking(booking, 'expire_hold')
+    except BookingError:
+        return False
+    if booking.state != 'SEAT_HELD' or booking.seat_hold_until >= now:
+        return False
+    transition(booking, 'EXPIRED')
+    return True
+
+
+def expire_holds(job):
+    """Expire every seat hold past its seat_hold_until; returns (expired, failed) and records the run as ``job``"""
+    started = time.perf_counter()
+    now = timezone.now()
+    expired = failed = 0
+    for booking in Booking.objects.filter(state='SEAT_HELD', seat_hold_until__lt=now):
+        try:
+            if expire_hold(booking, now):
+                expired += 1
+        except Exception as e:
+            failed += 1
+            logger.error("Failed to expire booking %s: %s", booking.id, e)
+    record_expiry_run(job, started, failed)
+    return expired, failed
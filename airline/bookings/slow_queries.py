@@ -0,0 +1,173 @@
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger('bookings.slow_queries')
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_RE = re.compile(r'%s|\?')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+_current_view = ContextVar('slow_query_view', default=None)
+
+# Our own middleware and wrappers are never the interesting call site
+_SKIPPED_FILES = {
+    __file__,
+    str(settings.BASE_DIR / 'bookings' / 'metrics.py'),
+    str(settings.BASE_DIR / 'bookings' / 'db_router.py'),
+    str(settings.BASE_DIR / 'bookings' / 'tracing.py'),
+    str(settings.BASE_DIR / 'bookings' / 'admission.py'),
+    str(settings.BASE_DIR / 'bookings' / 'profiling.py'),
+    str(settings.BASE_DIR / 'bookings' / 'memory.py'),
+}
+
+
+def fingerprint(sql):
+    """SQL with literals and placeholders replaced, so repeats of one query group together"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _PLACEHOLDER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('(...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def _call_site():
+    # Innermost frame in project code, skipping Django, third-party and middleware
+    base_dir = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(base_dir) and 'site-packages' not in filename and filename not in _SKIPPED_FILES:
+            return f"{filename[len(base_dir) + 1:]}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+class SlowQueryLog:
+    """Bounded ring buffer of the queries that took longer than the threshold"""
+
+    def __init__(self, size):
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def top_offenders(self, limit=20):
+        """Queries grouped by fingerprint, worst total time first"""
+        groups = {}
+        for entry in self.entries():
+            group = groups.get(entry['fingerprint'])
+            if group is None:
+                group = groups[entry['fingerprint']] = {
+                    'fingerprint': entry['fingerprint'],
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'views': set(),
+                    'call_sites': set(),
+                    'example': entry,
+                }
+            group['count'] += 1
+            group['total_ms'] += entry['duration_ms']
+            if entry['duration_ms'] >= group['max_ms']:
+                group['max_ms'] = entry['duration_ms']
+                group['example'] = entry
+            group['views'].add(entry['view'] or '-')
+            if entry['call_site']:
+                group['call_sites'].add(entry['call_site'])
+
+        offenders = sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)[:limit]
+        for group in offenders:
+            group['mean_ms'] = group['total_ms'] / group['count']
+            group['views'] = sorted(group['views'])
+            group['call_sites'] = sorted(group['call_sites'])
+        return offenders
+
+
+SLOW_QUERIES = SlowQueryLog(settings.SLOW_QUERY_BUFFER_SIZE)
+
+
+def capture_slow_queries(execute, sql, params, many, context):
+    """Connection execute wrapper recording every query slower than SLOW_QUERY_MS"""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms >= settings.SLOW_QUERY_MS:
+            rowcount = getattr(context['cursor'], 'rowcount', -1)
+            entry = {
+                'at': timezone.now(),
+                'alias': context['connection'].alias,
+                'fingerprint': fingerprint(sql),
+                'sql': sql[:2000],
+                'duration_ms': duration_ms,
+                'rows': rowcount if rowcount >= 0 else None,
+                'view': _current_view.get(),
+                'call_site': _call_site(),
+            }
+            SLOW_QUERIES.add(entry)
+            logger.warning(
+                "%.1fms rows=%s view=%s at=%s db=%s sql=%s",
+                duration_ms, entry['rows'], entry['view'] or '-', entry['call_site'] or '-',
+                entry['alias'], entry['fingerprint'],
+            )
+
+
+def install_on_connection(sender, connection, **kwargs):
+    """connection_created receiver; the wrapper list survives reconnects, so add it once"""
+    if capture_slow_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(capture_slow_queries)
+
+
+class SlowQueryViewMiddleware:
+    """Tags slow queries with the view that ran them"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = _current_view.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_view.reset(token)
+
+    async def __acall__(self, request):
+        token = _current_view.set(None)
+        try:
+            return await self.get_response(request)
+        finally:
+            _current_view.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        _current_view.set(match.view_name if match else view_func.__name__)
+        return None
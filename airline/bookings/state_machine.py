@@ -1,4 +1,11 @@
+from django.db import transaction
+from django.utils import timezone
 from .exceptions import InvalidStateTransitionError
+from .metrics import BOOKING_TRANSITIONS, EXPIRY_LAG_SECONDS, HOLD_TO_CONFIRM_SECONDS
+from .cdc import record_booking_event
+from .outbox import enqueue_booking_notification, notification_kind
+from .seat_events import SEAT_STATUS_BY_STATE, notify_seat_change
+from .tracing import span
 
 ALLOWED_TRANSITIONS = {
     "INITIATED": ["SEAT_HELD"],
@@ -11,5 +18,25 @@ ALLOWED_TRANSITIONS = {
 def transition(booking, next_state):
     if next_state not in ALLOWED_TRANSITIONS.get(booking.state, []):
         raise InvalidStateTransitionError(f"Invalid transition {booking.state} → {next_state}")
-    booking.state = next_state
-    booking.save()
+    previous_state = booking.state
+    # Atomic even when the caller isn't, so the feed event and outbox row commit or roll back with the state change
+    with span('state_machine.transition', from_state=previous_state, to_state=next_state), transaction.atomic():
+        booking.state = next_state
+        booking.save()
+
+        if next_state in SEAT_STATUS_BY_STATE:
+            notify_seat_change(booking.seat, SEAT_STATUS_BY_STATE[next_state])
+
+        record_booking_event(booking, 'booking.transitioned', previous_state, next_state)
+        kind = notification_kind(previous_state, next_state)
+        if kind:
+            enqueue_booking_notification(booking, kind)
+    transaction.on_commit(lambda: _record_transition(booking, previous_state, next_state, timezone.now()))
+
+
+def _record_transition(booking, previous_state, next_state, at):
+    BOOKING_TRANSITIONS.inc(from_state=previous_state, to_state=next_state)
+    if next_state == "CONFIRMED" and booking.created_at:
+        HOLD_TO_CONFIRM_SECONDS.observe((at - booking.created_at).total_seconds())
+    elif next_state == "EXPIRED" and booking.seat_hold_until:
+        EXPIRY_LAG_SECONDS.observe(max((at - booking.seat_hold_until).total_seconds(), 0))
@@ -0,0 +1,261 @@
+import itertools
+import random
+import re
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import Airport, Booking, BookingEvent, Flight, OutboxMessage, Seat
+from .services import create_booking, expire_hold, lock_booking, process_payment, cancel_booking
+from .cdc import record_booking_event
+from .exceptions import BookingError, ConcurrentUpdateError
+from .invariants import check_invariants
+import logging
+
+logger = logging.getLogger('bookings')
+
+# Relative weight of each operation fired by the stress workers
+OPERATION_WEIGHTS = {
+    'claim': 40,
+    'pay': 25,
+    'cancel': 10,
+    'expire': 15,
+    'delete': 10,
+}
+
+# Operations that write Seat.is_booked, used to narrow flight-level reports
+SEAT_WRITING_OPERATIONS = ('pay', 'cancel', 'delete')
+
+
+class EventLog:
+    """Thread-safe record of every operation the workers ran, in start order"""
+
+    def __init__(self):
+        self._events = []
+        self._lock = threading.Lock()
+        self._sequence = itertools.count(1)
+        self.origin = time.perf_counter()
+
+    def now(self):
+        return (time.perf_counter() - self.origin) * 1000
+
+    def record(self, **event):
+        event['seq'] = next(self._sequence)
+        with self._lock:
+            self._events.append(event)
+
+    @property
+    def events(self):
+        with self._lock:
+            return sorted(self._events, key=lambda e: (e['started_ms'], e['seq']))
+
+    def for_seats(self, seat_ids, operations=None):
+        seat_ids = set(seat_ids)
+        return [
+            e for e in self.events
+            if e['seat_id'] in seat_ids and (operations is None or e['op'] in operations)
+        ]
+
+
+STRESS_CODE_RE = re.compile(r'ST\d{8}')
+# Cities no real flight serves: they mark stress flights, and their airports only exist for them
+STRESS_ORIGIN = 'Stress Origin'
+STRESS_DESTINATION = 'Stress Destination'
+
+
+def is_stress_flight(flight):
+    """Whether ``flight`` is one create_stress_flight made: never sold, so safe to fill with junk bookings"""
+    return bool(
+        STRESS_CODE_RE.fullmatch(flight.code)
+        and not flight.is_active
+        and flight.origin == STRESS_ORIGIN
+        and flight.destination == STRESS_DESTINATION
+    )
+
+
+@transaction.atomic
+def delete_stress_flight(flight):
+    """Delete a stress flight with everything the run left: bookings, their outbox rows and feed events,
+    and the stress airports once no other kept stress flight uses them"""
+    if not is_stress_flight(flight):
+        raise ValueError(f"Flight {flight.code} is not a stress flight")
+    # Don't email the made-up stress passengers or feed them downstream
+    booking_ids = list(Booking.objects.filter(seat__flight=flight).values_list('id', flat=True))
+    OutboxMessage.objects.filter(booking_id__in=booking_ids).delete()
+    BookingEvent.objects.filter(data__flight_id=flight.id).delete()
+    airport_ids = {flight.origin_airport_id, flight.destination_airport_id} - {None}
+    flight.delete()
+    Airport.objects.filter(id__in=airport_ids, departures=None, arrivals=None).delete()
+
+
+def create_stress_flight(seat_count):
+    """Create a future flight with a handful of seats for the workers to fight over"""
+    departure = timezone.now() + timedelta(days=7)
+    flight = Flight.objects.create(
+        code=f"ST{random.randint(10000000, 99999999)}",
+        departure_time=departure,
+        arrival_time=departure + timedelta(hours=2),
+        origin=STRESS_ORIGIN,
+        destination=STRESS_DESTINATION,
+        price=Decimal('1000.00'),
+        total_seats=seat_count,
+        is_active=False,
+    )
+    letters = ['A', 'B', 'C', 'D', 'E', 'F']
+    Seat.objects.bulk_create([
+        Seat(
+            flight=flight,
+            seat_number=f"{i // 6 + 1}{letters[i % 6]}",
+            row_number=i // 6 + 1,
+            seat_letter=letters[i % 6],
+        )
+        for i in range(seat_count)
+    ])
+    return flight
+
+
+def _pick_booking(seat_ids, states, rng):
+    candidates = list(
+        Booking.objects.select_related('seat__flight')
+        .filter(seat_id__in=seat_ids, state__in=states)[:50]
+    )
+    return rng.choice(candidates) if candidates else None
+
+
+def _claim(seat_ids, rng, worker, step):
+    seat_id = rng.choice(seat_ids)
+    passenger_data = {
+        'passenger_name': f"Stress Worker {worker}",
+        'passenger_email': f"stress{worker}.{step}@example.com",
+    }
+    booking = create_booking(seat_id, passenger_data)
+    return seat_id, booking.id, booking.state
+
+
+def _pay(seat_ids, rng, worker, step):
+    booking = _pick_booking(seat_ids, ['SEAT_HELD'], rng)
+    if not booking:
+        return None, None, 'no held booking'
+    process_payment(booking)
+    return booking.seat_id, booking.id, booking.state
+
+
+def _cancel(seat_ids, rng, worker, step):
+    booking = _pick_booking(seat_ids, ['CONFIRMED'], rng)
+    if not booking:
+        return None, None, 'no confirmed booking'
+    cancel_booking(booking)
+    return booking.seat_id, booking.id, booking.state
+
+
+def _expire(seat_ids, rng, worker, step):
+    # Force the hold to lapse, then expire it the way expire_holds does
+    booking = _pick_booking(seat_ids, ['SEAT_HELD'], rng)
+    if not booking:
+        return None, None, 'no held booking'
+    Booking.objects.filter(id=booking.id, state='SEAT_HELD').update(seat_hold_until=timezone.now() - timedelta(seconds=1))
+    if not expire_hold(booking):
+        return booking.seat_id, booking.id, f'already {booking.state}'
+    return booking.seat_id, booking.id, booking.state
+
+
+def _delete(seat_ids, rng, worker, step):
+    # Mirrors template_views.delete_booking
+    booking = _pick_booking(seat_ids, ['SEAT_HELD', 'INITIATED'], rng)
+    if not booking:
+        return None, None, 'no deletable booking'
+    seat_id, booking_id = booking.seat_id, booking.id
+    with transaction.atomic():
+        lock_booking(booking, 'delete_booking')
+        if booking.state not in ('SEAT_HELD', 'INITIATED'):
+            raise BookingError("Cannot delete confirmed or processed bookings")
+        booking.seat.is_booked = False
+        booking.seat.save()
+        record_booking_event(booking, 'booking.deleted', from_state=booking.state)
+        booking.delete()
+    return seat_id, booking_id, 'DELETED'
+
+
+OPERATIONS = {
+    'claim': _claim,
+    'pay': _pay,
+    'cancel': _cancel,
+    'expire': _expire,
+    'delete': _delete,
+}
+
+
+def _worker(worker, seat_ids, steps, seed, barrier, log):
+    rng = random.Random(seed)
+    names = list(OPERATION_WEIGHTS)
+    weights = [OPERATION_WEIGHTS[name] for name in names]
+    try:
+        barrier.wait()
+        for step in range(steps):
+            op = rng.choices(names, weights)[0]
+            started = log.now()
+            seat_id, booking_id, outcome, detail = None, None, 'ok', ''
+            try:
+                seat_id, booking_id, detail = OPERATIONS[op](seat_ids, rng, worker, step)
+                if booking_id is None:
+                    outcome = 'skipped'
+            except ConcurrentUpdateError as e:
+                # Ran out of deadlock/serialization retries, not a business rule
+                outcome, detail = 'gave_up', str(e)
+            except BookingError as e:
+                outcome, detail = 'rejected', str(e)
+            except Exception as e:
+                outcome, detail = 'error', f"{type(e).__name__}: {e}"
+            log.record(
+                worker=worker, op=op, seat_id=seat_id, booking_id=booking_id,
+                outcome=outcome, detail=detail, started_ms=started, finished_ms=log.now(),
+            )
+    finally:
+        connection.close()
+
+
+def run_stress(seats, workers=8, operations=400, seed=None):
+    """Fire concurrent claims, payments, cancellations and expiries at the given seats.
+
+    Returns the event log and the invariant violations found afterwards.
+    """
+    seat_ids = [seat.id for seat in seats]
+    flight_ids = sorted({seat.flight_id for seat in seats})
+    seed = seed if seed is not None else random.randrange(2 ** 32)
+    steps = max(1, operations // workers)
+    log = EventLog()
+    barrier = threading.Barrier(workers)
+
+    logger.info(f"Stress run: {workers} workers x {steps} ops on {len(seat_ids)} seats (seed {seed})")
+    threads = [
+        threading.Thread(
+            target=_worker,
+            args=(worker, seat_ids, steps, seed + worker, barrier, log),
+            name=f"stress-{worker}",
+        )
+        for worker in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return log, check_invariants(flight_ids)
+
+
+def interleaving_for(log, check, violation, seat_ids_by_flight=None):
+    """Events that touched the seat (or flight) behind a violation"""
+    if 'seat_id' in violation:
+        return log.for_seats([violation['seat_id']])
+    seat_ids = (seat_ids_by_flight or {}).get(violation['flight_id'], [])
+    return log.for_seats(seat_ids, SEAT_WRITING_OPERATIONS)
+
+
+def format_event(event):
+    return (
+        f"t+{event['started_ms']:8.1f}ms..{event['finished_ms']:8.1f}ms "
+        f"[worker-{event['worker']}] {event['op']:<6} seat={event['seat_id']} "
+        f"booking={event['booking_id']} -> {event['outcome']} {event['detail']}"
+    ).rstrip()
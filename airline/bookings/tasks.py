@@ -0,0 +1,69 @@
+"""Job queue tasks, run by `manage.py run_jobs` workers (see bookings.jobs)"""
+import csv
+import gzip
+import os
+from datetime import date
+from django.conf import settings
+from .db_router import use_workload
+from .jobs import task
+from .models import Booking
+from .outbox import dispatch_batch
+from .pricing import reprice_all
+import logging
+
+logger = logging.getLogger('bookings')
+
+EXPORT_FIELDS = [
+    'id', 'booking_reference', 'state', 'passenger_name', 'passenger_email', 'seat__flight__code',
+    'seat__seat_number', 'travel_date', 'payment_amount', 'refund_amount', 'created_at', 'confirmed_date',
+    'cancelled_date', 'refund_date',
+]
+
+
+@task('bookings.expire_holds', queue='maintenance', max_attempts=1)
+def expire_holds():
+    from .services import expire_holds as expire
+    expire('job_queue')
+
+
+@task('bookings.reprice_flights', queue='maintenance', max_attempts=1)
+def reprice_flights():
+    if settings.DYNAMIC_PRICING:
+        reprice_all()
+
+
+@task('bookings.dispatch_outbox', queue='notifications', max_attempts=1)
+def dispatch_outbox():
+    while any(dispatch_batch()):
+        pass
+
+
+@task('bookings.refund_booking', queue='refunds')
+def refund_booking(booking_id):
+    from .services import refund_booking as refund
+    booking = Booking.objects.select_related('seat').get(id=booking_id)
+    if booking.refund_processed:
+        return
+    refund(booking)
+
+
+@task('bookings.export_bookings', queue='exports', max_attempts=3)
+def export_bookings(start, end, filename=None):
+    """Bookings created between two ISO dates (inclusive) as CSV.gz under JOB_EXPORT_DIR"""
+    start, end = date.fromisoformat(start), date.fromisoformat(end)
+    os.makedirs(settings.JOB_EXPORT_DIR, exist_ok=True)
+    path = os.path.join(settings.JOB_EXPORT_DIR, filename or f'bookings-{start}-{end}.csv.gz')
+    rows = (
+        Booking.objects.filter(created_at__date__gte=start, created_at__date__lte=end)
+        .order_by('created_at').values_list(*EXPORT_FIELDS).iterator(chunk_size=5000)
+    )
+    count = 0
+    tmp = f'{path}.tmp'
+    with use_workload('batch'), gzip.open(tmp, 'wt', newline='') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    os.replace(tmp, path)
+    logger.info(f"Exported {count} booking(s) to {path}")
@@ -2,10 +2,20 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
-from django.db import models
+from django.db import models, transaction
 from .models import Flight, Seat, Booking
-from .services import create_booking, process_payment, cancel_booking, refund_booking
+from .services import claim_seat, lock_booking, process_payment, cancel_booking, refund_booking
 from .exceptions import SeatNotAvailableError, BookingError, InvalidStateTransitionError, PaymentError
+from .seat_events import notify_seat_change
+from .cdc import record_booking_event
+from .airports import resolve_airports
+from .routes import connections_for_search
+from .fares import calendar_for_search
+from .pricing import quote
+from .search import (
+    InvalidCursor, chosen_filters, facet_aggregates, facet_counts, facet_options, keyset_page, search_date,
+    search_params, split_page, with_links,
+)
 from django.contrib.auth.models import User
 from django.contrib.auth import login
 import logging
@@ -13,28 +23,50 @@ import logging
 logger = logging.getLogger('bookings')
 
 def flight_list(request):
-    logger.info(f"Flight list accessed with params: {request.GET}")
+    logger.info("Flight list accessed with params: %s", request.GET)
     
     origin = request.GET.get('origin', '')
     destination = request.GET.get('destination', '')
     date = request.GET.get('date', '')
     passengers = request.GET.get('passengers', '1')
+    try:
+        search_date(date)
+    except ValueError:
+        # A mangled date searches every day, as if it were left empty
+        date = ''
     
+    # The per-step counts cost a query each, so only run them when DEBUG is on
+    debug = logger.isEnabledFor(logging.DEBUG)
     flights = Flight.objects.filter(is_active=True)
-    logger.info(f"Total active flights: {flights.count()}")
+    if debug:
+        logger.debug("Total active flights: %s", flights.count())
     
+    # Typed text becomes airport ids once; the flight filter is then an indexed equality
     if origin:
-        flights = flights.filter(origin__icontains=origin)
-        logger.info(f"After origin filter '{origin}': {flights.count()}")
+        flights = flights.filter(origin_airport_id__in=resolve_airports(origin))
+        if debug:
+            logger.debug("After origin filter '%s': %s", origin, flights.count())
     if destination:
-        flights = flights.filter(destination__icontains=destination)
-        logger.info(f"After destination filter '{destination}': {flights.count()}")
+        flights = flights.filter(destination_airport_id__in=resolve_airports(destination))
+        if debug:
+            logger.debug("After destination filter '%s': %s", destination, flights.count())
     if date:
         flights = flights.filter(departure_time__date=date)
-        logger.info(f"After date filter '{date}': {flights.count()}")
+        if debug:
+            logger.debug("After date filter '%s': %s", date, flights.count())
     
-    flights = flights.order_by('departure_time')[:20]
-    logger.info(f"Final flights count: {len(flights)}")
+    # Facets count over the route and date; the page also applies the selected facets
+    sort, cursor, selected = search_params(request.GET)
+    options = facet_options()
+    chosen = chosen_filters(options, selected)
+    try:
+        page = keyset_page(flights.filter(*chosen.values()), sort, cursor)
+    except InvalidCursor:
+        page = keyset_page(flights.filter(*chosen.values()), sort)
+    facets = facet_counts(options, flights.aggregate(**facet_aggregates(options, chosen)), selected)
+    flights, next_cursor = split_page(page, sort)
+    sort_links, next_url = with_links(request.GET, facets, next_cursor)
+    logger.info("Final flights count: %s", len(flights))
     
     # Add seat statistics
     for flight in flights:
@@ -45,10 +77,16 @@ def flight_list(request):
         flight.total_seats_count = total_seats
         flight.booked_seats_count = booked_seats
         flight.available_seats_count = available_seats
-        logger.info(f"Flight {flight.code}: {available_seats}/{total_seats} available")
+        logger.debug("Flight %s: %s/%s available", flight.code, available_seats, total_seats)
     
     return render(request, 'bookings/flight_list_simple.html', {
         'flights': flights,
+        'connections': connections_for_search(origin, destination, date, passengers),
+        'fare_calendar': calendar_for_search(origin, destination, date, passengers),
+        'facets': facets,
+        'sort': sort,
+        'sort_links': sort_links,
+        'next_url': next_url,
         'origin': origin,
         'destination': destination,
         'date': date,
@@ -106,7 +144,12 @@ def book_seat(request, seat_id):
     seat_numbers = request.GET.get('seat_numbers', seat.seat_number).split(',')
     selected_seats = seat_numbers[:passengers]  # Ensure we don't exceed passenger count
     
-    total_price = seat.flight.price * passengers
+    # Each seat is charged its class's current fare, the same quote create_booking records
+    quoted = [
+        quote(seat.flight, s.seat_class)
+        for s in Seat.objects.filter(flight=seat.flight, seat_number__in=selected_seats)
+    ]
+    total_price = sum(quoted) if len(quoted) == passengers else quote(seat.flight, seat.seat_class) * passengers
     
     if request.method == 'POST':
         try:
@@ -129,7 +172,7 @@ def book_seat(request, seat_id):
                                 flight=seat.flight, 
                                 seat_number=selected_seats[i-1]
                             )
-                            booking = create_booking(passenger_seat.id, passenger_data, request.user)
+                            booking = claim_seat(passenger_seat.id, passenger_data, request.user)
                             bookings_created.append(booking)
                         except Seat.DoesNotExist:
                             messages.error(request, f'Seat {selected_seats[i-1]} not found.')
@@ -141,7 +184,7 @@ def book_seat(request, seat_id):
                     'passenger_email': request.POST.get('passenger_email'),
                     'passenger_phone': request.POST.get('passenger_phone', '')
                 }
-                booking = create_booking(seat_id, passenger_data, request.user)
+                booking = claim_seat(seat_id, passenger_data, request.user)
                 bookings_created.append(booking)
             
             if bookings_created:
@@ -184,9 +227,9 @@ def booking_list(request):
     if status_filter:
         bookings = bookings.filter(state=status_filter)
     if origin_filter:
-        bookings = bookings.filter(seat__flight__origin__icontains=origin_filter)
+        bookings = bookings.filter(seat__flight__origin_airport_id__in=resolve_airports(origin_filter))
     if destination_filter:
-        bookings = bookings.filter(seat__flight__destination__icontains=destination_filter)
+        bookings = bookings.filter(seat__flight__destination_airport_id__in=resolve_airports(destination_filter))
     
     # Limit results for performance
     if request.user.is_staff:
@@ -252,11 +295,11 @@ def payment_page(request, booking_id):
 @login_required
 def process_booking_payment(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id, created_by=request.user)
-    logger.info(f"Processing payment for booking {booking_id} by user {request.user.username}")
+    logger.debug("Processing payment for booking %s by user %s", booking_id, request.user.username)
     
     try:
         payment_success = process_payment(booking, request.user)
-        logger.info(f"Payment result for booking {booking_id}: {payment_success}")
+        logger.info("Payment result for booking %s: %s", booking_id, payment_success)
         
         if payment_success:
             messages.success(request, f'Payment processed successfully! Booking confirmed. Reference: {booking.booking_reference}')
@@ -326,12 +369,24 @@ def delete_booking(request, booking_id):
         return redirect('booking-detail-gui', booking_id=booking.id)
     
     if request.method == 'POST':
-        # Release the seat
-        booking.seat.is_booked = False
-        booking.seat.save()
-        
-        # Delete the booking
-        booking.delete()
+        with transaction.atomic():
+            # Re-check under the seat lock: a payment may have gone through meanwhile
+            try:
+                lock_booking(booking, 'delete_booking')
+            except BookingError:
+                return redirect('booking-list-gui')
+            if booking.state not in ['SEAT_HELD', 'INITIATED']:
+                messages.error(request, 'Cannot delete confirmed or processed bookings.')
+                return redirect('booking-detail-gui', booking_id=booking.id)
+
+            # Release the seat
+            booking.seat.is_booked = False
+            booking.seat.save()
+            notify_seat_change(booking.seat, 'released')
+            
+            # Delete the booking
+            record_booking_event(booking, 'booking.deleted', from_state=booking.state)
+            booking.delete()
         messages.success(request, 'Booking deleted successfully!')
         return redirect('booking-list-gui')
     
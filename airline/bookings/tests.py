@@ -1,3 +1,305 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipIf
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.db import transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.test import APIClient
+from . import db_router, fares, pricing
+from .coalescer import FlightQueue, _Claim
+from .db_router import PIN_SESSION_KEY, PRIMARY, PrimaryReplicaRouter, ReadYourWritesMiddleware
+from .exceptions import SeatNotAvailableError
+from .models import Booking, Flight, FlightFare, Seat
+from .services import create_booking, process_payment
 
-# Create your tests here.
+
+def make_flight(code='AI100', seats=2, **fields):
+    """A flight a week out, Mumbai to Delhi, with ``seats`` economy seats in row 1"""
+    departure = timezone.now() + timedelta(days=7)
+    flight = Flight.objects.create(**{
+        'code': code, 'departure_time': departure, 'arrival_time': departure + timedelta(hours=2),
+        'origin': 'Mumbai', 'destination': 'Delhi', 'price': Decimal('100.00'), 'total_seats': seats,
+        **fields,
+    })
+    for letter in 'ABCDEF'[:seats]:
+        Seat.objects.create(flight=flight, seat_number=f'1{letter}', row_number=1, seat_letter=letter)
+    return flight
+
+
+def passenger(name='Asha Rao'):
+    return {'passenger_name': name, 'passenger_email': 'asha@example.com'}
+
+
+@override_settings(REPLICA_DATABASES=['replica1'], REPLICA_MAX_LAG_SECONDS=5, READ_YOUR_WRITES_SECONDS=10)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Reads only leave the primary for opted-in GETs from sessions that have not just written.
+
+    A TransactionTestCase: TestCase's per-test transaction would route every read to the primary.
+    """
+
+    def setUp(self):
+        db_router._lag_cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+        lag = mock.patch.object(db_router, 'replica_lag', return_value=0.0)
+        self.replica_lag = lag.start()
+        self.addCleanup(lag.stop)
+
+    def serve(self, path, method='get', session=None, write=False):
+        """Run a request through ReadYourWritesMiddleware; the alias its view read from and the session"""
+        request = getattr(self.factory, method)(path)
+        request.session = session if session is not None else SessionStore()
+        request.resolver_match = resolve(path)
+        seen = {}
+
+        def view(request):
+            middleware.process_view(request, None, (), {})
+            seen['read'] = self.router.db_for_read(Flight)
+            if write:
+                self.router.db_for_write(Flight)
+                seen['after_write'] = self.router.db_for_read(Flight)
+            return None
+
+        middleware = ReadYourWritesMiddleware(view)
+        middleware(request)
+        return seen, request.session
+
+    def test_reads_outside_a_request_use_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Flight), PRIMARY)
+
+    def test_replica_read_view_reads_the_replica(self):
+        seen, _ = self.serve('/')
+        self.assertEqual(seen['read'], 'replica1')
+
+    def test_other_views_read_the_primary(self):
+        seen, _ = self.serve('/api/flight-search/')
+        self.assertEqual(seen['read'], PRIMARY)
+
+    def test_reads_inside_a_transaction_use_the_primary(self):
+        with db_router.use_replica(), transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Flight), PRIMARY)
+
+    def test_write_moves_the_rest_of_the_request_to_the_primary(self):
+        seen, session = self.serve('/', write=True)
+        self.assertEqual(seen['read'], 'replica1')
+        self.assertEqual(seen['after_write'], PRIMARY)
+        self.assertGreater(session[PIN_SESSION_KEY], timezone.now().timestamp())
+
+    def test_pinned_session_reads_the_primary(self):
+        _, session = self.serve('/', method='post')
+        seen, _ = self.serve('/', session=session)
+        self.assertEqual(seen['read'], PRIMARY)
+
+    def test_pin_expires(self):
+        session = SessionStore()
+        session[PIN_SESSION_KEY] = timezone.now().timestamp() - 1
+        seen, _ = self.serve('/', session=session)
+        self.assertEqual(seen['read'], 'replica1')
+
+    def test_lagging_replica_falls_back_to_the_primary(self):
+        self.replica_lag.return_value = 30.0
+        seen, _ = self.serve('/')
+        self.assertEqual(seen['read'], PRIMARY)
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_without_replicas_nothing_is_pinned(self):
+        _, session = self.serve('/', method='post')
+        self.assertNotIn(PIN_SESSION_KEY, session)
+
+
+class ReplicaLagTests(SimpleTestCase):
+    def setUp(self):
+        db_router._lag_cache.clear()
+        self.addCleanup(db_router._lag_cache.clear)
+
+    @override_settings(REPLICA_LAG_CHECK_SECONDS=60)
+    def test_lag_is_cached(self):
+        with mock.patch.object(db_router.time, 'monotonic', return_value=1000.0):
+            db_router._lag_cache[PRIMARY] = (990.0, 42.0)
+            self.assertEqual(db_router.replica_lag(PRIMARY), 42.0)
+
+    @override_settings(REPLICA_DATABASES=[PRIMARY], REPLICA_MAX_LAG_SECONDS=5, REPLICA_LAG_CHECK_SECONDS=60)
+    def test_unhealthy_replicas_are_skipped(self):
+        with mock.patch.object(db_router.time, 'monotonic', return_value=1000.0):
+            db_router._lag_cache[PRIMARY] = (990.0, 30.0)
+            self.assertEqual(db_router.healthy_replicas(), [])
+            db_router._lag_cache[PRIMARY] = (990.0, 1.0)
+            self.assertEqual(db_router.healthy_replicas(), [PRIMARY])
+
+
+class CoalescerTests(TestCase):
+    """A coalesced batch commits every claim that succeeds, whatever the others in it do"""
+
+    def setUp(self):
+        self.flight = make_flight(seats=3)
+        self.seats = list(self.flight.seats.order_by('seat_number'))
+
+    def apply(self, *claims):
+        batch = [_Claim(seat.id, data, None) for seat, data in claims]
+        FlightQueue(self.flight.id)._apply(batch)
+        return [claim.future for claim in batch]
+
+    def test_each_claim_gets_its_own_outcome(self):
+        first, duplicate, other = self.apply(
+            (self.seats[0], passenger()), (self.seats[0], passenger('Ben Ito')), (self.seats[1], passenger('Cy Ode')),
+        )
+        self.assertEqual(first.result().seat_id, self.seats[0].id)
+        self.assertIsInstance(duplicate.exception(), SeatNotAvailableError)
+        self.assertEqual(other.result().seat_id, self.seats[1].id)
+        self.assertEqual(Booking.objects.filter(seat__flight=self.flight).count(), 2)
+
+    def test_database_error_only_undoes_its_own_claim(self):
+        # No passenger name violates NOT NULL mid-insert; without its savepoint the whole batch would be lost
+        first, broken, last = self.apply(
+            (self.seats[0], passenger()), (self.seats[1], passenger(None)), (self.seats[2], passenger('Cy Ode')),
+        )
+        self.assertIsNotNone(broken.exception())
+        self.assertEqual(
+            set(Booking.objects.filter(seat__flight=self.flight).values_list('id', flat=True)),
+            {first.result().id, last.result().id},
+        )
+        self.assertFalse(Booking.objects.filter(seat=self.seats[1]).exists())
+
+
+class PaymentTests(TestCase):
+    """A hold is checked, and moved to PAYMENT_PENDING, before it is charged"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('asha', password='x')
+        self.seat = make_flight().seats.first()
+        self.booking = create_booking(self.seat.id, passenger(), self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        charge = mock.patch('bookings.services.mock_payment', return_value='SUCCESS')
+        self.charge = charge.start()
+        self.addCleanup(charge.stop)
+
+    def pay(self):
+        return self.client.post(f'/api/bookings/{self.booking.pk}/pay/')
+
+    def test_successful_payment_confirms(self):
+        response = self.pay()
+        self.assertEqual(response.status_code, 200)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.state, 'CONFIRMED')
+        self.assertTrue(Seat.objects.get(id=self.seat.id).is_booked)
+
+    def test_failed_payment_cancels(self):
+        self.charge.return_value = 'FAILURE'
+        self.assertFalse(process_payment(self.booking, self.user))
+        self.assertEqual(self.booking.state, 'CANCELLED')
+        self.assertFalse(Seat.objects.get(id=self.seat.id).is_booked)
+
+    def test_expired_hold_is_rejected_without_charging(self):
+        Booking.objects.filter(id=self.booking.id).update(seat_hold_until=timezone.now() - timedelta(seconds=1))
+        response = self.pay()
+        self.assertEqual(response.status_code, 400)
+        self.charge.assert_not_called()
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.state, 'SEAT_HELD')
+
+    def test_paying_twice_is_rejected(self):
+        self.assertEqual(self.pay().status_code, 200)
+        self.assertEqual(self.pay().status_code, 400)
+        self.charge.assert_called_once()
+
+
+class FareCalendarTests(TestCase):
+    """Cached calendars are served until their route's version moves on"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.flight = make_flight()
+        self.route = (self.flight.origin_airport_id, self.flight.destination_airport_id)
+        self.day = timezone.localdate(self.flight.departure_time)
+
+    def version(self):
+        origin, destination = self.route
+        return fares.route_version([origin], [destination])
+
+    def lowest_fare(self):
+        (day,) = fares.fare_calendar('Mumbai', 'Delhi', self.day, days=0)
+        return day['lowest_fare']
+
+    def test_lowest_fare_per_day(self):
+        (day,) = fares.fare_calendar('Mumbai', 'Delhi', self.day, days=0)
+        self.assertEqual(day['lowest_fare'], '100.00')
+        self.assertEqual(day['seats_available'], 2)
+        self.assertTrue(day['available'])
+
+    def test_cached_until_the_route_is_invalidated(self):
+        self.assertEqual(self.lowest_fare(), '100.00')
+        Flight.objects.filter(id=self.flight.id).update(price=Decimal('150.00'))
+        self.assertEqual(self.lowest_fare(), '100.00')
+        fares.invalidate_route(*self.route)
+        self.assertEqual(self.lowest_fare(), '150.00')
+
+    def test_invalidate_flight_waits_for_commit(self):
+        version = self.version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            fares.invalidate_flight(self.flight.id)
+        self.assertEqual(self.version(), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(self.version(), version)
+
+    def test_evicted_version_never_goes_back(self):
+        version = int(self.version())
+        fares.invalidate_route(*self.route)
+        cache.delete(fares._version_key(*self.route))
+        self.assertGreater(int(self.version()), version + 1)
+
+
+@override_settings(DYNAMIC_PRICING=True)
+class RepricingTests(TestCase):
+    """Quotes switch to a repricing run's fares once it publishes, and never back to an older run's"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.flight = make_flight()
+
+    def reprice(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return pricing.reprice_all()
+
+    def test_quotes_use_the_published_version(self):
+        self.assertEqual(pricing.quote(self.flight, 'ECONOMY'), self.flight.price)
+        version, count = self.reprice()
+        self.assertEqual(count, 1)
+        fare = FlightFare.objects.get(flight=self.flight, seat_class='ECONOMY')
+        self.assertEqual(fare.version, version)
+        self.assertEqual(pricing.current_version(), version)
+        self.assertEqual(pricing.quote(self.flight, 'ECONOMY'), fare.price)
+        self.assertEqual(pricing.pricing_key(), f'p{version}')
+
+    def test_next_run_moves_quotes_on(self):
+        first, _ = self.reprice()
+        old = pricing.quote(self.flight, 'ECONOMY')
+        self.flight.seats.filter(seat_number='1A').update(is_booked=True)
+        second, _ = self.reprice()
+        self.assertEqual(second, first + 1)
+        new = FlightFare.objects.get(flight=self.flight, seat_class='ECONOMY').price
+        self.assertGreater(new, old)
+        self.assertEqual(pricing.quote(self.flight, 'ECONOMY'), new)
+
+    def test_late_publish_never_moves_the_version_back(self):
+        pricing.publish(2, [], [])
+        pricing.publish(1, [], [])
+        self.assertEqual(pricing.current_version(), 2)
+
+    @override_settings(DYNAMIC_PRICING=False)
+    def test_base_price_without_dynamic_pricing(self):
+        self.reprice()
+        self.assertEqual(pricing.quote(self.flight, 'ECONOMY'), self.flight.price)
+        self.assertEqual(pricing.pricing_key(), 'base')
+
+    @skipIf(pricing.np is None, 'NumPy is not installed')
+    def test_numpy_and_python_fares_agree(self):
+        args = ([100.0, 250.0, 1000.0], [0.0, 0.5, 1.0], [30.0, 2.0, -1.0])
+        self.assertEqual(pricing.compute_fares_numpy(*args), pricing.compute_fares_python(*args))
@@ -0,0 +1,325 @@
+import functools
+import json
+import random
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+from django.utils.module_loading import import_string
+import logging
+
+logger = logging.getLogger('bookings')
+trace_logger = logging.getLogger('bookings.traces')
+
+# W3C trace context: version-traceid-parentid-flags
+TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current_span = ContextVar('trace_span', default=None)
+
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'start', 'end', 'attributes')
+
+    def __init__(self, trace, name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.end = None
+        self.attributes = attributes or {}
+        trace.spans.append(self)
+
+    def finish(self, end=None):
+        self.end = end or time.time()
+
+    @property
+    def duration_ms(self):
+        return ((self.end or time.time()) - self.start) * 1000
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'duration_ms': round(self.duration_ms, 3),
+            'attributes': self.attributes,
+        }
+
+
+class Trace:
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.spans = []
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Child span of the current one; a no-op when the request isn't being traced"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.attributes['error'] = repr(e)
+        raise
+    finally:
+        child.finish()
+        _current_span.reset(token)
+
+
+def traced(name=None):
+    """Decorator wrapping every call of a function in a span"""
+    def decorator(func):
+        span_name = name or f'{func.__module__}.{func.__qualname__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def parse_traceparent(header):
+    match = TRACEPARENT_RE.match(header or '')
+    if not match or match.group(1) == '0' * 32:
+        return None
+    return match.group(1), match.group(2), int(match.group(3), 16) & 1 == 1
+
+
+def format_traceparent(root):
+    return f'00-{root.trace.trace_id}-{root.span_id}-01'
+
+
+# -- exporters ---------------------------------------------------------------
+
+class InMemoryCollector:
+    """Keeps the last TRACE_BUFFER_SIZE traces for the monitoring waterfall page"""
+
+    def __init__(self):
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def export(self, root):
+        spans = [s.to_dict() for s in root.trace.spans]
+        with self._lock:
+            self._traces[root.trace.trace_id] = {'root': root.to_dict(), 'spans': spans}
+            while len(self._traces) > settings.TRACE_BUFFER_SIZE:
+                self._traces.popitem(last=False)
+
+    def recent(self):
+        with self._lock:
+            return [trace['root'] for trace in reversed(self._traces.values())]
+
+    def get(self, trace_id):
+        with self._lock:
+            return self._traces.get(trace_id)
+
+
+class NDJSONExporter:
+    """One JSON line per span in logs/traces.ndjson, written by the queued log writer"""
+
+    def export(self, root):
+        for finished in root.trace.spans:
+            trace_logger.info(json.dumps(finished.to_dict(), default=str))
+
+
+_exporters = None
+_exporters_lock = threading.Lock()
+
+
+def get_exporters():
+    global _exporters
+    with _exporters_lock:
+        if _exporters is None:
+            _exporters = [import_string(path)() for path in settings.TRACE_EXPORTERS]
+        return _exporters
+
+
+def get_collector():
+    return next((e for e in get_exporters() if isinstance(e, InMemoryCollector)), None)
+
+
+def export(root):
+    for exporter in get_exporters():
+        try:
+            exporter.export(root)
+        except Exception as e:
+            logger.error(f"Trace exporter {type(exporter).__name__} failed: {e}")
+
+
+# -- instrumentation ---------------------------------------------------------
+
+class TracingMiddleware:
+    """Starts a trace for sampled requests; first in MIDDLEWARE.
+
+    Continues an incoming traceparent header's trace (and, with
+    TRACE_TRUST_INCOMING, follows its sampled flag) and returns the request's
+    own traceparent so callers can correlate.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        root = self._start(request)
+        if root is None:
+            return self.get_response(request)
+        token = _current_span.set(root)
+        try:
+            response = self.get_response(request)
+            root.attributes['http.status'] = response.status_code
+            response['traceparent'] = format_traceparent(root)
+            return response
+        except Exception as e:
+            root.attributes['error'] = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(request, root)
+
+    async def __acall__(self, request):
+        root = self._start(request)
+        if root is None:
+            return await self.get_response(request)
+        token = _current_span.set(root)
+        try:
+            response = await self.get_response(request)
+            root.attributes['http.status'] = response.status_code
+            response['traceparent'] = format_traceparent(root)
+            return response
+        except Exception as e:
+            root.attributes['error'] = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(request, root)
+
+    def _start(self, request):
+        """The request's root span, or None when it isn't sampled"""
+        trace_id, remote_parent, sampled = parse_traceparent(request.headers.get('traceparent')) or (None, None, None)
+        if sampled is None or not settings.TRACE_TRUST_INCOMING:
+            sampled = random.random() < settings.TRACE_SAMPLE_RATE
+        if not sampled:
+            return None
+        root = Span(Trace(trace_id), f'{request.method} {request.path}', remote_parent, {
+            'http.method': request.method,
+            'http.path': request.path,
+        })
+        request.trace_root = root
+        return root
+
+    def _finish(self, request, root):
+        root.finish()
+        match = getattr(request, 'resolver_match', None)
+        if match:
+            root.attributes['view'] = match.view_name
+        self._middleware_spans(root)
+        export(root)
+
+    def _middleware_spans(self, root):
+        # The middleware stack's own time is whatever the view span doesn't cover
+        view = next((s for s in root.trace.spans if s.name == 'view' and s.parent_id == root.span_id), None)
+        if view is None:
+            return
+        before = Span(root.trace, 'middleware.request', root.span_id)
+        before.start, before.end = root.start, view.start
+        after = Span(root.trace, 'middleware.response', root.span_id)
+        after.start, after.end = view.end, root.end
+
+
+class TracingViewMiddleware:
+    """Last in MIDDLEWARE, so its span covers URL resolution, the view and response rendering"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with span('view') as view_span:
+            response = self.get_response(request)
+            self._name(request, view_span)
+            return response
+
+    async def __acall__(self, request):
+        with span('view') as view_span:
+            response = await self.get_response(request)
+            self._name(request, view_span)
+            return response
+
+    def _name(self, request, view_span):
+        if view_span is not None and getattr(request, 'resolver_match', None):
+            view_span.attributes['view'] = request.resolver_match.view_name
+
+
+def trace_queries(execute, sql, params, many, context):
+    """Connection execute wrapper adding a span per query to traced requests"""
+    if _current_span.get() is None:
+        return execute(sql, params, many, context)
+    from .slow_queries import fingerprint
+    attributes = {'db.alias': context['connection'].alias, 'db.statement': fingerprint(sql)[:500]}
+    if 'FOR UPDATE' in sql:
+        attributes['db.for_update'] = True
+    with span('db.query', **attributes):
+        return execute(sql, params, many, context)
+
+
+def install_on_connection(sender, connection, **kwargs):
+    if trace_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(trace_queries)
+
+
+class _TracedTemplate:
+    def __init__(self, template):
+        self.template = template
+        self.origin = template.origin
+
+    def render(self, context=None, request=None):
+        if _current_span.get() is None:
+            return self.template.render(context, request)
+        with span('template.render', template=self.origin.template_name):
+            return self.template.render(context, request)
+
+
+class TracedDjangoTemplates(DjangoTemplates):
+    """The Django template backend with a span around every render"""
+
+    def from_string(self, template_code):
+        return _TracedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TracedTemplate(super().get_template(template_name))
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     FlightListCreateView,
@@ -28,6 +29,12 @@ from .monitoring_views import (
     monitoring_dashboard,
     monitoring_flights,
     monitoring_bookings,
+    monitoring_slow_queries,
+    monitoring_traces,
+    monitoring_trace_detail,
+    monitoring_profiles,
+    monitoring_profile_detail,
+    monitoring_memory,
     monitoring_tables,
     add_monitoring_user,
     toggle_flight_status,
@@ -54,21 +61,55 @@ from .monitoring_new_views import (
     monitoring_logout_new,
 )
 from .test_views import test_monitoring
+from .metrics import metrics_view
+from .cdc import booking_events_view
+from .routes import connection_search_view
+from .fares import fare_calendar_view
+from .search import flight_search_view
 from .api_autocomplete import city_suggestions
+from .async_views import (
+    flight_list_async,
+    flight_seats_async,
+    city_suggestions_async,
+    flight_list_api_async,
+    flight_detail_api_async,
+    seat_events_stream,
+)
+
+# Serve the read-heavy search paths from async views under ASGI
+if settings.ASYNC_READ_VIEWS:
+    flight_list_view = flight_list_async
+    flight_seats_view = flight_seats_async
+    city_suggestions_view = city_suggestions_async
+    flight_list_api_view = flight_list_api_async
+    flight_detail_api_view = flight_detail_api_async
+else:
+    flight_list_view = flight_list
+    flight_seats_view = flight_seats
+    city_suggestions_view = city_suggestions
+    flight_list_api_view = FlightListCreateView.as_view()
+    flight_detail_api_view = FlightDetailView.as_view()
 
 
 urlpatterns = [
     # API Endpoints
-    path("api/cities/", city_suggestions, name="city-suggestions"),
+    path("api/cities/", city_suggestions_view, name="city-suggestions"),
     path("api/seats/", SeatListCreateView.as_view(), name="seat-list-create"),
-    path("api/flights/", FlightListCreateView.as_view(), name="flight-list-create"),
-    path("api/flights/<int:pk>/", FlightDetailView.as_view(), name="flight-detail"),
+    path("api/flights/", flight_list_api_view, name="flight-list-create"),
+    path("api/flights/<int:pk>/", flight_detail_api_view, name="flight-detail"),
+    path("api/connections/", connection_search_view, name="connection-search"),
+    path("api/fare-calendar/", fare_calendar_view, name="fare-calendar"),
+    path("api/flight-search/", flight_search_view, name="flight-search"),
     path("api/bookings/", BookingListView.as_view(), name="booking-list"),
+    path("api/booking-events/", booking_events_view, name="booking-events"),
     path("api/book/", BookingCreateView.as_view(), name="booking-create"),
     path("api/bookings/<int:pk>/pay/", PaymentView.as_view(), name="booking-payment"),
     path("api/bookings/<int:pk>/cancel/", CancelView.as_view(), name="booking-cancel"),
     path("api/bookings/<int:pk>/refund/", RefundView.as_view(), name="booking-refund"),
     
+    # Prometheus scrape target
+    path("metrics", metrics_view, name="metrics"),
+    
     # Admin URLs
     path('admin-dashboard/', admin_views.admin_dashboard, name='admin-dashboard'),
     path('admin-flights/', admin_views.manage_flights, name='manage-flights'),
@@ -82,8 +123,9 @@ urlpatterns = [
     path('admin-new/logout/', admin_logout_new, name='admin-logout-new'),
     
     # GUI Endpoints
-    path("", flight_list, name="flight-list-gui"),
-    path("flights/<int:flight_id>/seats/", flight_seats, name="flight-seats-gui"),
+    path("", flight_list_view, name="flight-list-gui"),
+    path("flights/<int:flight_id>/seats/", flight_seats_view, name="flight-seats-gui"),
+    path("flights/<int:flight_id>/seats/events/", seat_events_stream, name="flight-seat-events"),
     path("book/<int:seat_id>/", book_seat, name="book-seat-gui"),
     path("my-bookings/", booking_list, name="booking-list-gui"),
     path("booking/<int:booking_id>/", booking_detail, name="booking-detail-gui"),
@@ -109,6 +151,12 @@ urlpatterns = [
     path('monitoring/flights/', monitoring_flights, name='monitoring-flights'),
     path('monitoring/bookings/', monitoring_bookings, name='monitoring-bookings'),
     path('monitoring/tables/', monitoring_tables, name='monitoring-tables'),
+    path('monitoring/slow-queries/', monitoring_slow_queries, name='monitoring-slow-queries'),
+    path('monitoring/traces/', monitoring_traces, name='monitoring-traces'),
+    path('monitoring/traces/<str:trace_id>/', monitoring_trace_detail, name='monitoring-trace-detail'),
+    path('monitoring/profiles/', monitoring_profiles, name='monitoring-profiles'),
+    path('monitoring/profiles/<str:view_name>/', monitoring_profile_detail, name='monitoring-profile-detail'),
+    path('monitoring/memory/', monitoring_memory, name='monitoring-memory'),
     path('monitoring/add-user/', add_monitoring_user, name='add-monitoring-user'),
     path('monitoring/toggle-flight/<int:flight_id>/', toggle_flight_status, name='toggle-flight-status'),
     path('monitoring/logout/', monitoring_logout, name='monitoring-logout'),
@@ -12,12 +12,12 @@ from rest_framework import status
 from .models import Booking, Flight
 from .serializers import BookingSerializer, FlightSerializer
 from .services import (
-    create_booking,
+    claim_seat,
     process_payment,
     cancel_booking,
     refund_booking,
 )
-from .exceptions import SeatNotAvailableError, PaymentError, BookingError, InvalidStateTransitionError
+from .exceptions import SeatNotAvailableError, PaymentError, BookingError, InvalidStateTransitionError, ConcurrentUpdateError
 import logging
 
 logger = logging.getLogger('bookings')
@@ -50,7 +50,7 @@ class BookingCreateView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        logger.info(f"Booking creation attempt by user {request.user.username}")
+        logger.debug("Booking creation attempt by user %s", request.user.username)
         
         # Validate required fields
         seat_id = request.data.get("seat_id")
@@ -85,8 +85,8 @@ class BookingCreateView(APIView):
         }
 
         try:
-            booking = create_booking(seat_id, passenger_data, request.user)
-            logger.info(f"Booking {booking.booking_reference} created successfully by {request.user.username}")
+            booking = claim_seat(seat_id, passenger_data, request.user)
+            logger.info("Booking %s created successfully by %s", booking.booking_reference, request.user.username)
             
             return Response({
                 "success": True,
@@ -102,6 +102,14 @@ class BookingCreateView(APIView):
                 "error": "Seat not available",
                 "message": str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
+
+        except ConcurrentUpdateError as e:
+            logger.warning("Booking by %s lost to concurrent updates: %s", request.user.username, e)
+            return Response({
+                "success": False,
+                "error": "Conflict",
+                "message": str(e)
+            }, status=status.HTTP_409_CONFLICT, headers={"Retry-After": "1"})
             
         except Exception as e:
             logger.error(f"Unexpected error in booking creation by {request.user.username}: {str(e)}")
@@ -115,7 +123,7 @@ class PaymentView(APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request, pk):
-        logger.info(f"Payment attempt for booking {pk} by user {request.user.username}")
+        logger.debug("Payment attempt for booking %s by user %s", pk, request.user.username)
         
         try:
             booking = Booking.objects.get(pk=pk)
@@ -130,7 +138,7 @@ class PaymentView(APIView):
                 }, status=status.HTTP_403_FORBIDDEN)
             
             process_payment(booking, request.user)
-            logger.info(f"Payment processed for booking {booking.booking_reference} by {request.user.username}")
+            logger.info("Payment processed for booking %s by %s", booking.booking_reference, request.user.username)
             
             return Response({
                 "success": True,
@@ -148,7 +156,16 @@ class PaymentView(APIView):
                 "message": f"No booking found with ID {pk}"
             }, status=status.HTTP_404_NOT_FOUND)
             
-        except (PaymentError, InvalidStateTransitionError) as e:
+        except ConcurrentUpdateError as e:
+            logger.warning("Payment for booking %s lost to concurrent updates: %s", pk, e)
+            return Response({
+                "success": False,
+                "error": "Conflict",
+                "message": str(e)
+            }, status=status.HTTP_409_CONFLICT, headers={"Retry-After": "1"})
+
+        except BookingError as e:
+            # Includes an expired hold and a booking deleted meanwhile
             logger.warning(f"Payment failed for booking {pk}: {str(e)}")
             return Response({
                 "success": False,
@@ -161,7 +178,7 @@ class CancelView(APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request, pk):
-        logger.info(f"Cancellation attempt for booking {pk} by user {request.user.username}")
+        logger.debug("Cancellation attempt for booking %s by user %s", pk, request.user.username)
         
         try:
             booking = Booking.objects.get(pk=pk)
@@ -176,7 +193,7 @@ class CancelView(APIView):
                 }, status=status.HTTP_403_FORBIDDEN)
             
             cancel_booking(booking, request.user)
-            logger.info(f"Booking {booking.booking_reference} cancelled by {request.user.username}")
+            logger.info("Booking %s cancelled by %s", booking.booking_reference, request.user.username)
             
             return Response({
                 "success": True,
@@ -207,7 +224,7 @@ class RefundView(APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request, pk):
-        logger.info(f"Refund attempt for booking {pk} by user {request.user.username}")
+        logger.debug("Refund attempt for booking %s by user %s", pk, request.user.username)
         
         try:
             booking = Booking.objects.get(pk=pk)
@@ -222,7 +239,7 @@ class RefundView(APIView):
                 }, status=status.HTTP_403_FORBIDDEN)
             
             refund_booking(booking, request.user)
-            logger.info(f"Refund processed for booking {booking.booking_reference} by {request.user.username}")
+            logger.info("Refund processed for booking %s by %s", booking.booking_reference, request.user.username)
             
             return Response({
                 "success": True,
@@ -9,26 +9,13 @@ from datetime import datetime
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'airline.settings')
 django.setup()
 
-from bookings.models import Booking
-from bookings.state_machine import transition
-from django.utils import timezone
+from bookings.services import expire_holds
 
 def expire_seat_holds():
     """Expire seat holds that have exceeded 10 minutes"""
-    expired_bookings = Booking.objects.filter(
-        state='SEAT_HELD',
-        seat_hold_until__lt=timezone.now()
-    )
-    
-    count = 0
-    for booking in expired_bookings:
-        try:
-            transition(booking, 'EXPIRED')
-            count += 1
-            print(f"Expired booking {booking.booking_reference}")
-        except Exception as e:
-            print(f"Error expiring booking {booking.id}: {e}")
-    
+    count, failed = expire_holds('expire_scheduler')
+    if failed:
+        print(f"Failed to expire {failed} seat holds, see the log")
     if count > 0:
         print(f"Expired {count} seat holds at {datetime.now()}")
 